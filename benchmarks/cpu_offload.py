@@ -0,0 +1,102 @@
+"""Event-loop lag and throughput of text work, inline vs in the CPU pool.
+
+Trims a batch of long documents to 25k tokens (what `process_serp_result` does
+with every page) while a heartbeat coroutine measures how late the event loop
+wakes it up. Inline, every trim blocks the loop for its full duration; with
+`deep_research_py.common.cpu` the loop stays responsive and the trims run on
+all cores. Nothing leaves the machine, but the tiktoken encoding must be
+available (cached) locally.
+
+    python benchmarks/cpu_offload.py
+    python benchmarks/cpu_offload.py --docs 32 --doc-kb 600 --workers 4
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from typing import Awaitable, Callable, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deep_research_py.ai.providers import trim_prompt  # noqa: E402
+from deep_research_py.common import cpu  # noqa: E402
+from deep_research_py.utils import set_service  # noqa: E402
+
+HEARTBEAT = 0.005
+
+
+def document(kb: int) -> str:
+    paragraphs = []
+    size = 0
+    while size < kb * 1024:
+        words = " ".join(uuid.uuid4().hex[: 4 + len(paragraphs) % 7] for _ in range(60))
+        paragraphs.append(words + ".")
+        size += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+
+async def heartbeat(lags: List[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(time.perf_counter() - start - HEARTBEAT)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def measure(name: str, trim: Callable[[str], Awaitable[str]], docs: List[str]) -> None:
+    lags: List[float] = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(HEARTBEAT * 2)
+    start = time.perf_counter()
+    await asyncio.gather(*(trim(doc) for doc in docs))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    print(
+        f"{name:<8} {elapsed:7.2f} s  {len(docs) / elapsed:6.1f} docs/s  "
+        f"loop lag p50 {percentile(lags, 0.5) * 1000:7.1f} ms  "
+        f"p99 {percentile(lags, 0.99) * 1000:7.1f} ms  max {max(lags) * 1000:7.1f} ms"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    docs = [document(args.doc_kb) for _ in range(args.docs)]
+    print(f"{args.docs} documents of {args.doc_kb} kB, {cpu.worker_count()} workers")
+
+    async def inline(doc: str) -> str:
+        return trim_prompt(doc, args.tokens)
+
+    async def offloaded(doc: str) -> str:
+        return await cpu.trim(doc, args.tokens)
+
+    # Starts the workers and loads their tokenizers before timing
+    await asyncio.gather(*(cpu.count_tokens(docs[0]) for _ in range(cpu.worker_count())))
+    await measure("inline", inline, docs)
+    await measure("pool", offloaded, docs)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=16)
+    parser.add_argument("--doc-kb", type=int, default=400)
+    parser.add_argument("--tokens", type=int, default=25_000, help="Trim target per document.")
+    parser.add_argument("--workers", type=int, default=0, help="CPU_WORKERS (default: per core).")
+    args = parser.parse_args()
+    if args.workers:
+        os.environ["CPU_WORKERS"] = str(args.workers)
+    set_service("openai")
+    asyncio.run(run(args))
+    cpu.shutdown_process_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Import-time budget check.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters and fails
+when a module takes longer than its budget to import, or when it pulls in a
+heavy optional dependency that should only be imported on first use.
+
+    python benchmarks/import_time.py            # check all budgets
+    python benchmarks/import_time.py --repeat 5 # take the best of 5 runs
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ["streamlit", "firecrawl", "openai", "ollama", "tiktoken", "httpx", "requests"]
+
+
+class Budget(NamedTuple):
+    module: str
+    max_ms: float
+    forbidden: List[str]
+
+
+BUDGETS = [
+    Budget("deep_research_py.deep_research", 400, HEAVY + ["typer", "rich"]),
+    Budget("deep_research_py.server", 400, HEAVY + ["typer", "rich"]),
+    Budget("deep_research_py.run", 800, HEAVY),
+]
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    # Make sure no API key or .env influences what gets imported
+    env.pop("FIRECRAWL_API_KEY", None)
+    return env
+
+
+def import_time_ms(module: str) -> float:
+    """Cumulative import time of `module` in a fresh interpreter, in milliseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=_env(),
+        check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def imported_modules(module: str) -> List[str]:
+    code = f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=_env(), check=True
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def check(budget: Budget, repeat: int) -> List[str]:
+    errors = []
+    best = min(import_time_ms(budget.module) for _ in range(repeat))
+    status = "ok" if best <= budget.max_ms else "OVER BUDGET"
+    print(f"{budget.module:<40} {best:8.1f} ms (budget {budget.max_ms:.0f} ms) {status}")
+    if best > budget.max_ms:
+        errors.append(f"{budget.module} took {best:.1f} ms, budget is {budget.max_ms:.0f} ms")
+
+    loaded = set(imported_modules(budget.module))
+    for name in budget.forbidden:
+        if name in loaded:
+            errors.append(f"{budget.module} imports {name} at import time")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per module; the best counts.")
+    args = parser.parse_args()
+
+    errors = []
+    for budget in BUDGETS:
+        errors.extend(check(budget, args.repeat))
+    for error in errors:
+        print(f"FAIL: {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
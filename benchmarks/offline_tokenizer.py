@@ -0,0 +1,104 @@
+"""A small, deterministic BPE tokenizer for the offline benchmarks.
+
+The real `cl100k_base` ranks are downloaded on first use, so a machine without
+access to OpenAI's blob storage cannot count tokens at all. The benchmarks use
+this encoding instead. It splits text with cl100k's pattern and runs on tiktoken's
+own BPE, but its 4k merges come from `data/bench_bpe.tiktoken`, which ships in
+the repo. Token counts are lower than cl100k's; the code paths are the same.
+
+    python benchmarks/offline_tokenizer.py      # learn the merges again from the tree
+
+`install()` makes `get_encoder`, and so `get_token_count` and `trim_prompt`,
+return it. CPU pool workers forked afterwards inherit it.
+"""
+
+import base64
+import functools
+import glob
+import os
+import sys
+from collections import Counter
+from typing import Dict, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOCAB_PATH = os.path.join(ROOT, "benchmarks", "data", "bench_bpe.tiktoken")
+# cl100k_base's pre-tokenizer
+PAT_STR = (
+    r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+"""
+    r"""|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+)
+MERGES = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def load():
+    """The encoding, built from the shipped ranks once per process."""
+    import tiktoken
+    from tiktoken.load import load_tiktoken_bpe
+
+    return tiktoken.Encoding(
+        name="bench_bpe",
+        pat_str=PAT_STR,
+        mergeable_ranks=load_tiktoken_bpe(VOCAB_PATH),
+        special_tokens={},
+    )
+
+
+def install() -> None:
+    """Makes every `get_encoder(name)` call return this encoding."""
+    sys.path.insert(0, ROOT)
+    from deep_research_py.ai import providers
+
+    providers.get_encoder = lambda name="cl100k_base": load()
+
+
+def train(text: str, merges: int) -> Dict[bytes, int]:
+    """Byte-level BPE: the 256 bytes, then the most frequent adjacent pair, `merges` times."""
+    import regex
+
+    words: Counter = Counter(
+        tuple(bytes([b]) for b in piece.encode("utf-8")) for piece in regex.findall(PAT_STR, text)
+    )
+    ranks = {bytes([b]): b for b in range(256)}
+    for _ in range(merges):
+        pairs: Counter = Counter()
+        for word, count in words.items():
+            for pair in zip(word, word[1:]):
+                pairs[pair] += count
+        if not pairs:
+            break
+        # Ties go to the smaller pair, so the result does not depend on dict order
+        best = min(pairs, key=lambda pair: (-pairs[pair], pair))
+        merged = best[0] + best[1]
+        ranks.setdefault(merged, len(ranks))
+        words = Counter({_merge(word, best, merged): count for word, count in words.items()})
+    return ranks
+
+
+def _merge(word: Tuple[bytes, ...], pair: Tuple[bytes, bytes], merged: bytes) -> Tuple[bytes, ...]:
+    out, i = [], 0
+    while i < len(word):
+        if i + 1 < len(word) and (word[i], word[i + 1]) == pair:
+            out.append(merged)
+            i += 2
+        else:
+            out.append(word[i])
+            i += 1
+    return tuple(out)
+
+
+def main() -> None:
+    # The package's own prompts, code and docs: English, Chinese, markdown and JSON
+    paths = sorted(glob.glob(os.path.join(ROOT, "deep_research_py", "**", "*.py"), recursive=True))
+    paths.append(os.path.join(ROOT, "README.md"))
+    text = "\n".join(open(path, encoding="utf-8").read() for path in paths)
+    ranks = train(text, MERGES)
+    os.makedirs(os.path.dirname(VOCAB_PATH), exist_ok=True)
+    with open(VOCAB_PATH, "w", encoding="ascii") as f:
+        for token, rank in sorted(ranks.items(), key=lambda item: item[1]):
+            f.write(f"{base64.b64encode(token).decode()} {rank}\n")
+    print(f"wrote {len(ranks)} ranks from {len(text)} characters to {VOCAB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
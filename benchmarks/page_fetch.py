@@ -0,0 +1,141 @@
+"""Page fetcher against a local HTTP fixture server.
+
+Starts a few local HTTP servers (each one a separate "host" for the per-host
+connection limit) serving HTML pages with a configurable delay, plus a
+robots.txt, a PDF, an oversized page and a page slower than the fetch timeout.
+It then fetches the same result list one URL at a time and concurrently with
+`fill_missing_contents`, and reports coverage and wall time. Nothing leaves the
+machine.
+
+    python benchmarks/page_fetch.py
+    python benchmarks/page_fetch.py --pages 60 --hosts 6 --delay 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deep_research_py.fetcher import PageFetcher, fill_missing_contents  # noqa: E402
+
+PARAGRAPH = "<p>Battery storage capacity grew 45% in 2024, led by lithium iron phosphate cells.</p>"
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    delay = 0.2
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        params = parse_qs(parts.query)
+        if parts.path == "/robots.txt":
+            self._send(200, "text/plain", b"User-agent: *\nDisallow: /private/\n")
+        elif parts.path.startswith("/page/") or parts.path.startswith("/private/"):
+            time.sleep(float(params.get("delay", [self.delay])[0]))
+            kb = int(params.get("kb", ["20"])[0])
+            body = (
+                f"<html><head><title>{parts.path}</title><script>var x = 1;</script></head>"
+                f"<body><nav>Home | About</nav><h1>Page {parts.path}</h1>"
+                + PARAGRAPH * (kb * 1024 // len(PARAGRAPH))
+                + "<footer>Copyright</footer></body></html>"
+            )
+            self._send(200, "text/html; charset=utf-8", body.encode("utf-8"))
+        elif parts.path == "/file.pdf":
+            self._send(200, "application/pdf", b"%PDF-1.4 " + b"0" * 10_000)
+        elif parts.path == "/big":
+            self._send(200, "text/html", b"<html><body>" + PARAGRAPH.encode() * 100_000 + b"</body></html>")
+        elif parts.path == "/slow":
+            time.sleep(30)
+            self._send(200, "text/html", b"<p>late</p>")
+        else:
+            self._send(404, "text/plain", b"not found")
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The fetcher hangs up on oversized and slow pages on purpose
+        pass
+
+
+def start_servers(count: int) -> List[FixtureServer]:
+    servers = []
+    for _ in range(count):
+        server = FixtureServer(("127.0.0.1", 0), FixtureHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+def result_list(servers: List[FixtureServer], pages: int) -> List[dict]:
+    bases = [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    urls = [f"{bases[i % len(bases)]}/page/{i}" for i in range(pages)]
+    urls += [
+        f"{bases[0]}/private/secret",
+        f"{bases[0]}/file.pdf",
+        f"{bases[0]}/big",
+        f"{bases[0]}/slow",
+        f"{bases[0]}/missing",
+    ]
+    return [{"url": url, "title": "", "snippet": "", "content": ""} for url in urls]
+
+
+async def run(args: argparse.Namespace) -> None:
+    servers = start_servers(args.hosts)
+    FixtureHandler.delay = args.delay
+
+    fetcher = PageFetcher(per_host=args.per_host, timeout=args.timeout)
+    results = result_list(servers, args.pages)
+    start = time.perf_counter()
+    serial = [await fetcher.fetch(item["url"]) for item in results]
+    serial_time = time.perf_counter() - start
+    await fetcher.close()
+
+    fetcher = PageFetcher(per_host=args.per_host, timeout=args.timeout)
+    results = result_list(servers, args.pages)
+    start = time.perf_counter()
+    await fill_missing_contents(results, fetcher)
+    concurrent_time = time.perf_counter() - start
+    await fetcher.close()
+
+    filled = [item for item in results if item["content"]]
+    print(f"urls:             {len(results)} ({args.pages} pages on {args.hosts} hosts)")
+    print(f"serial:           {sum(1 for page in serial if page)} filled in {serial_time:.2f} s")
+    print(f"concurrent:       {len(filled)} filled in {concurrent_time:.2f} s")
+    print(f"skipped/failed:   {fetcher.stats()}")
+    sample = filled[0]["content"] if filled else ""
+    print(f"sample markdown:  {sample[:120]!r}")
+    for server in servers:
+        server.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--hosts", type=int, default=5)
+    parser.add_argument("--delay", type=float, default=0.2, help="Seconds each page takes.")
+    parser.add_argument("--per-host", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
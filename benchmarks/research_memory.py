@@ -0,0 +1,161 @@
+"""Peak memory of a full research tree, run offline.
+
+Runs `deep_research` against a fake search engine that returns large page bodies
+and a fake OpenAI client that answers instantly, then reports the peak RSS of the
+process. Tokens are counted with the shipped benchmark encoding (see
+`offline_tokenizer.py`), so nothing leaves the machine. A run in which no branch
+produced learnings fails instead of reporting a figure for work that never ran.
+
+    python benchmarks/research_memory.py                      # breadth 10, depth 5
+    python benchmarks/research_memory.py --page-kb 500 --tracemalloc
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from openai.types.chat import ChatCompletion  # noqa: E402
+
+from deep_research_py.content_store import ContentStore, set_content_store  # noqa: E402
+from deep_research_py.deep_research import deep_research  # noqa: E402
+from deep_research_py.novelty import NoveltyTracker  # noqa: E402
+from deep_research_py.research_store import ResearchStore  # noqa: E402
+from deep_research_py.search import SearchProvider, SearchRouter, set_search_router  # noqa: E402
+from deep_research_py.utils import set_service  # noqa: E402
+
+import offline_tokenizer  # noqa: E402
+
+_counter = itertools.count()
+
+
+def _words(n: int) -> str:
+    # Random words, so no query or learning looks like a duplicate of another
+    return " ".join(uuid.uuid4().hex[:10] for _ in range(n))
+
+
+class FakeSearch(SearchProvider):
+    name = "FAKE"
+
+    def __init__(self, page_kb: int, results: int):
+        self.page_kb = page_kb
+        self.results = results
+        self.searches = 0
+
+    async def search(self, query: str, limit: int):
+        self.searches += 1
+        body = ("lorem ipsum " * 86)[: 1024] * self.page_kb
+        return [
+            {
+                "url": f"https://example.com/{self.searches}/{i}",
+                "title": query,
+                "content": body + str(i),
+            }
+            for i in range(min(limit, self.results))
+        ]
+
+
+class _Completions:
+    def create(self, model, messages, response_format=None):
+        prompt = messages[-1]["content"]
+        if "SERP queries" in prompt:
+            n = int(prompt.split("containing ")[1].split()[0])
+            data = {"queries": [{"query": _words(4), "research_goal": _words(3)} for _ in range(n)]}
+        else:
+            data = {"learnings": [_words(4) for _ in range(3)], "followUpQuestions": [_words(3)]}
+        return ChatCompletion.model_validate(
+            {
+                "id": f"fake-{next(_counter)}",
+                "object": "chat.completion",
+                "created": 0,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": json.dumps(data)},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 1,
+                    "completion_tokens": 1,
+                    "total_tokens": 2,
+                    "completion_tokens_details": {"reasoning_tokens": 0},
+                },
+            }
+        )
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = type("Chat", (), {"completions": _Completions()})()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def run(args: argparse.Namespace) -> None:
+    set_service("openai")
+    offline_tokenizer.install()
+    engine = FakeSearch(args.page_kb, args.results)
+    set_search_router(SearchRouter([engine]))
+    content_dir = args.content_dir or tempfile.mkdtemp(prefix="content-")
+    set_content_store(ContentStore(content_dir))
+    store = ResearchStore()
+    start_rss = peak_rss_mb()
+    start = time.perf_counter()
+    result = await deep_research(
+        query="benchmark topic",
+        breadth=args.breadth,
+        depth=args.depth,
+        concurrency=args.concurrency,
+        client=FakeClient(),
+        model="fake",
+        novelty=NoveltyTracker(threshold=0.0),
+        store=store,
+    )
+    elapsed = time.perf_counter() - start
+    if not result["learnings"]:
+        raise SystemExit("no branch produced learnings; see the errors above")
+    print(f"breadth={args.breadth} depth={args.depth} page={args.page_kb} KB x {args.results}")
+    print(f"searches:       {engine.searches}")
+    print(f"learnings:      {len(result['learnings'])}")
+    print(f"sources:        {len(result['visited_urls'])}")
+    print(f"time:           {elapsed:.2f} s")
+    print(f"peak RSS:       {peak_rss_mb():.1f} MB (at start {start_rss:.1f} MB)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--breadth", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--page-kb", type=int, default=200, help="Size of each page body.")
+    parser.add_argument("--results", type=int, default=5, help="Results per search.")
+    parser.add_argument("--content-dir", help="Content store directory; a temporary one by default.")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report Python heap peak.")
+    args = parser.parse_args()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    asyncio.run(run(args))
+    if args.tracemalloc:
+        _, peak = tracemalloc.get_traced_memory()
+        print(f"heap peak:      {peak / (1024 * 1024):.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
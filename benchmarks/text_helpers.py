@@ -0,0 +1,310 @@
+"""Micro-benchmarks of the text helpers that run on every search result.
+
+Times `RecursiveCharacterTextSplitter.split_text` and `merge_splits`,
+`trim_prompt`, `get_token_count`, `get_first_level_section_names` and the
+JSON fallback parsing (`extract_json`) on generated corpora: long English and
+Chinese pages, markdown, text without any separator, and model output with
+reasoning blocks and fenced JSON. The corpora are generated from a fixed seed,
+so runs are comparable. Tokens are counted with the shipped benchmark encoding
+(see `offline_tokenizer.py`) rather than the downloaded `cl100k_base`, so every
+case runs and nothing leaves the machine.
+
+    python benchmarks/text_helpers.py                       # print timings
+    python benchmarks/text_helpers.py --save benchmarks/baselines/text_helpers.json
+    python benchmarks/text_helpers.py --compare benchmarks/baselines/text_helpers.json --threshold 0.25
+    python benchmarks/text_helpers.py --filter split --quick
+
+With `--compare`, the exit status is 1 when any case is more than
+`--threshold` (a fraction) slower than its baseline. Cases are compared by their
+fastest round, which is far less noisy than the median on a busy machine. Each
+run also times a fixed calibration workload, and baseline timings are scaled by
+how much faster or slower it ran, so a machine that is busy or throttled as a
+whole does not look like a regression. A case over the threshold is timed again,
+up to `--retries` times, and only fails if it stays slow. Cases missing from
+the baseline are listed; `--strict` fails on them too, e.g. when a case was added
+after the baseline was recorded.
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, NamedTuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from deep_research_py.ai.providers import get_token_count, trim_prompt  # noqa: E402
+from deep_research_py.ai.reasoning import extract_json  # noqa: E402
+from deep_research_py.ai.text_splitter import RecursiveCharacterTextSplitter  # noqa: E402
+from deep_research_py.gen_outline_acticle import get_first_level_section_names  # noqa: E402
+from deep_research_py.utils import set_service  # noqa: E402
+
+import offline_tokenizer  # noqa: E402
+
+SEED = 20240601
+WORDS = (
+    "battery storage capacity grew lithium iron phosphate cells grid scale deployment "
+    "policy market price per kilowatt hour manufacturer supply chain recycling demand "
+    "forecast analysts report quarter revenue efficiency density cycle life safety"
+).split()
+HANZI = "电池储能容量增长磷酸铁锂电芯电网规模部署政策市场价格每千瓦时制造商供应链回收需求预测分析师报告季度收入效率密度循环寿命安全"
+
+
+class Case(NamedTuple):
+    name: str
+    fn: Callable[[], object]
+
+
+def english_page(kb: int, rng: random.Random) -> str:
+    paragraphs, size = [], 0
+    while size < kb * 1024:
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))).capitalize()
+            + f", up {rng.randint(1, 99)}% in {rng.randint(2000, 2025)}."
+            for _ in range(rng.randint(2, 6))
+        ]
+        paragraphs.append(" ".join(sentences))
+        size += len(paragraphs[-1]) + 2
+    return "\n\n".join(paragraphs)
+
+
+def chinese_page(kb: int, rng: random.Random) -> str:
+    # Chinese punctuation is not among the splitter's separators, and there are no spaces
+    paragraphs, size = [], 0
+    while size < kb * 1024 // 3:
+        sentences = [
+            "".join(rng.choice(HANZI) for _ in range(rng.randint(15, 40))) + "。"
+            for _ in range(rng.randint(2, 8))
+        ]
+        paragraphs.append("".join(sentences))
+        size += len(paragraphs[-1]) + 1
+    return "\n".join(paragraphs)
+
+
+def markdown_page(kb: int, rng: random.Random) -> str:
+    parts, size, section = [], 0, 0
+    while size < kb * 1024:
+        section += 1
+        block = [f"## Section {section}", english_page(1, rng)]
+        block += [f"- {rng.choice(WORDS)} {rng.choice(WORDS)}: {rng.randint(1, 999)}" for _ in range(5)]
+        block += ["| metric | value |", "| --- | --- |"]
+        block += [f"| {rng.choice(WORDS)} | {rng.random():.3f} |" for _ in range(4)]
+        block += ["```python", "x = [i * i for i in range(100)]", "```"]
+        parts.append("\n".join(block))
+        size += len(parts[-1]) + 2
+    return "\n\n".join(parts)
+
+
+def no_separator_text(kb: int, rng: random.Random) -> str:
+    # Minified data or base64: the splitter falls back to single characters
+    return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(kb * 1024))
+
+
+def outline(sections: int, rng: random.Random) -> str:
+    lines = []
+    for i in range(sections):
+        lines.append(f"# {i + 1}. {' '.join(rng.choice(WORDS) for _ in range(4))}")
+        lines += [f"- {i + 1}.{j + 1} {' '.join(rng.choice(WORDS) for _ in range(6))}" for j in range(5)]
+    return "\n".join(lines)
+
+
+def model_outputs(rng: random.Random) -> Dict[str, str]:
+    payload = json.dumps(
+        {
+            "learnings": [english_page(1, rng)[:400] for _ in range(5)],
+            "followUpQuestions": [english_page(1, rng)[:120] for _ in range(3)],
+        },
+        ensure_ascii=False,
+    )
+    thinking = english_page(40, rng)
+    return {
+        "plain": payload,
+        "fenced": f"Here are the results:\n```json\n{payload}\n```\nLet me know.",
+        "think_fenced": f"<think>\n{thinking}\n</think>\n```json\n{payload}\n```",
+        "braces": f"Sure. Based on {{the sources}} I found:\n{payload}\nThat is all.",
+    }
+
+
+def build_cases() -> List[Case]:
+    rng = random.Random(SEED)
+    corpora = {
+        "english_200k": english_page(200, rng),
+        "chinese_200k": chinese_page(200, rng),
+        "markdown_200k": markdown_page(200, rng),
+        "no_separator_50k": no_separator_text(50, rng),
+    }
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    words = corpora["english_200k"].split(" ")
+    outline_text = outline(40, rng)
+
+    cases: List[Case] = []
+    for name, text in corpora.items():
+        cases.append(Case(f"split_text[{name}]", lambda text=text: splitter.split_text(text)))
+    cases.append(Case("merge_splits[english_words]", lambda: splitter.merge_splits(words, " ")))
+    for name, text in corpora.items():
+        cases.append(Case(f"get_token_count[{name}]", lambda text=text: get_token_count(text)))
+    for name, text in corpora.items():
+        # Pages are trimmed to 25k tokens before extraction; trim harder to make it work
+        cases.append(Case(f"trim_prompt[{name}]", lambda text=text: trim_prompt(text, 5_000)))
+    cases.append(
+        Case("get_first_level_section_names[40x5]", lambda: get_first_level_section_names(outline_text))
+    )
+    for name, text in model_outputs(rng).items():
+        cases.append(Case(f"extract_json[{name}]", lambda text=text: extract_json(text)))
+    return cases
+
+
+def calibration_workload() -> object:
+    """Fixed mix of string, regex and JSON work, the kind the cases do."""
+    rng = random.Random(SEED)
+    text = " ".join(rng.choice(WORDS) for _ in range(2000))
+    return (
+        len(re.findall(r"\b\w+ing\b", text)),
+        json.loads(json.dumps(text.split(" "))),
+        sorted(set(text.split(" "))),
+    )
+
+
+def time_case(fn: Callable[[], object], min_time: float, repeat: int) -> List[float]:
+    """Seconds per call in each of `repeat` rounds of at least `min_time` seconds."""
+    fn()  # warm-up, also fills caches such as compiled regexes
+    start = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - start, 1e-7)
+    number = max(1, int(min_time / once))
+    rounds = []
+    # Like timeit: garbage left by the previous case is not collected on this one's clock
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            rounds.append((time.perf_counter() - start) / number)
+    finally:
+        gc.enable()
+    return rounds
+
+
+def environment() -> Dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(
+    results: Dict[str, Dict[str, float]],
+    calibration: float,
+    cases: Dict[str, Case],
+    baseline_path: str,
+    threshold: float,
+    retries: int,
+    min_time: float,
+    repeat: int,
+    strict: bool,
+) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("environment") != environment():
+        print(f"note: baseline was recorded on {baseline.get('environment')}, this is {environment()}")
+    # Baseline timings are scaled to this machine's current speed
+    scale = calibration / baseline["calibration"] if baseline.get("calibration") else 1.0
+    print(f"\ncalibration: {calibration * 1000:.3f}ms, baseline timings scaled by {scale:.2f}")
+    regressions = 0
+    print(f"{'case':<40} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"{name:<40} {'-':>10} {result['min'] * 1000:>8.3f}ms {'new':>8}")
+            continue
+        expected = before["min"] * scale
+        now = result["min"]
+        for _ in range(retries):
+            if now / expected - 1 <= threshold:
+                break
+            # Slow rounds come from other load on the machine; a real regression stays slow
+            now = min(now, min(time_case(cases[name].fn, min_time * 2, repeat)))
+        change = now / expected - 1
+        flag = ""
+        if change > threshold:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{name:<40} {expected * 1000:>8.3f}ms {now * 1000:>8.3f}ms {change:>+7.1%}{flag}")
+    missing = [name for name in results if name not in baseline["results"]]
+    if missing:
+        print(f"\nnot in the baseline, record it again with --save: {', '.join(missing)}")
+    if regressions:
+        print(f"\n{regressions} case(s) more than {threshold:.0%} slower than the baseline")
+    return 1 if regressions or (strict and missing) else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this.")
+    parser.add_argument("--quick", action="store_true", help="Shorter rounds, for a smoke run.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="Write the results as a baseline JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown, e.g. 0.25.")
+    parser.add_argument(
+        "--retries", type=int, default=2, help="Times a case over the threshold is timed again."
+    )
+    parser.add_argument(
+        "--strict", action="store_true", help="Also fail on cases missing from the baseline."
+    )
+    args = parser.parse_args()
+
+    set_service("openai")
+    offline_tokenizer.install()
+    min_time = 0.05 if args.quick else 0.2
+    repeat = 3 if args.quick else args.repeat
+
+    cases = {case.name: case for case in build_cases() if args.filter in case.name}
+    results: Dict[str, Dict[str, float]] = {}
+    # Timed between the cases; the fastest round is the machine's speed
+    calibration = min(time_case(calibration_workload, min_time, repeat))
+    print(f"{'case':<40} {'median':>10} {'min':>10}")
+    for case in cases.values():
+        rounds = time_case(case.fn, min_time, repeat)
+        results[case.name] = {"median": statistics.median(rounds), "min": min(rounds)}
+        print(f"{case.name:<40} {results[case.name]['median'] * 1000:>8.3f}ms {min(rounds) * 1000:>8.3f}ms")
+        calibration = min(calibration, min(time_case(calibration_workload, min_time / 2, 3)))
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(
+                {"environment": environment(), "calibration": calibration, "results": results},
+                f,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"saved {len(results)} results to {args.save}")
+    if args.compare:
+        return compare(
+            results,
+            calibration,
+            cases,
+            args.compare,
+            args.threshold,
+            args.retries,
+            min_time,
+            repeat,
+            args.strict,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import asyncio
+import json
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import openai
+from openai.types.chat import ChatCompletion
+
+from deep_research_py.common.logging import log_error, log_event
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+class BatchBackend(ABC):
+    """Submits OpenAI Batch-API-style JSONL files and reports when they finish."""
+
+    @abstractmethod
+    def submit(self, input_path: str) -> str:
+        """Submits the JSONL file at `input_path` and returns a batch id."""
+        pass
+
+    @abstractmethod
+    def poll(self, batch_id: str) -> Optional[str]:
+        """Returns the path of the output JSONL once the batch is done, else None."""
+        pass
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Runs batches through the OpenAI Batch API."""
+
+    def __init__(self, client: openai.OpenAI, work_dir: str = "batches"):
+        self.client = client
+        self.work_dir = work_dir
+        os.makedirs(work_dir, exist_ok=True)
+
+    def submit(self, input_path: str) -> str:
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def poll(self, batch_id: str) -> Optional[str]:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ("failed", "expired", "cancelled"):
+            raise RuntimeError(f"Batch {batch_id} ended with status {batch.status}")
+        if batch.status != "completed":
+            return None
+
+        output_path = os.path.join(self.work_dir, f"{batch_id}.output.jsonl")
+        with open(output_path, "w", encoding="utf-8") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(self.client.files.content(file_id).text)
+        return output_path
+
+
+class LocalFileBatchBackend(BatchBackend):
+    """File-based stand-in for the Batch API.
+
+    Submitted files are copied to `<directory>/<batch_id>.input.jsonl`. The batch is
+    done once `<directory>/<batch_id>.output.jsonl` exists; if a `handler` is given it
+    is called with each request body and its return value is written as the response
+    body right away, otherwise the output file is expected to be produced externally.
+    """
+
+    def __init__(
+        self, directory: str, handler: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+    ):
+        self.directory = directory
+        self.handler = handler
+        os.makedirs(directory, exist_ok=True)
+
+    def input_path(self, batch_id: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.input.jsonl")
+
+    def output_path(self, batch_id: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}.output.jsonl")
+
+    def submit(self, input_path: str) -> str:
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        shutil.copyfile(input_path, self.input_path(batch_id))
+        if self.handler is not None:
+            self._run_handler(batch_id)
+        return batch_id
+
+    def poll(self, batch_id: str) -> Optional[str]:
+        output_path = self.output_path(batch_id)
+        return output_path if os.path.exists(output_path) else None
+
+    def _run_handler(self, batch_id: str) -> None:
+        lines = []
+        with open(self.input_path(batch_id), encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                try:
+                    response = {"status_code": 200, "body": self.handler(request["body"])}
+                    error = None
+                except Exception as e:
+                    response = None
+                    error = {"code": "handler_error", "message": str(e)}
+                lines.append(
+                    {
+                        "id": f"{batch_id}_{request['custom_id']}",
+                        "custom_id": request["custom_id"],
+                        "response": response,
+                        "error": error,
+                    }
+                )
+        # Write to a temporary name first so poll() never sees a partial file
+        tmp_path = self.output_path(batch_id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.output_path(batch_id))
+
+
+class BatchCollector:
+    """Collects chat completion calls into batches and resolves them asynchronously.
+
+    Each call to `submit` parks the caller on a future. Pending requests are written to
+    a JSONL file and handed to the backend once `max_batch_size` requests have queued
+    up or `flush_interval` seconds have passed since the first one, whichever comes
+    first. The backend is then polled every `poll_interval` seconds and the waiting
+    coroutines are woken with their `ChatCompletion` once the output arrives.
+    """
+
+    def __init__(
+        self,
+        backend: BatchBackend,
+        work_dir: str = "batches",
+        max_batch_size: int = 500,
+        flush_interval: float = 30.0,
+        poll_interval: float = 60.0,
+    ):
+        self.backend = backend
+        self.work_dir = work_dir
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        os.makedirs(work_dir, exist_ok=True)
+
+    async def submit(
+        self, model: str, messages: List[Dict[str, str]], format=None, **options: Any
+    ) -> ChatCompletion:
+        body: Dict[str, Any] = {"model": model, "messages": messages, **options}
+        if format is not None:
+            body["response_format"] = format
+        request = {
+            "custom_id": uuid.uuid4().hex,
+            "method": "POST",
+            "url": CHAT_COMPLETIONS_URL,
+            "body": body,
+        }
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((request, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._schedule_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(self.flush_interval, self._schedule_flush)
+
+        return await future
+
+    def _schedule_flush(self) -> None:
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run_batch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self) -> None:
+        """Submits whatever is pending right away and waits for all batches to finish."""
+        self._schedule_flush()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def _run_batch(self, pending: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        futures = {request["custom_id"]: future for request, future in pending}
+        input_path = os.path.join(self.work_dir, f"{uuid.uuid4().hex}.input.jsonl")
+        try:
+            with open(input_path, "w", encoding="utf-8") as f:
+                for request, _ in pending:
+                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+            batch_id = await loop.run_in_executor(None, self.backend.submit, input_path)
+            log_event("Submitted batch %s with %s requests", batch_id, len(pending))
+
+            output_path = await loop.run_in_executor(None, self.backend.poll, batch_id)
+            while output_path is None:
+                await asyncio.sleep(self.poll_interval)
+                output_path = await loop.run_in_executor(None, self.backend.poll, batch_id)
+
+            with open(output_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._resolve(futures, json.loads(line))
+            log_event("Batch %s finished", batch_id)
+        except Exception as e:
+            log_error("Batch with %s requests failed: %s", len(pending), e)
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for custom_id, future in futures.items():
+            if not future.done():
+                future.set_exception(RuntimeError(f"No batch result for request {custom_id}"))
+
+    @staticmethod
+    def _resolve(futures: Dict[str, asyncio.Future], line: Dict[str, Any]) -> None:
+        future = futures.get(line.get("custom_id"))
+        if future is None or future.done():
+            return
+        response = line.get("response") or {}
+        if line.get("error") or response.get("status_code", 200) != 200:
+            future.set_exception(
+                RuntimeError(f"Batch request {line['custom_id']} failed: {line.get('error') or response}")
+            )
+            return
+        future.set_result(ChatCompletion.model_validate(response["body"]))
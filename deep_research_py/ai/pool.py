@@ -0,0 +1,316 @@
+"""Load balancing of completion calls over several OpenAI-compatible endpoints.
+
+A `ClientPool` holds one client per endpoint. Each call goes to the healthy
+endpoint with the fewest in-flight requests relative to its weight. Endpoints
+that fail several times in a row, or whose latency spikes well above the other
+endpoints', are ejected for a while; when that time is up the next call is sent
+as a probe, and the endpoint is back in rotation once a probe succeeds. Failed
+calls are retried on another endpoint.
+
+An endpoint's own `model` (e.g. an `ep-...` id) stands in for the pool's logical
+model, the run's model. Calls for any other model, e.g. a stage routed to a fast
+model, are sent with that model unchanged.
+"""
+
+import asyncio
+import collections
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from deep_research_py.common.logging import log_event, log_warning
+
+HEALTHY = "healthy"
+EJECTED = "ejected"
+PROBING = "probing"
+
+
+@dataclass
+class Endpoint:
+    name: str
+    client: Any
+    weight: float = 1.0
+    # Model id to use on this endpoint for the pool's logical model, e.g. an `ep-...` id
+    model: Optional[str] = None
+    # Most requests this endpoint may serve at once; None for no limit
+    max_concurrency: Optional[int] = None
+
+    state: str = field(default=HEALTHY, init=False)
+    in_flight: int = field(default=0, init=False)
+    requests: int = field(default=0, init=False)
+    errors: int = field(default=0, init=False)
+    consecutive_errors: int = field(default=0, init=False)
+    ejections: int = field(default=0, init=False)
+    ejected_until: float = field(default=0.0, init=False)
+    eject_seconds: float = field(default=0.0, init=False)
+    latencies: Deque[float] = field(default_factory=lambda: collections.deque(maxlen=50), init=False)
+
+    def median_latency(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def has_capacity(self) -> bool:
+        return self.max_concurrency is None or self.in_flight < self.max_concurrency
+
+    def load(self) -> float:
+        return (self.in_flight + 1) / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "weight": self.weight,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "ejections": self.ejections,
+            "median_latency": self.median_latency(),
+        }
+
+
+class ClientPool:
+    """Spreads completion calls over several endpoints.
+
+    Args:
+        endpoints: The endpoints to balance over; their names must be unique and
+            their weights positive.
+        model: Logical model of the pool; calls for it use each endpoint's own
+            `model`. Without one, every call uses the endpoint's model.
+        max_consecutive_errors: Errors in a row after which an endpoint is ejected.
+        latency_factor: An endpoint is ejected when its median latency exceeds this
+            multiple of the fastest other endpoint's median.
+        min_samples: Latency samples an endpoint needs before it can be ejected for latency.
+        eject_seconds: First ejection period; it doubles each time a probe fails.
+        max_eject_seconds: Upper bound of the ejection period.
+        max_attempts: Endpoints tried for a single call before its error is raised.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        model: Optional[str] = None,
+        max_consecutive_errors: int = 3,
+        latency_factor: float = 3.0,
+        min_samples: int = 10,
+        eject_seconds: float = 30.0,
+        max_eject_seconds: float = 300.0,
+        max_attempts: int = 3,
+    ):
+        if not endpoints:
+            raise ValueError("ClientPool needs at least one endpoint")
+        names = [endpoint.name for endpoint in endpoints]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Endpoint names must be unique: {', '.join(duplicates)}")
+        for endpoint in endpoints:
+            # A weight of 0 divides by zero in `load`, a negative one inverts the balancing
+            if not endpoint.weight > 0:
+                raise ValueError(
+                    f"Endpoint {endpoint.name} needs a positive weight, not {endpoint.weight}"
+                )
+        self.endpoints = endpoints
+        self.model = model
+        self.max_consecutive_errors = max_consecutive_errors
+        self.latency_factor = latency_factor
+        self.min_samples = min_samples
+        self.eject_seconds = eject_seconds
+        self.max_eject_seconds = max_eject_seconds
+        self.max_attempts = max_attempts
+        self._available: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def primary(self) -> Any:
+        """Client of the first endpoint, for APIs that need a single client (e.g. batches)."""
+        return self.endpoints[0].client
+
+    def _candidates(self, exclude: List[Endpoint]) -> List[Endpoint]:
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            if endpoint.state == EJECTED and now >= endpoint.ejected_until:
+                endpoint.state = PROBING
+        healthy = [e for e in self.endpoints if e.state == HEALTHY and e not in exclude]
+        # An endpoint on probation takes a single request at a time
+        probing = [
+            e for e in self.endpoints if e.state == PROBING and e.in_flight == 0 and e not in exclude
+        ]
+        if probing:
+            return probing
+        if healthy:
+            return healthy
+        # Everything is ejected: use whatever comes back first rather than failing
+        others = [e for e in self.endpoints if e not in exclude] or self.endpoints
+        return [min(others, key=lambda e: e.ejected_until)]
+
+    def pick(self, exclude: Optional[List[Endpoint]] = None) -> Optional[Endpoint]:
+        """The least-loaded usable endpoint with free capacity, or None if all are busy."""
+        candidates = [e for e in self._candidates(exclude or []) if e.has_capacity()]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda e: e.load())
+
+    async def _acquire(self, exclude: List[Endpoint]) -> Endpoint:
+        loop = asyncio.get_running_loop()
+        if self._available is None or self._loop is not loop:
+            self._available = asyncio.Condition()
+            self._loop = loop
+        async with self._available:
+            while True:
+                endpoint = self.pick(exclude)
+                if endpoint is not None:
+                    endpoint.in_flight += 1
+                    return endpoint
+                # Wake up at least once a second so expired ejections are noticed
+                try:
+                    await asyncio.wait_for(self._available.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _release(self, endpoint: Endpoint) -> None:
+        endpoint.in_flight -= 1
+        async with self._available:
+            self._available.notify_all()
+
+    def model_for(self, endpoint: Endpoint, model: str) -> str:
+        """The model id to send to `endpoint` for a call that asked for `model`."""
+        if endpoint.model and (self.model is None or model == self.model):
+            return endpoint.model
+        return model
+
+    async def run(self, call: Callable[[Any, str], Awaitable[Any]], model: str) -> Any:
+        """Runs `call(client, model)` on the best endpoint, retrying on others on failure."""
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = await self._acquire(tried)
+            start = time.monotonic()
+            try:
+                result = await call(endpoint.client, self.model_for(endpoint, model))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not is_endpoint_error(e):
+                    # The request itself is bad; another endpoint won't do better
+                    endpoint.requests += 1
+                    raise
+                self._record_error(endpoint, e)
+                tried.append(endpoint)
+                if len(tried) >= min(self.max_attempts, len(self.endpoints)):
+                    raise
+                continue
+            else:
+                self._record_success(endpoint, time.monotonic() - start)
+                return result
+            finally:
+                await self._release(endpoint)
+
+    def _eject(self, endpoint: Endpoint, reason: str) -> None:
+        if endpoint.state == PROBING:
+            endpoint.eject_seconds = min(endpoint.eject_seconds * 2, self.max_eject_seconds)
+        else:
+            endpoint.eject_seconds = self.eject_seconds
+        endpoint.state = EJECTED
+        endpoint.ejections += 1
+        endpoint.ejected_until = time.monotonic() + endpoint.eject_seconds
+        endpoint.latencies.clear()
+        log_warning("Ejected endpoint %s for %ss: %s", endpoint.name, endpoint.eject_seconds, reason)
+
+    def _record_error(self, endpoint: Endpoint, error: Exception) -> None:
+        endpoint.requests += 1
+        endpoint.errors += 1
+        endpoint.consecutive_errors += 1
+        if endpoint.state == PROBING:
+            self._eject(endpoint, f"probe failed: {error}")
+        elif (
+            endpoint.state == HEALTHY
+            and endpoint.consecutive_errors >= self.max_consecutive_errors
+        ):
+            self._eject(endpoint, f"{endpoint.consecutive_errors} errors in a row: {error}")
+
+    def _record_success(self, endpoint: Endpoint, latency: float) -> None:
+        endpoint.requests += 1
+        endpoint.consecutive_errors = 0
+        endpoint.latencies.append(latency)
+        if endpoint.state == PROBING:
+            endpoint.state = HEALTHY
+            log_event("Endpoint %s recovered", endpoint.name)
+            return
+        if endpoint.state != HEALTHY or len(endpoint.latencies) < self.min_samples:
+            return
+        others = [
+            e.median_latency()
+            for e in self.endpoints
+            if e is not endpoint and e.state == HEALTHY and len(e.latencies) >= self.min_samples
+        ]
+        if others and endpoint.median_latency() > self.latency_factor * min(others):
+            self._eject(
+                endpoint,
+                f"median latency {endpoint.median_latency():.1f}s vs {min(others):.1f}s elsewhere",
+            )
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
+
+
+def is_endpoint_error(error: Exception) -> bool:
+    """Whether an error says something about the endpoint rather than the request."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return True
+    return status >= 500 or status in (408, 429)
+
+
+def load_endpoint_configs() -> List[Dict[str, Any]]:
+    """Endpoint settings from `LLM_ENDPOINTS` (a JSON list, or a path to a JSON file).
+
+    Each entry has a `base_url` and optionally `api_key`, `weight`, `model`,
+    `max_concurrency` and `name`. Names default to the base URL and model.
+    """
+    value = os.getenv("LLM_ENDPOINTS", "").strip()
+    if not value:
+        return []
+    if not value.startswith("["):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    return json.loads(value)
+
+
+def endpoint_names(configs: List[Dict[str, Any]]) -> List[str]:
+    """Explicit names, else `base_url` and `model`; repeated defaults get a `#n` suffix."""
+    defaults = [
+        f"{config['base_url']} {config['model']}" if config.get("model") else config["base_url"]
+        for config in configs
+    ]
+    names = []
+    for config, default in zip(configs, defaults):
+        name = config.get("name")
+        if not name:
+            name = default
+            if defaults.count(default) > 1:
+                name = f"{default} #{defaults[: len(names) + 1].count(default)}"
+        names.append(name)
+    return names
+
+
+def create_client_pool(
+    configs: List[Dict[str, Any]],
+    default_api_key: Optional[str],
+    create_client: Callable[..., Any],
+    **pool_kwargs: Any,
+) -> ClientPool:
+    endpoints = [
+        Endpoint(
+            name=name,
+            client=create_client(
+                api_key=config.get("api_key") or default_api_key,
+                base_url=config["base_url"],
+            ),
+            weight=float(config.get("weight", 1.0)),
+            model=config.get("model"),
+            max_concurrency=config.get("max_concurrency"),
+        )
+        for config, name in zip(configs, endpoint_names(configs))
+    ]
+    return ClientPool(endpoints, **pool_kwargs)
@@ -1,22 +1,28 @@
 import asyncio
+import functools
 import os
-import typer
-import tiktoken
-from typing import Optional
-from dotenv import load_dotenv
+from typing import TYPE_CHECKING, Optional
+from .pool import ClientPool, create_client_pool, load_endpoint_configs
+from .reasoning import StageReasoning, completion_options, get_stage_settings, strip_reasoning
+from .routing import resolve_route
 from .text_splitter import RecursiveCharacterTextSplitter
 
-from deep_research_py.utils import console, get_service, get_model
+from deep_research_py.cassette import completion_key, get_cassette
+from deep_research_py.common.deadline import timeout_for
+from deep_research_py.common.logging import log_warning
+from deep_research_py.common.profiling import timed
+from deep_research_py.common.singleflight import completion_flight, request_key
+from deep_research_py.utils import get_service, get_model, load_env
 
-# Assuming we're using OpenAI's API
-import openai
+# Provider SDKs are imported on first use to keep `import deep_research_py` fast
+if TYPE_CHECKING:
+    import ollama
+    import openai
 
-import ollama
 
-load_dotenv()
+def create_openai_client(api_key: str, base_url: Optional[str] = None) -> "openai.OpenAI":
+    import openai
 
-
-def create_openai_client(api_key: str, base_url: Optional[str] = None) -> openai.OpenAI:
     return openai.OpenAI(
         api_key=api_key, base_url=base_url or "https://api.openai.com/v1"
     )
@@ -24,19 +30,49 @@ def create_openai_client(api_key: str, base_url: Optional[str] = None) -> openai
 
 def create_deepseek_client(
     api_key: str, base_url: Optional[str] = None
-) -> openai.OpenAI:
+) -> "openai.OpenAI":
+    import openai
+
     return openai.OpenAI(
         api_key=api_key, base_url=base_url or "https://api.deepseek.com/v1"
     )
 
 
-def create_ollama_client(host: Optional[str] = None) -> ollama.Client:
+def create_ollama_client(host: Optional[str] = None) -> "ollama.Client":
+    import ollama
+
     return ollama.Client(host=host)
 
 
-def get_ai_client() -> openai.OpenAI:
+def get_ai_client(service: Optional[str] = None) -> "openai.OpenAI":
+    """Client for `service`, by default the selected one.
+
+    When `LLM_ENDPOINTS` lists several OpenAI-compatible endpoints, a `ClientPool`
+    balancing over them is returned for the selected service instead;
+    `generate_completions` accepts both. Other services, reached through stage
+    routes or fallbacks, keep their own `*_BASE_URL`.
+    """
+    import typer
+    from deep_research_py.utils import console
+
+    cassette = get_cassette()
+    if cassette is not None and cassette.replaying:
+        # Replayed runs never reach a provider
+        return None
+    load_env()
     # Decide which API key and endpoint to use
-    service = get_service()
+    service = service or get_service()
+    # The endpoints serve the run's own service only
+    pooled = service.lower() == get_service().lower() and service.lower() != "ollama"
+    endpoint_configs = load_endpoint_configs() if pooled else []
+    if endpoint_configs:
+        if service.lower() == "openai":
+            default_api_key, create_client = os.getenv("OPENAI_API_KEY"), create_openai_client
+        else:
+            default_api_key, create_client = os.getenv("DEEPSEEK_API_KEY"), create_deepseek_client
+        return create_client_pool(
+            endpoint_configs, default_api_key, create_client, model=get_model()
+        )
     if service.lower() == "openai":
         api_key = os.getenv("OPENAI_API_KEY")
         endpoint = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
@@ -69,18 +105,24 @@ def get_ai_client() -> openai.OpenAI:
 MIN_CHUNK_SIZE = 140
 
 
+@functools.lru_cache(maxsize=None)
+def get_encoder(name: str = "cl100k_base"):
+    """Loads a tiktoken encoding once per process."""
+    import tiktoken
+
+    return tiktoken.get_encoding(name)
+
+
 def get_token_count(text: str) -> int:
     """Returns the number of tokens in a given text."""
 
     service = get_service()
 
     if service.lower() == "openai":
-        encoder = tiktoken.get_encoding(
-            "cl100k_base"
-        )  # Updated to use OpenAI's current encoding
+        encoder = get_encoder("cl100k_base")  # Updated to use OpenAI's current encoding
         return len(encoder.encode(text))
     elif service.lower() == "deepseek":
-        encoder = tiktoken.get_encoding("cl100k_base")
+        encoder = get_encoder("cl100k_base")
         return len(encoder.encode(text))
     elif service.lower() == "ollama":
         # For Ollama, we can use the same encoding as OpenAI
@@ -88,12 +130,12 @@ def get_token_count(text: str) -> int:
         return len(client.embed(model=get_model(), input=text)["embeddings"][0])
 
 
-def trim_prompt(
-    prompt: str, context_size: int = int(os.getenv("CONTEXT_SIZE", "128000"))
-) -> str:
+def trim_prompt(prompt: str, context_size: Optional[int] = None) -> str:
     """Trims a prompt to fit within the specified context size."""
     if not prompt:
         return ""
+    if context_size is None:
+        context_size = int(os.getenv("CONTEXT_SIZE", "128000"))
 
     length = get_token_count(prompt)
     if length <= context_size:
@@ -118,20 +160,179 @@ def trim_prompt(
     return trim_prompt(trimmed_prompt, context_size)
 
 
-async def generate_completions(client, model, messages, format=None):
-    if get_service() == "ollama":
+_batch_collector = None
+
+
+def enable_batch_mode(collector) -> None:
+    """Routes OpenAI-compatible completions through a `BatchCollector`."""
+    global _batch_collector
+    _batch_collector = collector
+
+
+def disable_batch_mode() -> None:
+    global _batch_collector
+    _batch_collector = None
+
+
+def get_batch_collector():
+    return _batch_collector
+
+
+_completion_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def set_max_concurrent_completions(limit: Optional[int]) -> None:
+    """Caps concurrent completion calls across every research job in the process."""
+    global _completion_semaphore
+    _completion_semaphore = asyncio.Semaphore(limit) if limit else None
+
+
+# Seconds a completion may take; unset means no limit besides the run's deadline
+_completion_timeout: Optional[float] = float(os.getenv("COMPLETION_TIMEOUT", "0")) or None
+
+
+def set_completion_timeout(seconds: Optional[float]) -> None:
+    global _completion_timeout
+    _completion_timeout = seconds
+
+
+_service_clients = {}
+_fallbacks = {}
+
+
+def get_service_client(service: str):
+    """A client for another service than the run's, created once."""
+    if service not in _service_clients:
+        _service_clients[service] = get_ai_client(service)
+    return _service_clients[service]
+
+
+def fallback_stats():
+    """Calls per stage that failed over to a fallback model."""
+    return dict(_fallbacks)
+
+
+async def generate_completions(client, model, messages, format=None, timeout=None, stage=None):
+    """Runs a chat completion; raises `asyncio.TimeoutError` after `timeout` seconds.
+
+    The timeout defaults to `COMPLETION_TIMEOUT` and never outlasts the run's deadline.
+    `stage` selects the model (see `ai.routing`) and the reasoning settings of
+    the call (see `ai.reasoning`); when the call fails, the stage's fallback
+    models are tried in turn. The returned content never contains the model's
+    reasoning.
+    """
+    settings = get_stage_settings(stage)
+    targets = resolve_route(stage, get_service(), model)
+    if settings.model:
+        targets[0] = (targets[0][0], settings.model)
+    call = _routed_completions(client, targets, messages, format, settings, stage)
+    timeout = timeout_for(timeout if timeout is not None else _completion_timeout)
+    if timeout is None:
+        return await call
+    return await asyncio.wait_for(call, timeout)
+
+
+async def _routed_completions(client, targets, messages, format, settings, stage):
+    for i, (service, model) in enumerate(targets):
+        target_client = client if service == get_service() else get_service_client(service)
+        # Identical requests already in flight (e.g. from a sibling branch) share one call
+        key = request_key(service, model, messages, format, settings)
+        try:
+            return await completion_flight.do(
+                key,
+                lambda target_client=target_client, service=service, model=model: _limited_completions(
+                    target_client, model, messages, format, settings, stage, service
+                ),
+            )
+        except Exception as error:
+            if i == len(targets) - 1:
+                raise
+            log_warning(
+                "%s on %s/%s failed (%r); falling back to %s/%s",
+                stage or "Completion",
+                service,
+                model,
+                error,
+                *targets[i + 1],
+            )
+            _fallbacks[stage] = _fallbacks.get(stage, 0) + 1
+
+
+async def _limited_completions(client, model, messages, format, settings, stage=None, service=None):
+    stage = stage or "completion"
+    if _completion_semaphore is None:
+        with timed("llm", stage):
+            return await _recorded_completions(client, model, messages, format, settings, stage, service)
+    with timed("queue", stage):
+        await _completion_semaphore.acquire()
+    try:
+        with timed("llm", stage):
+            return await _recorded_completions(client, model, messages, format, settings, stage, service)
+    finally:
+        _completion_semaphore.release()
+
+
+async def _recorded_completions(client, model, messages, format, settings, stage, service):
+    cassette = get_cassette()
+    if cassette is None:
+        return await _generate_completions(client, model, messages, format, settings)
+    service = service or get_service()
+    return await cassette.completion(
+        completion_key(service, model, messages, format, settings),
+        service,
+        model,
+        stage,
+        lambda: _generate_completions(client, model, messages, format, settings),
+    )
+
+
+async def _generate_completions(client, model, messages, format, settings):
+    if _batch_collector is not None and get_service() != "ollama":
+        # Offline mode: park the call until its batch comes back
+        response = await _batch_collector.submit(
+            model=model, messages=messages, format=format, **completion_options(model, settings)
+        )
+    elif get_service() == "ollama":
         response = await asyncio.get_event_loop().run_in_executor(
             None,
             lambda: client.chat(
                 model=model, messages=messages, stream=False, format=format
             ),
         )
-    else:
-        # Run OpenAI call in thread pool since it's synchronous
-        response = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: client.chat.completions.create(
-                model=model, messages=messages, response_format=format
+    elif isinstance(client, ClientPool):
+        response = await client.run(
+            lambda endpoint_client, endpoint_model: _openai_completion(
+                endpoint_client, endpoint_model, messages, format, settings
             ),
+            model,
         )
+    else:
+        response = await _openai_completion(client, model, messages, format, settings)
+    _strip_reasoning(response)
     return response
+
+
+def _strip_reasoning(response) -> None:
+    reasoning = strip_reasoning(response)
+    usage = getattr(response, "usage", None)
+    if not reasoning or usage is None:
+        return
+    # Not every provider reports reasoning tokens; estimate them from the text
+    details = usage.completion_tokens_details
+    if details is None or not details.reasoning_tokens:
+        from openai.types.completion_usage import CompletionTokensDetails
+
+        usage.completion_tokens_details = CompletionTokensDetails(
+            reasoning_tokens=get_token_count(reasoning)
+        )
+
+
+async def _openai_completion(client, model, messages, format=None, settings=None):
+    # Run OpenAI call in thread pool since it's synchronous
+    options = completion_options(model, settings or StageReasoning())
+    return await asyncio.get_event_loop().run_in_executor(
+        None,
+        lambda: client.chat.completions.create(
+            model=model, messages=messages, response_format=format, **options
+        ),
+    )
@@ -0,0 +1,148 @@
+"""Support for reasoning models (o1/o3-mini, deepseek-r1).
+
+Reasoning models think before they answer. Depending on the provider the
+thinking comes back as `<think>` blocks inside the content or in a separate
+`reasoning_content` field. Either way it is removed from the response before any
+stage parses the answer or passes it on, and only counted as reasoning tokens.
+
+How hard a model thinks can be set per pipeline stage with `REASONING_STAGES`
+(a JSON object, or the path of a JSON file) keyed by stage name, `*` for all:
+
+    {"*": {"effort": "medium"},
+     "generate_serp_queries": {"model": "gpt-4o-mini"},
+     "process_serp_result": {"effort": "low", "max_reasoning_tokens": 4000}}
+
+`model` swaps in another model of the same service for that stage, e.g. a
+non-reasoning one for cheap stages.
+"""
+
+import json
+import os
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+REASONING_MODEL_PREFIXES = ("o1", "o3", "o4", "deepseek-r1", "deepseek-reasoner")
+
+_THINK_BLOCK = re.compile(r"<think>(.*?)(?:</think>|$)", re.DOTALL)
+_FENCED = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+@dataclass
+class StageReasoning:
+    """Reasoning settings of one stage.
+
+    Args:
+        model: Model used for the stage instead of the run's model.
+        effort: `reasoning_effort` sent to reasoning models: low, medium or high.
+        max_reasoning_tokens: Cap on thinking. Sent as `max_completion_tokens`
+            together with `answer_tokens`, since the API caps both at once.
+        answer_tokens: Room left for the answer on top of the reasoning cap.
+    """
+
+    model: Optional[str] = None
+    effort: Optional[str] = None
+    max_reasoning_tokens: Optional[int] = None
+    answer_tokens: int = 8192
+
+
+def is_reasoning_model(model: str) -> bool:
+    """Known reasoning models, plus the names listed in `REASONING_MODELS`."""
+    extra = {name.strip() for name in os.getenv("REASONING_MODELS", "").split(",") if name.strip()}
+    return model in extra or model.startswith(REASONING_MODEL_PREFIXES)
+
+
+def split_reasoning(text: str) -> Tuple[str, str]:
+    """Splits `<think>` blocks off a completion; returns (answer, reasoning).
+
+    An unclosed block (a truncated answer) is all reasoning. Some providers drop
+    the opening tag; everything before a lone `</think>` is then reasoning.
+    """
+    if "<think>" not in text and "</think>" not in text:
+        return text, ""
+    reasoning = []
+    if "</think>" in text.split("<think>", 1)[0]:
+        head, text = text.split("</think>", 1)
+        reasoning.append(head)
+
+    def take(match: "re.Match") -> str:
+        reasoning.append(match.group(1))
+        return ""
+
+    answer = _THINK_BLOCK.sub(take, text)
+    return answer.strip(), "\n".join(part.strip() for part in reasoning)
+
+
+def extract_json(text: str) -> str:
+    """The JSON document in a completion: the whole answer, a fenced block, or the outer braces."""
+    text, _ = split_reasoning(text)
+    try:
+        json.loads(text)
+        return text
+    except ValueError:
+        pass
+    for block in _FENCED.findall(text):
+        try:
+            json.loads(block)
+            return block
+        except ValueError:
+            continue
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        return text[start : end + 1]
+    return text
+
+
+def strip_reasoning(response: Any) -> str:
+    """Removes the reasoning from a chat response in place and returns it."""
+    message = response.choices[0].message if hasattr(response, "choices") else response.message
+    content = message.content or ""
+    answer, reasoning = split_reasoning(content)
+    if answer != content:
+        message.content = answer
+    # DeepSeek returns `reasoning_content`, Ollama `thinking`
+    for field in ("reasoning_content", "thinking"):
+        separate = getattr(message, field, None)
+        if separate:
+            reasoning = separate + ("\n" + reasoning if reasoning else "")
+    return reasoning
+
+
+def completion_options(model: str, settings: StageReasoning) -> Dict[str, Any]:
+    """Extra chat-completion arguments for `model`; none for non-reasoning models."""
+    if not is_reasoning_model(model):
+        return {}
+    options: Dict[str, Any] = {}
+    if settings.effort:
+        options["reasoning_effort"] = settings.effort
+    if settings.max_reasoning_tokens:
+        options["max_completion_tokens"] = settings.max_reasoning_tokens + settings.answer_tokens
+    return options
+
+
+_stage_settings: Optional[Dict[str, StageReasoning]] = None
+
+
+def load_stage_settings() -> Dict[str, StageReasoning]:
+    value = os.getenv("REASONING_STAGES", "").strip()
+    if not value:
+        return {}
+    if not value.startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    return {stage: StageReasoning(**config) for stage, config in json.loads(value).items()}
+
+
+def get_stage_settings(stage: Optional[str]) -> StageReasoning:
+    """Settings of `stage`, falling back to `*` and then to the defaults."""
+    global _stage_settings
+    if _stage_settings is None:
+        _stage_settings = load_stage_settings()
+    settings = _stage_settings.get(stage) if stage else None
+    return settings or _stage_settings.get("*") or StageReasoning()
+
+
+def set_stage_settings(settings: Optional[Dict[str, StageReasoning]]) -> None:
+    """Replaces the per-stage settings; None reloads them from the environment."""
+    global _stage_settings
+    _stage_settings = settings
@@ -0,0 +1,173 @@
+"""Per-stage model routing.
+
+Query generation and learnings extraction are many calls with short answers,
+which a small, fast model handles well. The outline and the sections need the
+strong model. `ROUTES` (a JSON object, or the path of a JSON file) maps stage
+names, `*` for all, to a service and model. Each stage may list fallbacks that
+are tried in order when a call fails; a fallback is a model of the same service
+or `service:model`:
+
+    {"generate_serp_queries": {"model": "gpt-4o-mini"},
+     "process_serp_result": {"model": "gpt-4o-mini", "fallbacks": ["gpt-4o"]},
+     "generate_section": {"service": "deepseek", "model": "deepseek-chat",
+                          "fallbacks": ["openai:gpt-4o"]}}
+
+Without `ROUTES`, the default policy sends the research stages to the service's
+fast model (`OPENAI_FAST_MODEL`, default gpt-4o-mini, or `DEEPSEEK_FAST_MODEL`)
+and falls back to the run's model. `ROUTES={}` runs every stage on the run's
+model. Routes switch only between the OpenAI-compatible services; a run on
+ollama is not routed. A `model` set in `REASONING_STAGES` still wins for its
+stage.
+"""
+
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+STAGES = (
+    "generate_feedback",
+    "generate_serp_queries",
+    "process_serp_result",
+    "digest_learnings",
+    "write_outline",
+    "write_outline_polish",
+    "generate_section",
+    "polish_article",
+)
+# Many calls, short answers: routed to the fast model by default
+RESEARCH_STAGES = (
+    "generate_feedback",
+    "generate_serp_queries",
+    "process_serp_result",
+    "digest_learnings",
+)
+ROUTABLE_SERVICES = ("openai", "deepseek")
+# Context windows in tokens, by model name prefix
+CONTEXT_WINDOWS = {
+    "gpt-4o": 128_000,
+    "gpt-4.1": 1_000_000,
+    "o1": 200_000,
+    "o3": 200_000,
+    "o4-mini": 200_000,
+    "deepseek-chat": 64_000,
+    "deepseek-reasoner": 64_000,
+}
+
+
+@dataclass
+class Route:
+    """Where the calls of one stage go.
+
+    Args:
+        model: Model of the stage; the run's model if unset.
+        service: Service of the stage; the run's service if unset.
+        fallbacks: Models tried in order when a call fails, as `model` (same
+            service) or `service:model`.
+    """
+
+    model: Optional[str] = None
+    service: Optional[str] = None
+    fallbacks: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.service is not None and self.service not in ROUTABLE_SERVICES:
+            raise ValueError(f"Cannot route to service {self.service!r}")
+        for fallback in self.fallbacks:
+            parse_target(fallback, "openai")
+
+
+def parse_target(value: str, service: str) -> Tuple[str, str]:
+    """(service, model) of `model` or `service:model`."""
+    prefix, _, name = value.partition(":")
+    if name and prefix in ROUTABLE_SERVICES:
+        return prefix, name
+    if name and prefix == "ollama":
+        raise ValueError(f"Cannot route to service {prefix!r}")
+    return service, value
+
+
+def fast_model(service: str) -> Optional[str]:
+    if service == "openai":
+        return os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")
+    if service == "deepseek":
+        return os.getenv("DEEPSEEK_FAST_MODEL") or None
+    return None
+
+
+def default_routes(service: str, model: str) -> Dict[str, Route]:
+    """Research stages on the fast model, falling back to the run's model."""
+    fast = fast_model(service)
+    if not fast or fast == model:
+        return {}
+    return {stage: Route(model=fast, fallbacks=[model]) for stage in RESEARCH_STAGES}
+
+
+def load_routes() -> Optional[Dict[str, Route]]:
+    """The routes in `ROUTES`; None when it is unset and the default policy applies."""
+    value = os.getenv("ROUTES", "").strip()
+    if not value:
+        return None
+    if not value.startswith("{"):
+        with open(value, encoding="utf-8") as f:
+            value = f.read()
+    return {stage: Route(**config) for stage, config in json.loads(value).items()}
+
+
+_routes: Optional[Dict[str, Route]] = None
+_routes_loaded = False
+
+
+def get_routes(service: str, model: str) -> Dict[str, Route]:
+    global _routes, _routes_loaded
+    if not _routes_loaded:
+        _routes = load_routes()
+        _routes_loaded = True
+    return _routes if _routes is not None else default_routes(service, model)
+
+
+def set_routes(routes: Optional[Dict[str, Route]]) -> None:
+    """Replaces the routing table; None applies the default policy."""
+    global _routes, _routes_loaded
+    _routes = routes
+    _routes_loaded = True
+
+
+def resolve_route(stage: Optional[str], service: str, model: str) -> List[Tuple[str, str]]:
+    """The (service, model) pairs to try for `stage`, in order."""
+    if service not in ROUTABLE_SERVICES:
+        return [(service, model)]
+    routes = get_routes(service, model)
+    route = (routes.get(stage) if stage else None) or routes.get("*") or Route()
+    primary = (route.service or service, route.model or model)
+    targets = [primary]
+    for fallback in route.fallbacks:
+        target = parse_target(fallback, primary[0])
+        if target not in targets:
+            targets.append(target)
+    return targets
+
+
+def stage_models(service: str, model: str) -> Dict[str, str]:
+    """The primary model of every known stage."""
+    return {stage: resolve_route(stage, service, model)[0][1] for stage in STAGES}
+
+
+def context_window(service: str, model: str) -> int:
+    """Context window of a model, in tokens.
+
+    Unknown models get `DEEPSEEK_CONTEXT_SIZE` (default 64000) on deepseek, whose
+    `ep-` ids say nothing about the model, and `CONTEXT_SIZE` (default 128000)
+    elsewhere.
+    """
+    prefixes = [prefix for prefix in CONTEXT_WINDOWS if model.startswith(prefix)]
+    if prefixes:
+        return CONTEXT_WINDOWS[max(prefixes, key=len)]
+    if service == "deepseek":
+        return int(os.getenv("DEEPSEEK_CONTEXT_SIZE", "64000"))
+    return int(os.getenv("CONTEXT_SIZE", "128000"))
+
+
+def stage_context_window(stage: str, service: str, model: str) -> int:
+    """The smallest context window among the models `stage` may be sent to."""
+    return min(context_window(*target) for target in resolve_route(stage, service, model))
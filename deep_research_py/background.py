@@ -0,0 +1,59 @@
+import asyncio
+import queue
+import threading
+from typing import Any, Awaitable, Callable, List, Optional
+
+from .common.events import CallbackSink, EventBus, ProgressEvent
+
+
+class BackgroundJob:
+    """Runs a coroutine on its own thread and event loop.
+
+    Progress reported by the coroutine is put on a thread-safe queue so a UI can
+    poll it with `poll()` without ever waiting for the research itself.
+    """
+
+    def __init__(self, coro_fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any):
+        self.coro_fn = coro_fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self._events: "queue.Queue[ProgressEvent]" = queue.Queue()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "BackgroundJob":
+        self._thread.start()
+        return self
+
+    @property
+    def done(self) -> bool:
+        return self._thread.ident is not None and not self._thread.is_alive()
+
+    def poll(self, max_events: int = 200) -> List[ProgressEvent]:
+        """Returns up to `max_events` progress events reported since the last poll."""
+        events = []
+        while len(events) < max_events:
+            try:
+                events.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def cancel(self) -> None:
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+
+    def _run(self) -> None:
+        try:
+            asyncio.run(self._main())
+        except BaseException as e:
+            self.error = e
+
+    async def _main(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        async with EventBus([CallbackSink(self._events.put)]):
+            self._task = asyncio.ensure_future(self.coro_fn(*self.args, **self.kwargs))
+            self.result = await self._task
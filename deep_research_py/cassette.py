@@ -0,0 +1,270 @@
+"""Record and replay of the LLM and search calls of a run.
+
+With `CASSETTE=<path>` and `CASSETTE_MODE=record`, every completion (request
+key, stage, model, response and latency) and every search (query, results after
+page fetching, latency) is appended to a gzipped JSONL cassette. With
+`CASSETTE_MODE=replay`, the same calls are answered from the cassette without
+touching the network. Each answer comes after its recorded latency scaled by
+`CASSETTE_LATENCY` (default 0, instantly). Calls that failed or were cancelled
+are recorded as well, and fail the same way when replayed, so fallbacks and
+timeouts replay as they happened.
+
+Prompts embed the current time, so timestamps are masked in the request key.
+Identical requests get their recorded responses in order. A replayed request
+that was never recorded exactly raises `CassetteMiss`, as does a search that
+was never recorded. With `CASSETTE_LENIENT=1`, such a completion instead gets
+the next unused response recorded for its stage, and such a search gets no
+results; e.g. to replay a run whose branches finished in another order. A
+lenient replay is not guaranteed to be the recorded run, and each substitution
+is logged. Callers that keep going after a failed call should use `check` at the
+end of the run, so a strict replay with misses still fails.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from .common.logging import log_event, log_warning
+from .common.singleflight import request_key
+
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?")
+
+
+class CassetteMiss(RuntimeError):
+    """A replayed call that the cassette has no answer for."""
+
+
+def completion_key(service: str, model: str, messages: List[Dict[str, Any]], format: Any, settings: Any) -> str:
+    masked = [
+        {**message, "content": _TIMESTAMP.sub("<time>", message["content"])}
+        if isinstance(message.get("content"), str)
+        else message
+        for message in messages
+    ]
+    return request_key(service, model, masked, format, settings)
+
+
+def _dump_response(response: Any) -> Dict[str, Any]:
+    if hasattr(response, "model_dump"):
+        return response.model_dump(mode="json")
+    return dict(response)
+
+
+def _load_response(service: str, data: Dict[str, Any]) -> Any:
+    if service == "ollama":
+        import ollama
+
+        return ollama.ChatResponse.model_validate(data)
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(data)
+
+
+class Cassette:
+    """A cassette file being recorded or replayed.
+
+    Args:
+        path: The gzipped JSONL file.
+        mode: `record` (truncates the file) or `replay`.
+        latency: Share of the recorded latency to wait before each replayed answer.
+        lenient: Answer unrecorded completions with the next unused response of
+            their stage, and unrecorded searches with no results, instead of raising.
+    """
+
+    def __init__(self, path: str, mode: str = "replay", latency: float = 0.0, lenient: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.lenient = lenient
+        self.counts = {"completions": 0, "searches": 0, "stage_matches": 0, "misses": 0}
+        self._lock = threading.Lock()
+        self._file = None
+        self._completions: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._by_stage: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self._searches: Dict[Tuple[str, int], Deque[Dict[str, Any]]] = defaultdict(deque)
+        if mode == "replay":
+            self._load()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self) -> None:
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry["type"] == "completion":
+                        self._completions[entry["key"]].append(entry)
+                        if "error" not in entry:
+                            self._by_stage[entry.get("stage") or ""].append(entry)
+                    elif entry["type"] == "search":
+                        self._searches[(entry["query"], entry["limit"])].append(entry)
+            except EOFError:
+                # The recording process did not close the file; keep what was written
+                log_warning("Cassette %s is truncated", self.path)
+
+    def _write(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                # A sync flush per entry keeps the file readable if the run is killed
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    async def _wait(self, entry: Dict[str, Any]) -> None:
+        if self.latency > 0 and entry.get("latency"):
+            await asyncio.sleep(entry["latency"] * self.latency)
+
+    def _take(self, queue: Optional[Deque[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """The next unused entry of `queue`; None once every one was used.
+
+        The last entry stays in the queue, so a lenient replay can answer with it again.
+        """
+        if not queue or queue[0].get("used"):
+            return None
+        entry = queue.popleft() if len(queue) > 1 else queue[0]
+        entry["used"] = True
+        return entry
+
+    async def completion(
+        self, key: str, service: str, model: str, stage: Optional[str], call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """The response of `call`, recorded, or the recorded response for `key`."""
+        self.counts["completions"] += 1
+        if not self.replaying:
+            start = time.monotonic()
+            entry = {"type": "completion", "key": key, "stage": stage, "service": service, "model": model}
+            try:
+                response = await call()
+            except (Exception, asyncio.CancelledError) as error:
+                entry["latency"] = round(time.monotonic() - start, 3)
+                entry["error"] = repr(error)
+                entry["cancelled"] = isinstance(error, asyncio.CancelledError)
+                self._write(entry)
+                raise
+            entry["latency"] = round(time.monotonic() - start, 3)
+            entry["response"] = _dump_response(response)
+            self._write(entry)
+            return response
+
+        queue = self._completions.get(key)
+        entry = self._take(queue)
+        if entry is None and queue and self.lenient:
+            # Made more often than it was recorded
+            self.counts["misses"] += 1
+            log_warning("Recorded %s completion used up; answering with it again", stage)
+            entry = queue[0]
+        elif entry is None:
+            unused = [e for e in self._by_stage.get(stage or "", ()) if not e.get("used")]
+            if not self.lenient or not unused:
+                self.counts["misses"] += 1
+                raise CassetteMiss(
+                    f"No recorded completion {'left ' if queue else ''}for this {stage!r} request"
+                    + ("" if self.lenient else "; set CASSETTE_LENIENT=1 to use the stage's next response")
+                )
+            self.counts["stage_matches"] += 1
+            log_warning("No recorded completion for this %s request; using the stage's next one", stage)
+            entry = unused[0]
+            entry["used"] = True
+        await self._wait(entry)
+        if entry.get("cancelled"):
+            raise asyncio.TimeoutError(f"Recorded {stage!r} call was cancelled")
+        if "error" in entry:
+            raise RuntimeError(f"Recorded {stage!r} call failed: {entry['error']}")
+        return _load_response(entry.get("service", service), entry["response"])
+
+    async def search(
+        self, query: str, limit: int, call: Callable[[], Awaitable[List[Dict[str, Any]]]]
+    ) -> List[Dict[str, Any]]:
+        """The results of `call`, recorded, or the recorded results for the query."""
+        self.counts["searches"] += 1
+        if not self.replaying:
+            start = time.monotonic()
+            results = await call()
+            self._write(
+                {
+                    "type": "search",
+                    "query": query,
+                    "limit": limit,
+                    "latency": round(time.monotonic() - start, 3),
+                    "results": results,
+                }
+            )
+            return results
+
+        queue = self._searches.get((query, limit))
+        entry = self._take(queue)
+        if entry is None:
+            self.counts["misses"] += 1
+            if not self.lenient:
+                raise CassetteMiss(
+                    f"No recorded search {'left ' if queue else ''}for {query!r}; "
+                    "set CASSETTE_LENIENT=1 to skip it"
+                )
+            if not queue:
+                log_warning("No recorded search for %s", query)
+                return []
+            log_warning("Recorded search for %s used up; answering with it again", query)
+            entry = queue[0]
+        await self._wait(entry)
+        # Callers fill in and stash the results; keep the recording intact
+        return json.loads(json.dumps(entry["results"]))
+
+    def check(self) -> None:
+        """Raises `CassetteMiss` if a strict replay had calls the cassette could not answer."""
+        if self.replaying and not self.lenient and self.counts["misses"]:
+            raise CassetteMiss(
+                f"{self.counts['misses']} call(s) were not recorded in {self.path}; "
+                "the replay differs from the recording"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, **self.counts}
+
+
+_cassette: Optional[Cassette] = None
+_cassette_loaded = False
+
+
+def get_cassette() -> Optional[Cassette]:
+    """The process-wide cassette from `CASSETTE`/`CASSETTE_MODE`; None when unset."""
+    global _cassette, _cassette_loaded
+    if not _cassette_loaded:
+        _cassette_loaded = True
+        path = os.getenv("CASSETTE")
+        if path:
+            import atexit
+
+            _cassette = Cassette(
+                path,
+                mode=os.getenv("CASSETTE_MODE", "replay"),
+                latency=float(os.getenv("CASSETTE_LATENCY", "0")),
+                lenient=os.getenv("CASSETTE_LENIENT", "0") != "0",
+            )
+            atexit.register(_cassette.close)
+            log_event("Cassette %s: %s", _cassette.mode, path)
+    return _cassette
+
+
+def set_cassette(cassette: Optional[Cassette]) -> None:
+    global _cassette, _cassette_loaded
+    _cassette = cassette
+    _cassette_loaded = True
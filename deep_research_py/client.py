@@ -0,0 +1,58 @@
+import json
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+
+class ResearchServiceClient:
+    """Thin HTTP client for the research job service in `server.py`."""
+
+    def __init__(self, base_url: str = "http://localhost:8000", timeout: float = 600.0):
+        self.http = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def feedback(self, query: str, max_followup_questions: int = 5) -> List[str]:
+        response = self.http.post(
+            "/feedback",
+            json={"query": query, "max_followup_questions": max_followup_questions},
+        )
+        response.raise_for_status()
+        return response.json()["questions"]
+
+    def submit(
+        self,
+        query: str,
+        breadth: int = 2,
+        depth: int = 2,
+        follow_up_questions: Optional[List[str]] = None,
+        answers: Optional[List[str]] = None,
+        writing_method: str = "serial",
+    ) -> Dict[str, Any]:
+        response = self.http.post(
+            "/jobs",
+            json={
+                "query": query,
+                "breadth": breadth,
+                "depth": depth,
+                "follow_up_questions": follow_up_questions or [],
+                "answers": answers or [],
+                "writing_method": writing_method,
+            },
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def job(self, job_id: str) -> Dict[str, Any]:
+        response = self.http.get(f"/jobs/{job_id}")
+        response.raise_for_status()
+        return response.json()
+
+    def events(self, job_id: str) -> Iterator[Dict[str, Any]]:
+        """Yields the job's progress events until it finishes."""
+        with self.http.stream("GET", f"/jobs/{job_id}/events", timeout=None) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line.startswith("data: "):
+                    yield json.loads(line[len("data: ") :])
+
+    def close(self) -> None:
+        self.http.close()
@@ -0,0 +1,118 @@
+"""Process pool for CPU-bound text work, so it never blocks the event loop.
+
+Tokenizing, splitting and trimming long documents, and recovering JSON from long
+model output, take tens to hundreds of milliseconds each. On the event-loop
+thread that time stalls every concurrent search and completion. The async
+helpers here run such work in a pool of worker processes that load the
+tokenizer once when they start. Inputs shorter than `INLINE_CHARS` stay inline,
+where shipping them to a worker would cost more than the work itself.
+"""
+
+import asyncio
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, List, Optional
+
+from .logging import log_warning
+from .profiling import timed
+
+# Characters below which text work runs on the event loop (about 5k tokens)
+INLINE_CHARS = int(os.getenv("CPU_INLINE_CHARS", "20000"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _warm_worker() -> None:
+    """Loads the tokenizer in a new worker before its first task arrives."""
+    try:
+        from ..ai.providers import get_encoder
+
+        get_encoder("cl100k_base")
+    except Exception:
+        # The first task that needs it will report the error
+        pass
+
+
+def worker_count() -> int:
+    """`CPU_WORKERS`, by default one per core, at most 8."""
+    return int(os.getenv("CPU_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """The shared pool of `worker_count()` processes."""
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=worker_count(), initializer=_warm_worker)
+        atexit.register(shutdown_process_pool)
+    return _pool
+
+
+def shutdown_process_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def run_in_process(fn: Callable[..., Any], *args: Any) -> Any:
+    """Runs a picklable module-level function in the pool.
+
+    If a worker died, the pool is replaced and this call runs in a thread instead.
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), fn, *args)
+    except BrokenProcessPool:
+        log_warning("CPU worker pool broke; running %s in a thread", fn.__name__)
+        shutdown_process_pool()
+        return await asyncio.to_thread(fn, *args)
+
+
+async def _offload(fn: Callable[..., Any], *args: Any) -> Any:
+    from ..utils import get_service
+
+    if get_service().lower() == "ollama":
+        # Ollama counts tokens with an embedding request: I/O, not CPU
+        return await asyncio.to_thread(fn, *args)
+    return await run_in_process(fn, *args)
+
+
+async def _run(fn: Callable[..., Any], text: str, *args: Any, offload=run_in_process) -> Any:
+    with timed("cpu", fn.__name__):
+        if len(text) < INLINE_CHARS:
+            return fn(text, *args)
+        return await offload(fn, text, *args)
+
+
+async def count_tokens(text: str) -> int:
+    """`get_token_count` off the event loop for long texts."""
+    from ..ai.providers import get_token_count
+
+    return await _run(get_token_count, text, offload=_offload)
+
+
+async def trim(text: str, context_size: Optional[int] = None) -> str:
+    """`trim_prompt` off the event loop for long texts."""
+    from ..ai.providers import trim_prompt
+
+    return await _run(trim_prompt, text, context_size, offload=_offload)
+
+
+def split_text(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    from ..ai.text_splitter import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(chunk_size, chunk_overlap).split_text(text)
+
+
+async def split(text: str, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[str]:
+    """`RecursiveCharacterTextSplitter.split_text` off the event loop for long texts."""
+    return await _run(split_text, text, chunk_size, chunk_overlap)
+
+
+async def extract(text: str) -> str:
+    """`extract_json` off the event loop for long model output."""
+    from ..ai.reasoning import extract_json
+
+    return await _run(extract_json, text)
@@ -0,0 +1,157 @@
+"""Deadlines that flow through a research run.
+
+A run sets its deadline once with `deadline_scope(seconds)`. Every stage below
+reads it from a context variable, so searches, completions and fan-outs stop in
+time without a parameter threaded through each call. A stage can take a share of
+the time left, `deadline_scope(fraction=0.6)`, to leave the rest for later stages.
+
+`gather_partial` replaces `asyncio.gather` where partial results are useful. At
+the deadline, or once most tasks are done and the rest take far longer, it
+cancels what is still running, records it, and returns what finished.
+"""
+
+import asyncio
+import contextvars
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Iterable, List, Optional, Set
+
+from .events import CancellationEvent, emit
+from .logging import log_error, log_warning
+
+# time.monotonic() by which the current run must be done
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the deadline, or None without one."""
+    at = _deadline.get()
+    if at is None:
+        return None
+    return max(0.0, at - time.monotonic())
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def timeout_for(timeout: Optional[float]) -> Optional[float]:
+    """`timeout` shortened to the time left before the deadline."""
+    left = remaining()
+    if left is None:
+        return timeout
+    return left if timeout is None else min(timeout, left)
+
+
+@contextmanager
+def deadline_scope(seconds: Optional[float] = None, fraction: Optional[float] = None):
+    """Sets the deadline of the block; it is never later than an enclosing one.
+
+    Args:
+        seconds: Time limit of the block from now.
+        fraction: Share of the enclosing deadline's remaining time the block gets.
+    """
+    now = time.monotonic()
+    outer = _deadline.get()
+    candidates = [outer] if outer is not None else []
+    if seconds:
+        candidates.append(now + seconds)
+    if fraction is not None and outer is not None:
+        candidates.append(now + (outer - now) * fraction)
+    token = _deadline.set(min(candidates) if candidates else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def record_cancellation(stage: str, cancelled: int, completed: int, reason: str) -> None:
+    log_warning(
+        "Cancelled %s of %s %s tasks: %s", cancelled, cancelled + completed, stage, reason
+    )
+    emit(CancellationEvent(stage=stage, cancelled=cancelled, completed=completed, reason=reason))
+
+
+async def cancel_all(
+    tasks: Set[asyncio.Future], stage: str, reason: str, completed: int = 0
+) -> None:
+    """Cancels `tasks`, waits until they have stopped, and records them."""
+    tasks = {task for task in tasks if not task.done()}
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    record_cancellation(stage, len(tasks), completed, reason)
+
+
+async def gather_partial(
+    aws: Iterable[Awaitable[Any]],
+    stage: str,
+    straggler_quantile: Optional[float] = None,
+    straggler_factor: float = 3.0,
+    min_straggler_wait: float = 5.0,
+) -> List[Optional[Any]]:
+    """Runs `aws` concurrently and returns their results in order.
+
+    Tasks still running at the deadline are cancelled. With `straggler_quantile`,
+    once that share of the tasks is done, the rest get `straggler_factor` times
+    as long as it took to get there (at least `min_straggler_wait` seconds).
+    Cancelled and failed tasks give None.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if not tasks:
+        return []
+
+    started = time.monotonic()
+    pending = set(tasks)
+    finished = 0
+    cutoff = None
+    quorum = (
+        max(1, math.ceil(straggler_quantile * len(tasks)))
+        if straggler_quantile is not None
+        else None
+    )
+    try:
+        while pending:
+            now = time.monotonic()
+            waits = [w for w in (remaining(), cutoff - now if cutoff else None) if w is not None]
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, min(waits)) if waits else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                reason = "deadline" if expired() else "straggler"
+                await cancel_all(pending, stage, reason, finished)
+                break
+            finished += len(done)
+            if quorum is not None and cutoff is None and finished >= quorum:
+                elapsed = time.monotonic() - started
+                cutoff = started + max(min_straggler_wait, straggler_factor * elapsed)
+    except asyncio.CancelledError:
+        # The caller was cancelled, e.g. by an enclosing gather_partial
+        await cancel_all(pending, stage, "parent cancelled", finished)
+        raise
+
+    results = []
+    timed_out = 0
+    for task in tasks:
+        if task.cancelled():
+            results.append(None)
+        elif isinstance(task.exception(), asyncio.TimeoutError):
+            # e.g. a completion that ran into the deadline on its own
+            timed_out += 1
+            results.append(None)
+        elif task.exception() is not None:
+            log_error("%s task failed: %r", stage, task.exception())
+            results.append(None)
+        else:
+            results.append(task.result())
+    if timed_out:
+        record_cancellation(stage, timed_out, len(tasks) - timed_out, "timeout")
+    return results
@@ -0,0 +1,423 @@
+"""Typed progress events and the bus that delivers them to UI sinks.
+
+The research pipeline only calls `emit(...)`, which never blocks: every sink has
+its own bounded queue drained by a background task, so slow rendering (Streamlit,
+a terminal, a file) can never stall a search or an LLM call. When a sink falls
+behind, events with the same coalesce key replace each other and droppable events
+are discarded; final results (learnings, outline, sections, report) are kept.
+Events that must be delivered are never dropped, so a queue can grow past its
+size by their number: at most a few per tree node and per report section.
+"""
+
+import asyncio
+import collections
+import contextvars
+import dataclasses
+import json
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Callable, ClassVar, Deque, Dict, List, Optional, Type
+
+from .logging import log_event, log_warning
+
+
+@dataclass
+class ProgressEvent:
+    kind: ClassVar[str] = "event"
+    # Whether the event may be discarded when a sink's queue is full
+    droppable: ClassVar[bool] = True
+    # Whether a pending event of the same kind may be replaced by a newer one
+    coalesce: ClassVar[bool] = False
+
+    time: float = field(default_factory=time.time, init=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = dataclasses.asdict(self)
+        data.pop("time")
+        return data
+
+
+@dataclass
+class StatusEvent(ProgressEvent):
+    kind: ClassVar[str] = "message"
+    coalesce: ClassVar[bool] = True
+
+    message: str
+
+
+@dataclass
+class JobStatusEvent(ProgressEvent):
+    kind: ClassVar[str] = "status"
+    droppable: ClassVar[bool] = False
+
+    status: str
+    error: Optional[str] = None
+    position: Optional[int] = None
+
+
+@dataclass
+class FeedbackEvent(ProgressEvent):
+    kind: ClassVar[str] = "feedback"
+    droppable: ClassVar[bool] = False
+
+    questions: List[str]
+
+
+@dataclass
+class SerpQueriesEvent(ProgressEvent):
+    kind: ClassVar[str] = "serp_queries"
+
+    query: str
+    queries: List[str]
+
+
+@dataclass
+class SerpResultEvent(ProgressEvent):
+    kind: ClassVar[str] = "serp_result"
+
+    query: str
+    learnings: List[str]
+    follow_up_questions: List[str]
+
+
+@dataclass
+class NoveltyEvent(ProgressEvent):
+    kind: ClassVar[str] = "novelty"
+    # Part of the run trace
+    droppable: ClassVar[bool] = False
+
+    node_id: str
+    query: str
+    novelty: float
+    expanded: bool
+    extra_breadth: int = 0
+
+
+@dataclass
+class CancellationEvent(ProgressEvent):
+    kind: ClassVar[str] = "cancelled"
+    # Part of the run trace
+    droppable: ClassVar[bool] = False
+
+    stage: str
+    cancelled: int
+    completed: int
+    reason: str
+
+
+@dataclass
+class LearningsEvent(ProgressEvent):
+    kind: ClassVar[str] = "learnings"
+    droppable: ClassVar[bool] = False
+
+    learnings: List[str]
+    visited_urls: List[str] = field(default_factory=list)
+
+
+@dataclass
+class OutlineEvent(ProgressEvent):
+    kind: ClassVar[str] = "outline"
+    droppable: ClassVar[bool] = False
+
+    outline: str
+    draft: bool = False
+
+
+@dataclass
+class SectionEvent(ProgressEvent):
+    kind: ClassVar[str] = "section"
+    droppable: ClassVar[bool] = False
+
+    title: str
+    content: str
+
+
+@dataclass
+class ReportEvent(ProgressEvent):
+    kind: ClassVar[str] = "report"
+    droppable: ClassVar[bool] = False
+
+    report: str
+
+
+EVENT_TYPES: Dict[str, Type[ProgressEvent]] = {
+    cls.kind: cls
+    for cls in (
+        StatusEvent,
+        JobStatusEvent,
+        FeedbackEvent,
+        SerpQueriesEvent,
+        SerpResultEvent,
+        NoveltyEvent,
+        CancellationEvent,
+        LearningsEvent,
+        OutlineEvent,
+        SectionEvent,
+        ReportEvent,
+    )
+}
+
+
+def event_from_dict(kind: str, data: Dict[str, Any]) -> Optional[ProgressEvent]:
+    """Rebuilds an event from its `kind` and `to_dict()` form, e.g. from a server stream."""
+    cls = EVENT_TYPES.get(kind)
+    if cls is None:
+        return None
+    names = {f.name for f in dataclasses.fields(cls) if f.init}
+    return cls(**{k: v for k, v in data.items() if k in names})
+
+
+def render_markdown(event: ProgressEvent) -> Optional[str]:
+    """Markdown shown for an event in the chat UI, or None if it isn't shown."""
+    if isinstance(event, StatusEvent):
+        return event.message
+    if isinstance(event, FeedbackEvent):
+        return "\nFollow-up Questions:\n\n" + "\n\n".join(event.questions)
+    if isinstance(event, SerpQueriesEvent):
+        return (
+            f"Generated {len(event.queries)} SERP queries for research query: {event.query}\n\n"
+            f"Got queries: {event.queries}"
+        )
+    if isinstance(event, SerpResultEvent):
+        return "\n".join(f"• {learning}" for learning in event.learnings) or None
+    if isinstance(event, CancellationEvent):
+        return f"Cancelled {event.cancelled} {event.stage} tasks ({event.reason})"
+    if isinstance(event, LearningsEvent):
+        return "\nLearnings:\n\n" + "\n".join(f"• {learning}" for learning in event.learnings)
+    if isinstance(event, OutlineEvent):
+        label = "gen draft outlines" if event.draft else "gen polish outlines"
+        return f"{label}:\n {event.outline}"
+    if isinstance(event, SectionEvent):
+        return event.content
+    if isinstance(event, ReportEvent):
+        return f"\nFinal Report:\n\n{event.report}"
+    return None
+
+
+class EventSink(ABC):
+    """Receives events from an `EventBus` on the bus's background task."""
+
+    @abstractmethod
+    async def handle(self, event: ProgressEvent) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+class NullSink(EventSink):
+    async def handle(self, event: ProgressEvent) -> None:
+        pass
+
+
+class CallbackSink(EventSink):
+    """Hands every event to a cheap synchronous callback, e.g. a queue's put."""
+
+    def __init__(self, callback: Callable[[ProgressEvent], None]):
+        self.callback = callback
+
+    async def handle(self, event: ProgressEvent) -> None:
+        self.callback(event)
+
+
+class ConsoleSink(EventSink):
+    """Renders events on a Rich console."""
+
+    def __init__(self, console=None):
+        if console is None:
+            from ..utils import console
+        self.console = console
+
+    async def handle(self, event: ProgressEvent) -> None:
+        from rich.panel import Panel
+
+        if isinstance(event, StatusEvent):
+            self.console.print(event.message)
+        elif isinstance(event, FeedbackEvent):
+            self.console.print("\n[bold yellow]Follow-up Questions:[/bold yellow]")
+            for i, question in enumerate(event.questions, 1):
+                self.console.print(f"\n[bold blue]Q{i}:[/bold blue] {question}")
+        elif isinstance(event, CancellationEvent):
+            self.console.print(
+                f"[dim]> cancelled {event.cancelled} {event.stage} tasks ({event.reason})[/dim]"
+            )
+        elif isinstance(event, LearningsEvent):
+            self.console.print("\n[yellow]Learnings:[/yellow]")
+            for learning in event.learnings:
+                self.console.print(f"• {learning}")
+        elif isinstance(event, OutlineEvent):
+            label = "Draft outline" if event.draft else "Outline"
+            self.console.print(Panel(event.outline, title=label))
+        elif isinstance(event, SectionEvent):
+            self.console.print(f"[dim]> section written: {event.title}[/dim]")
+        elif isinstance(event, ReportEvent):
+            self.console.print("\n[bold green]Research Complete![/bold green]")
+            self.console.print(Panel(event.report, title="Research Report"))
+        elif isinstance(event, JobStatusEvent):
+            self.console.print(f"[yellow]Job {event.status}[/yellow]")
+
+
+class JsonlSink(EventSink):
+    """Appends every event as a JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    async def handle(self, event: ProgressEvent) -> None:
+        import aiofiles
+
+        if self._file is None:
+            self._file = await aiofiles.open(self.path, "a", encoding="utf-8")
+        record = {"time": event.time, "kind": event.kind, "data": event.to_dict()}
+        await self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    async def close(self) -> None:
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+
+
+class StreamlitSink(EventSink):
+    """Renders events as assistant chat messages in the Streamlit script thread.
+
+    Only usable when the bus runs on the script thread's event loop, i.e. when the
+    pipeline is driven by `asyncio.run` from the page itself.
+    """
+
+    async def handle(self, event: ProgressEvent) -> None:
+        import streamlit as st
+
+        message = render_markdown(event)
+        if message:
+            st.chat_message("assistant").markdown(message)
+
+
+class _SinkQueue:
+    """Coalescing queue feeding one sink, bounded for droppable events.
+
+    Events that must be delivered are queued even when the queue is full.
+    """
+
+    def __init__(self, sink: EventSink, maxsize: int):
+        self.sink = sink
+        self.maxsize = maxsize
+        self.events: Deque[ProgressEvent] = collections.deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+        self.coalesced = 0
+        self.overflowed = False
+
+    def put(self, event: ProgressEvent) -> None:
+        if len(self.events) >= self.maxsize:
+            if event.coalesce:
+                for i, pending in enumerate(self.events):
+                    if pending.kind == event.kind:
+                        del self.events[i]
+                        self.events.append(event)
+                        self.coalesced += 1
+                        return
+            if event.droppable:
+                self.dropped += 1
+                return
+            # Make room for an event that must be delivered
+            for i, pending in enumerate(self.events):
+                if pending.droppable:
+                    del self.events[i]
+                    self.dropped += 1
+                    break
+            else:
+                if not self.overflowed:
+                    self.overflowed = True
+                    log_warning(
+                        "Event sink %s is behind; queueing past %s events",
+                        type(self.sink).__name__,
+                        self.maxsize,
+                    )
+        self.events.append(event)
+        self.ready.set()
+
+    def close(self) -> None:
+        """Makes `run` return once every queued event has been handled."""
+        self.closed = True
+        self.ready.set()
+
+    async def run(self) -> None:
+        while True:
+            await self.ready.wait()
+            while self.events:
+                event = self.events.popleft()
+                try:
+                    await self.sink.handle(event)
+                except Exception as e:
+                    log_warning("Event sink %s failed: %s", type(self.sink).__name__, e)
+            if self.closed:
+                return
+            self.ready.clear()
+
+
+_current_bus: contextvars.ContextVar[Optional["EventBus"]] = contextvars.ContextVar(
+    "event_bus", default=None
+)
+
+
+class EventBus:
+    """Delivers progress events to sinks without blocking the emitter.
+
+    Use as `async with EventBus([...]):`; while the block runs, `emit()` from the
+    current task and the tasks it spawns goes to this bus.
+    """
+
+    def __init__(self, sinks: List[EventSink], maxsize: int = 256):
+        self._queues = [_SinkQueue(sink, maxsize) for sink in sinks]
+        self._tasks: List[asyncio.Task] = []
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def dropped(self) -> int:
+        return sum(q.dropped for q in self._queues)
+
+    @property
+    def coalesced(self) -> int:
+        return sum(q.coalesced for q in self._queues)
+
+    def emit(self, event: ProgressEvent) -> None:
+        for queue in self._queues:
+            queue.put(event)
+
+    async def __aenter__(self) -> "EventBus":
+        self._tasks = [asyncio.create_task(q.run()) for q in self._queues]
+        self._token = _current_bus.set(self)
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        _current_bus.reset(self._token)
+        await self.aclose()
+
+    async def aclose(self, timeout: float = 10.0) -> None:
+        """Waits up to `timeout` seconds for the sinks to handle every event, then stops them."""
+        for queue in self._queues:
+            queue.close()
+        if self._tasks:
+            # Events already taken off a queue finish too; only stragglers are cancelled
+            _, late = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in late:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for queue in self._queues:
+            await queue.sink.close()
+        if self.dropped or self.coalesced:
+            log_event("Event bus dropped %s and coalesced %s events", self.dropped, self.coalesced)
+
+
+def current_bus() -> Optional[EventBus]:
+    return _current_bus.get()
+
+
+def emit(event: ProgressEvent) -> None:
+    """Publishes an event to the bus of the running job; a no-op without one."""
+    bus = _current_bus.get()
+    if bus is not None:
+        bus.emit(event)
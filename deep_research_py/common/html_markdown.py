@@ -0,0 +1,113 @@
+"""Fast HTML-to-markdown extraction with the standard library.
+
+Keeps what matters to the extraction prompt (headings, paragraphs, lists,
+tables as rows, code) and drops scripts, styles and page chrome such as
+navigation and footers. Links keep only their text. This is meant to run in a
+worker process, so it is a plain module-level function of a string.
+"""
+
+import re
+from html import unescape
+from html.parser import HTMLParser
+from typing import List, Optional
+
+# Elements whose content is never part of the article
+_SKIP = {"script", "style", "noscript", "svg", "template", "head", "nav", "footer", "form", "iframe"}
+_BLOCK = {
+    "p", "div", "section", "article", "main", "header", "aside", "blockquote",
+    "table", "tr", "ul", "ol", "dl", "dt", "dd", "figure", "figcaption", "br", "hr",
+}
+_HEADINGS = {"h1": "#", "h2": "##", "h3": "###", "h4": "####", "h5": "#####", "h6": "######"}
+_SPACES = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+class _MarkdownParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip_depth = 0
+        self.pre_depth = 0
+        self.title: Optional[str] = None
+        self._in_title = False
+
+    def _newline(self, count: int = 1) -> None:
+        self.parts.append("\n" * count)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP:
+            self.skip_depth += 1
+            return
+        if tag == "title":
+            self._in_title = True
+        if self.skip_depth:
+            return
+        if tag in _HEADINGS:
+            self._newline(2)
+            self.parts.append(_HEADINGS[tag] + " ")
+        elif tag == "li":
+            self._newline()
+            self.parts.append("- ")
+        elif tag == "pre":
+            self.pre_depth += 1
+            self._newline(2)
+            self.parts.append("```\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+        elif tag in ("strong", "b"):
+            self.parts.append("**")
+        elif tag in _BLOCK:
+            self._newline(2 if tag == "p" else 1)
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP:
+            self.skip_depth = max(0, self.skip_depth - 1)
+            return
+        if tag == "title":
+            self._in_title = False
+        if self.skip_depth:
+            return
+        if tag in _HEADINGS:
+            self._newline(2)
+        elif tag == "pre":
+            self.pre_depth = max(0, self.pre_depth - 1)
+            self.parts.append("\n```")
+            self._newline(2)
+        elif tag in ("strong", "b"):
+            self.parts.append("**")
+        elif tag in _BLOCK:
+            self._newline(2 if tag == "p" else 1)
+
+    def handle_data(self, data):
+        if self._in_title and self.title is None:
+            self.title = data.strip()
+        if self.skip_depth:
+            return
+        if self.pre_depth:
+            self.parts.append(data)
+        else:
+            self.parts.append(_SPACES.sub(" ", data.replace("\n", " ")))
+
+
+def html_to_markdown(html: str) -> str:
+    """Markdown text of an HTML page; the page title becomes a top heading."""
+    parser = _MarkdownParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # Broken markup: keep whatever was parsed so far
+        pass
+    text = "".join(parser.parts)
+    lines = []
+    in_code = False
+    for line in text.split("\n"):
+        if line.strip() == "```":
+            in_code = not in_code
+        lines.append(line.rstrip() if in_code else line.strip())
+    text = _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+    # "**" pairs around nothing, left by empty bold tags
+    text = text.replace("****", "")
+    if parser.title and not text.startswith("# "):
+        text = f"# {unescape(parser.title)}\n\n{text}"
+    return text
@@ -1,55 +1,205 @@
-import logging
+"""Application logging.
+
+Records are handed to a `QueueHandler` and written by a `QueueListener` on a
+background thread, so the event loop never waits for disk I/O. Messages take
+%-style arguments that are only formatted by the writer thread, and only when
+the level is enabled. Each run writes structured JSONL records (tagged with the
+current run and research node id) to its own file, which is rotated and
+gzip-compressed once it grows past `max_bytes`.
+"""
+
+import atexit
+import collections
+import contextvars
+import copy
 import datetime
+import gzip
+import json
+import logging
+import logging.handlers
 import os
+import queue
+import shutil
+from typing import Any, List, Optional
+
+LOGGER_NAME = "deep_research_py"
 
 logger = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+_run_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("run_id", default=None)
+_node_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("node_id", default=None)
+
+
+def set_log_context(run_id: Optional[str] = None, node_id: Optional[str] = None) -> None:
+    """Tags records logged by the current task (and tasks it spawns) with run/node ids."""
+    if run_id is not None:
+        _run_id.set(run_id)
+    if node_id is not None:
+        _node_id.set(node_id)
+
+
+def get_node_id() -> Optional[str]:
+    return _node_id.get()
+
+
+class _ContextFilter(logging.Filter):
+    """Captures the run/node ids on the logging thread, before the record is queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.run_id = _run_id.get()
+        record.node_id = _node_id.get()
+        return True
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queues records without formatting them; the listener thread does that."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "run_id": getattr(record, "run_id", None),
+            "node_id": getattr(record, "node_id", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
 
+def log_file_path(logging_path: str, log_file_name: str) -> str:
+    """Path of the JSONL log file `initial_logger` writes for a run."""
+    return os.path.join(logging_path, f"{log_file_name}.jsonl")
 
-def initial_logger(logging_path: str = "log", enable_stdout: bool = False, log_file_name="") -> None:
-    """Initializes the logger for the application."""
-    global logger
+
+def initial_logger(
+    logging_path: str = "log",
+    enable_stdout: bool = False,
+    log_file_name="",
+    run_id: Optional[str] = None,
+    max_bytes: int = 20 * 1024 * 1024,
+    backup_count: int = 5,
+) -> str:
+    """Initializes the logger for the application and returns the log file path."""
+    global logger, _listener
     # 清除现有的日志处理器
-    if logger:
-        for handler in logger.handlers[:]:
-            logger.removeHandler(handler)
-            handler.close()
+    shutdown_logger()
 
-    now = datetime.datetime.now()
-    log_file = os.path.join(
-        logging_path, f"{log_file_name}.log"
-    )
+    log_file = log_file_path(logging_path, log_file_name)
     if not os.path.exists(logging_path):
         os.makedirs(logging_path)
 
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter())
+    handlers: List[logging.Handler] = [file_handler]
+
     # Set up logging to stdout if enabled
-    handlers = [logging.FileHandler(log_file)]
     if enable_stdout:
-        handlers.append(logging.StreamHandler())
-    # Set up logging to a file
-    logging.basicConfig(
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", handlers=handlers,
-        force=True
-    )
-    logger = logging.getLogger(log_file_name)
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        handlers.append(stream_handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.unregister(shutdown_logger)
+    atexit.register(shutdown_logger)
+
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(_ContextFilter())
+
+    # Our own logger only; the root logger and other libraries are left alone
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.handlers = [queue_handler]
+    logger.propagate = False
     logger.setLevel(logging.INFO)
 
+    set_log_context(run_id=run_id or log_file_name)
+    return log_file
 
-def log_event(event_desc: str) -> None:
-    """Logs an event with input and output token counts."""
+
+def shutdown_logger() -> None:
+    """Flushes queued records and stops the writer thread."""
+    global logger, _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+    if logger:
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+            handler.close()
+        logger = None
+
+
+def log_event(event_desc: str, *args: Any) -> None:
+    """Logs an event; `args` are %-formatted lazily into `event_desc`."""
     if not logger:
         return
-    logger.info(f"Event: {event_desc}")
+    logger.info(event_desc, *args)
 
 
-def log_error(error_desc: str) -> None:
+def log_error(error_desc: str, *args: Any) -> None:
     """Logs an error message."""
     if not logger:
         return
-    logger.error(f"Error: {error_desc}")
+    logger.error(error_desc, *args)
 
 
-def log_warning(warning_desc: str) -> None:
+def log_warning(warning_desc: str, *args: Any) -> None:
     """Logs a warning message."""
     if not logger:
         return
-    logger.warning(f"Warning: {warning_desc}")
+    logger.warning(warning_desc, *args)
+
+
+class LogTail:
+    """Incrementally reads a log file, keeping only the last `max_lines` lines."""
+
+    def __init__(self, path: str, max_lines: int = 500):
+        self.path = path
+        self.lines = collections.deque(maxlen=max_lines)
+        self._offset = 0
+        self._partial = ""
+
+    def read_new(self) -> List[str]:
+        """Returns the complete lines appended since the previous call."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8", errors="replace") as f:
+            f.seek(self._offset)
+            chunk = f.read()
+            self._offset = f.tell()
+        if not chunk:
+            return []
+        text = self._partial + chunk
+        new_lines = text.split("\n")
+        self._partial = new_lines.pop()
+        self.lines.extend(new_lines)
+        return new_lines
@@ -0,0 +1,197 @@
+"""Profiling of a research run (`answer_main(profile=True)`).
+
+Three views of where the time went:
+
+- A statistical profile of the event-loop thread: a background thread samples
+  its Python stack every few milliseconds. The stacks are written in the folded
+  format that `flamegraph.pl`, speedscope and most flamegraph viewers read.
+- Event-loop lag: how late a heartbeat coroutine wakes up. Long lags mean
+  something blocked the loop.
+- Time attributed per stage to awaiting the LLM, waiting for a completion slot
+  (queue), awaiting search and page fetches, and local CPU work on text.
+  Concurrent calls are summed, so these add up to more than the wall time.
+
+When no run is being profiled, `timed` costs one context variable lookup.
+"""
+
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+CATEGORIES = ("llm", "queue", "search", "cpu")
+
+# Frames the event loop sits in while it waits for I/O
+_IDLE_FRAMES = {("selectors.py", "select")}
+
+
+class RunProfiler:
+    """Samples the thread it is started on and collects stage timings.
+
+    Args:
+        interval: Seconds between stack samples.
+        lag_interval: Seconds between event-loop heartbeats.
+    """
+
+    def __init__(self, interval: float = 0.005, lag_interval: float = 0.05):
+        self.interval = interval
+        self.lag_interval = lag_interval
+        self.stacks: Counter = Counter()
+        self.idle_samples = 0
+        self.lags: List[float] = []
+        self.stage_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.stage_calls: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._started = 0.0
+        self._cpu_started = 0.0
+
+    def add(self, category: str, stage: str, seconds: float) -> None:
+        self.stage_seconds[(stage, category)] += seconds
+        self.stage_calls[(stage, category)] += 1
+
+    def _sample(self, thread_id: int) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            if (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                self.idle_samples += 1
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+
+    async def _beat(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.lag_interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.lag_interval))
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._cpu_started = time.process_time()
+        self._sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(),), name="profiler", daemon=True
+        )
+        self._sampler.start()
+        self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+
+    async def stop(self) -> None:
+        self.wall_time = time.perf_counter() - self._started
+        self.cpu_time = time.process_time() - self._cpu_started
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+        if self._sampler is not None:
+            self._sampler.join()
+
+    def folded(self) -> str:
+        """The samples in folded-stack format, one `frame;frame;frame count` per line."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top: int = 15) -> str:
+        samples = sum(self.stacks.values())
+        busy = samples - self.idle_samples
+        lines = [
+            f"Wall time: {self.wall_time:.1f} s, process CPU time: {self.cpu_time:.1f} s",
+        ]
+        if samples:
+            lines.append(
+                f"Event loop busy in {busy / samples:.0%} of {samples} samples "
+                f"(every {self.interval * 1000:.0f} ms)"
+            )
+        if self.lags:
+            ordered = sorted(self.lags)
+            lines.append(
+                f"Event loop lag: p50 {ordered[len(ordered) // 2] * 1000:.1f} ms, "
+                f"p99 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000:.1f} ms, "
+                f"max {ordered[-1] * 1000:.1f} ms ({len(ordered)} heartbeats)"
+            )
+
+        stages = sorted({stage for stage, _ in self.stage_seconds})
+        if stages:
+            lines += ["", "Seconds awaited per stage (concurrent calls are summed):"]
+            lines.append(f"{'stage':<24}" + "".join(f"{c:>9}" for c in CATEGORIES) + f"{'calls':>7}")
+            for stage in stages:
+                row = "".join(
+                    f"{self.stage_seconds[(stage, c)]:>9.2f}" if (stage, c) in self.stage_seconds else f"{'-':>9}"
+                    for c in CATEGORIES
+                )
+                calls = max(self.stage_calls[(stage, c)] for c in CATEGORIES if (stage, c) in self.stage_calls)
+                lines.append(f"{stage:<24}{row}{calls:>7}")
+
+        if busy:
+            own: Counter = Counter()
+            for stack, count in self.stacks.items():
+                leaf = stack.rsplit(";", 1)[-1]
+                own[leaf] += count
+            lines += ["", "Busiest functions on the event loop (own samples):"]
+            for frame, count in own.most_common(top + len(_IDLE_FRAMES)):
+                if count == 0 or any(frame.startswith(name + " (" + path) for path, name in _IDLE_FRAMES):
+                    continue
+                lines.append(f"{count / samples:>6.1%}  {frame}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, prefix: str) -> Tuple[str, str]:
+        """Writes `<prefix>.profile.folded` and `<prefix>.profile.txt`; returns both paths."""
+        folded_path, summary_path = f"{prefix}.profile.folded", f"{prefix}.profile.txt"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            f.write(self.folded())
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(self.summary())
+            f.write(f"\nFlamegraph input: {os.path.basename(folded_path)} (flamegraph.pl, speedscope)\n")
+        return folded_path, summary_path
+
+
+_profiler: contextvars.ContextVar[Optional[RunProfiler]] = contextvars.ContextVar(
+    "profiler", default=None
+)
+
+
+def get_profiler() -> Optional[RunProfiler]:
+    return _profiler.get()
+
+
+@contextmanager
+def timed(category: str, stage: str) -> Iterator[None]:
+    """Adds the time spent in the block to `stage` of the run's profile, if any."""
+    profiler = _profiler.get()
+    if profiler is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.add(category, stage, time.perf_counter() - start)
+
+
+@asynccontextmanager
+async def profile_run(enabled: bool = True) -> AsyncIterator[Optional[RunProfiler]]:
+    """Profiles the block and every task it starts; yields None when not `enabled`."""
+    if not enabled:
+        yield None
+        return
+    profiler = RunProfiler()
+    token = _profiler.set(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        await profiler.stop()
+        _profiler.reset(token)
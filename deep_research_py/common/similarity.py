@@ -0,0 +1,32 @@
+"""Cheap lexical similarity used to spot near-duplicate text without a model call.
+
+Text is reduced to character shingles, which works the same for English and
+Chinese (no word segmentation needed), and compared with Jaccard similarity.
+"""
+
+import re
+from typing import FrozenSet, Iterable
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_text(text: str) -> str:
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Character n-grams of the normalized text."""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i : i + size] for i in range(len(text) - size + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def max_similarity(candidate: FrozenSet[str], others: Iterable[FrozenSet[str]]) -> float:
+    return max((jaccard(candidate, other) for other in others), default=0.0)
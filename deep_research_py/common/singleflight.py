@@ -0,0 +1,125 @@
+"""Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, further calls for the same key wait for its
+result instead of running again. Nothing is kept once the call finishes, so this
+is not a cache: it only removes duplicate work that overlaps in time, e.g. two
+sibling branches searching the same query, or two jobs on the same topic.
+
+Flights are shared across event loops (threads), so the Streamlit sessions, each
+running on its own loop, coalesce with each other too.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _Abandoned(Exception):
+    """The leading call was cancelled before it finished (e.g. its loop shut down)."""
+
+
+class _Flight:
+    __slots__ = ("future", "waiters", "loop", "task")
+
+    def __init__(self):
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.waiters = 0
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one in-flight call."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.enabled = True
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Returns `await fn()`, or the result of a call already in flight for `key`."""
+        if not self.enabled:
+            return await fn()
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+            flight.waiters += 1
+
+        if leader:
+            flight.loop = asyncio.get_running_loop()
+            flight.task = flight.loop.create_task(self._run(key, flight, fn))
+
+        try:
+            # shield: a caller giving up must not cancel the call for the others
+            return await asyncio.shield(asyncio.wrap_future(flight.future))
+        except asyncio.CancelledError:
+            self._leave(key, flight)
+            raise
+        except _Abandoned:
+            return await fn()
+
+    async def _run(self, key: Hashable, flight: _Flight, fn: Callable[[], Awaitable[T]]) -> None:
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            self._finish(key, flight)
+            if flight.waiters > 0:
+                flight.future.set_exception(_Abandoned())
+            else:
+                flight.future.cancel()
+        except BaseException as e:
+            self._finish(key, flight)
+            flight.future.set_exception(e)
+        else:
+            self._finish(key, flight)
+            flight.future.set_result(result)
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _leave(self, key: Hashable, flight: _Flight) -> None:
+        with self._lock:
+            flight.waiters -= 1
+            if flight.waiters > 0 or flight.future.done():
+                return
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        # Nobody is waiting any more
+        flight.loop.call_soon_threadsafe(flight.task.cancel)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+def request_key(*parts: Any) -> str:
+    """Stable hash of JSON-serializable request parts."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+search_flight = SingleFlight("search")
+completion_flight = SingleFlight("completions")
+
+
+def set_coalescing(enabled: bool) -> None:
+    search_flight.enabled = enabled
+    completion_flight.enabled = enabled
+
+
+def coalescing_stats() -> Dict[str, Dict[str, int]]:
+    return {flight.name: flight.stats() for flight in (search_flight, completion_flight)}
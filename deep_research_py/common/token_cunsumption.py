@@ -1,4 +1,10 @@
+from collections import OrderedDict
 from dataclasses import dataclass
+from typing import Dict
+
+# Coalesced calls get their shared response at the same time, so only recent ids
+# need remembering
+MAX_COUNTED_RESPONSES = 1024
 
 
 @dataclass
@@ -7,10 +13,12 @@ class TokenUsageEvent:
     input_tokens: int
     output_tokens: int
     reasoning_tokens: int
+    model: str = ""
 
     def __repr__(self):
         return (
             f"TokenUsageEvent(event={self.event}, "
+            f"model={self.model}, "
             f"input_tokens={self.input_tokens}, "
             f"output_tokens={self.output_tokens}, "
             f"reasoning_tokens={self.reasoning_tokens})"
@@ -23,6 +31,8 @@ class TokenCounter:
         self.total_input_tokens = 0
         self.total_output_tokens = 0
         self.total_reasoning_tokens = 0
+        # Ids of the responses counted most recently; coalesced calls share a response
+        self.counted_responses: "OrderedDict[str, None]" = OrderedDict()
 
     def add_event(self, event: TokenUsageEvent):
         self.token_usage.append(event)
@@ -30,6 +40,41 @@ class TokenCounter:
         self.total_output_tokens += event.output_tokens
         self.total_reasoning_tokens += event.reasoning_tokens
 
+    def first_count(self, response_id: str) -> bool:
+        """Whether this response is not counted yet; remembers the last `MAX_COUNTED_RESPONSES` ids."""
+        if response_id in self.counted_responses:
+            return False
+        self.counted_responses[response_id] = None
+        if len(self.counted_responses) > MAX_COUNTED_RESPONSES:
+            self.counted_responses.popitem(last=False)
+        return True
+
+    def by_stage(self) -> Dict[str, Dict[str, int]]:
+        """Calls and tokens per pipeline stage."""
+        stages: Dict[str, Dict[str, int]] = {}
+        for event in self.token_usage:
+            stage = stages.setdefault(
+                event.event, {"calls": 0, "input": 0, "output": 0, "reasoning": 0}
+            )
+            stage["calls"] += 1
+            stage["input"] += event.input_tokens
+            stage["output"] += event.output_tokens
+            stage["reasoning"] += event.reasoning_tokens
+        return stages
+
+    def by_model(self) -> Dict[str, Dict[str, int]]:
+        """Calls and tokens per model, as reported by the provider."""
+        models: Dict[str, Dict[str, int]] = {}
+        for event in self.token_usage:
+            model = models.setdefault(
+                event.model or "unknown", {"calls": 0, "input": 0, "output": 0, "reasoning": 0}
+            )
+            model["calls"] += 1
+            model["input"] += event.input_tokens
+            model["output"] += event.output_tokens
+            model["reasoning"] += event.reasoning_tokens
+        return models
+
     def __repr__(self):
         return (
             f"TokenCounter(total_input_tokens={self.total_input_tokens}, "
@@ -43,23 +88,27 @@ counter = TokenCounter()
 
 
 def count_token_consume(
-    event: str, input_tokens: int, output_tokens: int, reasoning_tokens: int
+    event: str, input_tokens: int, output_tokens: int, reasoning_tokens: int, model: str = ""
 ):
     """Counts the token consumption for a given event."""
-    event = TokenUsageEvent(event, input_tokens, output_tokens, reasoning_tokens)
+    event = TokenUsageEvent(event, input_tokens, output_tokens, reasoning_tokens, model)
     counter.add_event(event)
 
 
 def parse_openai_token_consume(event: str, response):
     """Parses the token consumption from OpenAI API response."""
+    if response.id and not counter.first_count(response.id):
+        return
     input_tokens = response.usage.prompt_tokens
     output_tokens = response.usage.completion_tokens
-    reasoning_tokens = response.usage.completion_tokens_details.reasoning_tokens
+    details = response.usage.completion_tokens_details
+    reasoning_tokens = (details.reasoning_tokens if details else 0) or 0
     count_token_consume(
         event=event,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         reasoning_tokens=reasoning_tokens,
+        model=getattr(response, "model", "") or "",
     )
 
 
@@ -72,4 +121,5 @@ def parse_ollama_token_consume(event: str, response):
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         reasoning_tokens=0,
+        model=getattr(response, "model", "") or "",
     )
@@ -0,0 +1,207 @@
+"""Content-addressed disk store for fetched page bodies.
+
+Search results can carry whole pages. Instead of keeping them as Python strings
+for the life of a research branch, each body is written once to
+`<root>/<2 hex>/<sha256>` (zlib-compressed by default) and the result only keeps a
+small `ContentHandle`. Readers pull at most the prefix they need, in chunks, so
+memory stays bounded however large the page. Identical pages share one file
+across queries, sessions and runs.
+
+The store prunes itself: when it is opened and after every `PRUNE_EVERY` writes,
+a background thread deletes the bodies not used for `max_age_seconds`, then the
+least recently used ones until the store is under `max_bytes`.
+"""
+
+import codecs
+import hashlib
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from typing import Iterator, Optional
+
+from .common.logging import log_event
+
+CHUNK_SIZE = 64 * 1024
+PRUNE_EVERY = 1000
+# Stored bodies; temporary files of writes in progress are left alone
+BODY_NAME = re.compile(r"^[0-9a-f]{64}(\.z)?$")
+
+
+class ContentHandle:
+    """Reference to a stored body; `size` is its length in characters."""
+
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest: str, size: int):
+        self.digest = digest
+        self.size = size
+
+    def __repr__(self) -> str:
+        return f"ContentHandle({self.digest[:12]}, {self.size} chars)"
+
+
+class ContentStore:
+    """Stores page bodies on disk by their SHA-256.
+
+    Args:
+        root: Directory of the store; shared by every run that uses it.
+        compress: zlib-compress bodies. Uncompressed bodies are read through mmap.
+        max_age_seconds: Bodies not stored or reused for this long are pruned.
+        max_bytes: The store is pruned, least recently used first, to this size.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        compress: bool = True,
+        max_age_seconds: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.root = root
+        self.compress = compress
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.hits = 0
+        self.pruned = 0
+        self._pruning: Optional[threading.Thread] = None
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        suffix = ".z" if self.compress else ""
+        return os.path.join(self.root, digest[:2], digest + suffix)
+
+    def put(self, text: str) -> ContentHandle:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        handle = ContentHandle(digest, len(text))
+        path = self._path(digest)
+        if os.path.exists(path):
+            self.hits += 1
+            # Keep pages that are still being used out of reach of `prune`
+            os.utime(path)
+            return handle
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(data, 6) if self.compress else data)
+        # Concurrent writers of the same page produce the same bytes
+        os.replace(tmp_path, path)
+        self.writes += 1
+        if self.writes % PRUNE_EVERY == 0:
+            self.prune_in_background()
+        return handle
+
+    def iter_bytes(self, handle: ContentHandle) -> Iterator[bytes]:
+        """Yields the UTF-8 body in chunks without loading it whole."""
+        with open(self._path(handle.digest), "rb") as f:
+            if self.compress:
+                decompressor = zlib.decompressobj()
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield decompressor.decompress(chunk)
+                yield decompressor.flush()
+            elif os.fstat(f.fileno()).st_size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    for start in range(0, len(mapped), CHUNK_SIZE):
+                        yield mapped[start : start + CHUNK_SIZE]
+
+    def read(self, handle: ContentHandle, max_chars: Optional[int] = None) -> str:
+        """Returns the body, or only its first `max_chars` characters."""
+        # Chunks may split a multi-byte character
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parts = []
+        length = 0
+        for chunk in self.iter_bytes(handle):
+            text = decoder.decode(chunk)
+            parts.append(text)
+            length += len(text)
+            if max_chars is not None and length >= max_chars:
+                break
+        text = "".join(parts)
+        return text if max_chars is None else text[:max_chars]
+
+    def prune(self, max_age_seconds: Optional[float] = None, max_bytes: Optional[int] = None) -> int:
+        """Deletes bodies not stored or reused for `max_age_seconds`, then the least
+        recently used ones until the store holds at most `max_bytes`; returns the count."""
+        bodies = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not BODY_NAME.match(name):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                bodies.append((stat.st_mtime, stat.st_size, path))
+        bodies.sort()
+        cutoff = time.time() - max_age_seconds if max_age_seconds is not None else None
+        total = sum(size for _, size, _ in bodies)
+        removed = 0
+        for mtime, size, path in bodies:
+            expired = cutoff is not None and mtime < cutoff
+            if not expired and (max_bytes is None or total <= max_bytes):
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another process pruned it first
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def prune_in_background(self) -> None:
+        """Prunes to the store's limits in a daemon thread, unless one is running."""
+        if self.max_age_seconds is None and self.max_bytes is None:
+            return
+        if self._pruning is not None and self._pruning.is_alive():
+            return
+
+        def prune() -> None:
+            removed = self.prune(self.max_age_seconds, self.max_bytes)
+            self.pruned += removed
+            if removed:
+                log_event("Pruned %s pages from the content store", removed)
+
+        self._pruning = threading.Thread(target=prune, name="content-store-prune", daemon=True)
+        self._pruning.start()
+
+    def stats(self) -> dict:
+        return {"writes": self.writes, "hits": self.hits, "pruned": self.pruned}
+
+
+_content_store: Optional[ContentStore] = None
+
+
+def get_content_store() -> ContentStore:
+    """The process-wide store, in `CONTENT_STORE_DIR` (default `.deep_research/content`).
+
+    Pages unused for `CONTENT_STORE_MAX_AGE_DAYS` (default 7) are pruned, and the
+    store is kept under `CONTENT_STORE_MAX_MB` (default 1024); 0 turns a limit off.
+    """
+    global _content_store
+    if _content_store is None:
+        max_age_days = float(os.getenv("CONTENT_STORE_MAX_AGE_DAYS", "7"))
+        max_mb = float(os.getenv("CONTENT_STORE_MAX_MB", "1024"))
+        _content_store = ContentStore(
+            os.getenv("CONTENT_STORE_DIR", os.path.join(".deep_research", "content")),
+            compress=os.getenv("CONTENT_STORE_COMPRESS", "1") != "0",
+            max_age_seconds=max_age_days * 24 * 60 * 60 if max_age_days > 0 else None,
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None,
+        )
+        _content_store.prune_in_background()
+    return _content_store
+
+
+def set_content_store(store: Optional[ContentStore]) -> None:
+    global _content_store
+    _content_store = store
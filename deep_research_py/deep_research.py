@@ -1,23 +1,42 @@
-from typing import List, Dict, TypedDict, Optional
+from typing import TYPE_CHECKING, List, Dict, Tuple, TypedDict, Optional
 import asyncio
 import os
-import openai
-from firecrawl import FirecrawlApp
-from .ai.providers import trim_prompt, generate_completions
+from .ai.providers import generate_completions
+from .ai.routing import stage_context_window
 from .prompt import system_prompt
-from .common.logging import log_event, log_error
+from .common.cpu import extract, trim
+from .common.deadline import gather_partial, record_cancellation, timeout_for
+from .common.profiling import timed
+from .common.logging import get_node_id, log_error, log_event, log_warning, set_log_context
+from .common.events import (
+    NoveltyEvent,
+    OutlineEvent,
+    SerpQueriesEvent,
+    SerpResultEvent,
+    StatusEvent,
+    emit,
+)
 from .common.token_cunsumption import (
     parse_ollama_token_consume,
     parse_openai_token_consume,
 )
-from .utils import get_service
+from .common.singleflight import search_flight
+from .cassette import get_cassette
+from .content_store import get_content_store
+from .digest import compress_learnings
+from .fetcher import fill_missing_contents, get_page_fetcher
+from .knowledge_base import KnowledgeBase, KnowledgeUsage, get_knowledge_base
+from .novelty import NoveltyTracker
+from .query_registry import QueryRegistry
+from .research_store import BranchView, ResearchStore
+from .search import get_search_router, normalize_query
+from .utils import get_service, load_env
 import json
+from dataclasses import dataclass, field
 from pydantic import BaseModel
-import requests
-import httpx
-from datetime import datetime
-import re
-import streamlit as st
+
+if TYPE_CHECKING:
+    import openai
 
 class SearchResponse(TypedDict):
     data: List[Dict[str, str]]
@@ -28,98 +47,62 @@ class ResearchResult(TypedDict):
     visited_urls: List[str]
 
 
+def combine_query(query: str, follow_up_questions: List[str], answers: List[str]) -> str:
+    """Combines the initial query with the follow-up Q&A into the research prompt."""
+    return f"""
+    Initial Query: {query}
+    Follow-up Questions and Answers:
+    {chr(10).join(f"Q: {q} A: {a}" for q, a in zip(follow_up_questions, answers))}
+    """
+
+
 class SerpQuery(BaseModel):
     query: str
     research_goal: str
+    # The model's 1-10 estimate of how much new information the query will bring;
+    # only requested by the best-first planner
+    expected_value: Optional[float] = None
 
 
-def bing_search(query, limit=5):
-    url = 'https://tgenerator.aicubes.cn/iwc-index-search-engine/search_engine/v1/search'
-    
-    params = {
-        'query': query,
-        # 'se': 'BAIDU',
-        'se': 'BING',
-        'limit': limit,
-        'user_id': 'test',
-        'app_id': 'test',
-        'trace_id': 'test',
-        'with_content': True
-    }
-
-    header = {
-        'X-Arsenal-Auth': 'arsenal-tools'
-    }
-    try:
-        response_dic = requests.post(url, data=params, headers=header)
-        # async with httpx.AsyncClient() as client:
-        #     response_dic = await client.post(url, data=params, headers=header)
-
-        if response_dic.status_code == 200:
-            response =  json.loads(response_dic.text)['data']
-
-            # 替换为serapi googlesearch的格式
-
-            organic_results_lst = []
-            for idx, t in enumerate(response):
-                position = idx +1
-                title = t['title'] if t['title'] else ""
-                link = t['url']
-                snippet = t['summary'] if t['summary'] else ""
-                date = t['publish_time'] if t['publish_time'] else ""
-                source = t['data_source'] if t['data_source'] else ""
-                content = t['content'] if t['content'] else ""
-
-
-                if date:
-                    dt_object = datetime.fromtimestamp(date)
-                    formatted_time = dt_object.strftime("%Y-%m-%d %H:%M:%S")
-                    date = formatted_time
-                    
-
-                organic_results_lst.append({
-                    "position": position,
-                    "title": title,
-                    "url": link,
-                    "snippet": snippet,
-                    "date": date,
-                    "source": source,
-                    "content": content
-                })
-            
-            # res = {
-            #     "search_parameters": response_dic.json()['header'],
-            #     "organic_results": organic_results_lst
-            # }
-
-            return organic_results_lst
-
-        else:
-            print(f"搜索失败，状态码：{response.status_code}")
-            return []
-    except Exception as e:
-        print(f"请求发生错误：{str(e)}")
-        return []  # 出现异常时也返回空列表
-
 class Firecrawl:
     """Simple wrapper for Firecrawl SDK."""
 
-    def __init__(self, api_key: str = "", api_url: Optional[str] = None):
-        self.app = FirecrawlApp(api_key=api_key, api_url=api_url)
+    def __init__(self, api_key: Optional[str] = None, api_url: Optional[str] = None):
+        self.api_key = api_key
+        self.api_url = api_url
+        self._app = None
+
+    @property
+    def app(self):
+        """The Firecrawl SDK client, created on first use from the environment."""
+        if self._app is None:
+            from firecrawl import FirecrawlApp
+
+            load_env()
+            self._app = FirecrawlApp(
+                api_key=self.api_key or os.environ.get("FIRECRAWL_API_KEY", ""),
+                api_url=self.api_url or os.environ.get("FIRECRAWL_BASE_URL"),
+            )
+        return self._app
 
     async def search(
         self, query: str, timeout: int = 15000, limit: int = 5
     ) -> SearchResponse:
-        """Search using Firecrawl SDK in a thread pool to keep it async."""
+        """Searches the configured engines; `timeout` is in milliseconds.
+
+        The search never outlasts the run's deadline; past it, nothing is searched.
+        """
+        seconds = timeout_for(timeout / 1000)
+        if seconds is not None and seconds <= 0:
+            record_cancellation("search", 1, 0, "deadline")
+            return {"data": []}
         try:
-            # Run the synchronous SDK call in a thread pool
-            response = await asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: bing_search(
-                    query=query, limit=limit
-                ),
+            # Spread over the configured engines, hedging slow ones. Concurrent
+            # searches for the same query share one request.
+            response = await search_flight.do(
+                (normalize_query(query), limit),
+                lambda: _search_and_stash(query, limit, seconds),
             )
-            # response = await bing_search(query)
 
             # Handle the response format from the SDK
             if isinstance(response, dict) and "data" in response:
@@ -158,11 +141,92 @@ class Firecrawl:
             return {"data": []}
 
 
-# Initialize Firecrawl
-firecrawl = Firecrawl(
-    api_key=os.environ.get("FIRECRAWL_API_KEY", ""),
-    api_url=os.environ.get("FIRECRAWL_BASE_URL"),
-)
+# Initialize Firecrawl; the SDK client itself is only created when needed
+firecrawl = Firecrawl()
+
+# Characters of a stored page body read into an extraction prompt (~25k tokens)
+MAX_CONTENT_CHARS = 100_000
+# Tokens of one page in an extraction prompt
+MAX_PAGE_TOKENS = 25_000
+# Tokens of an extraction call left for the instructions and the answer
+EXTRACTION_RESERVE_TOKENS = 8_000
+# Tokens of one page however small the context window
+MIN_PAGE_TOKENS = 500
+# Once this share of a level's branches is done, the rest get 3x as long as that took
+BRANCH_QUORUM = 0.8
+
+_small_windows = set()
+
+
+def page_token_budget(window: int, pages: int) -> int:
+    """Tokens each of `pages` pages may take in an extraction call to a `window`-token model."""
+    # Small windows keep at most a quarter for the instructions and the answer
+    reserve = min(EXTRACTION_RESERVE_TOKENS, window // 4)
+    tokens = min(MAX_PAGE_TOKENS, (window - reserve) // max(pages, 1))
+    if tokens < MIN_PAGE_TOKENS:
+        if window not in _small_windows:
+            _small_windows.add(window)
+            log_warning(
+                "Context window of %s tokens is too small for %s pages; "
+                "giving each %s tokens, prompts may be cut off",
+                window,
+                pages,
+                MIN_PAGE_TOKENS,
+            )
+        tokens = MIN_PAGE_TOKENS
+    return tokens
+
+
+def stash_contents(results: List[Dict]) -> List[Dict]:
+    """Moves page bodies to the content store, leaving a `content_ref` handle."""
+    store = get_content_store()
+    for item in results:
+        content = item.pop("content", None) if isinstance(item, dict) else None
+        if content:
+            item["content_ref"] = store.put(content)
+    return results
+
+
+async def _search_and_fetch(query: str, limit: int, timeout: float) -> List[Dict]:
+    with timed("search", "search"):
+        results = await get_search_router().search(query, limit=limit, timeout=timeout)
+    # Results without a page body are fetched, all at once, instead of
+    # contributing only their snippet
+    fetcher = get_page_fetcher()
+    if fetcher is not None:
+        with timed("search", "fetch"):
+            results = await fill_missing_contents(results, fetcher)
+    return results
+
+
+async def _search_and_stash(query: str, limit: int, timeout: float) -> List[Dict]:
+    cassette = get_cassette()
+    if cassette is None:
+        results = await _search_and_fetch(query, limit, timeout)
+    else:
+        results = await cassette.search(
+            normalize_query(query), limit, lambda: _search_and_fetch(query, limit, timeout)
+        )
+    return await asyncio.get_running_loop().run_in_executor(None, stash_contents, results)
+
+
+async def read_contents(search_result: SearchResponse, max_chars: int = MAX_CONTENT_CHARS) -> List[str]:
+    """Page texts of a search result: inline markdown, or a prefix of the stored body."""
+    loop = asyncio.get_running_loop()
+    store = get_content_store()
+    contents = []
+    for item in search_result["data"]:
+        if item.get("markdown"):
+            contents.append(item["markdown"])
+        elif item.get("content_ref") is not None:
+            try:
+                contents.append(
+                    await loop.run_in_executor(None, store.read, item["content_ref"], max_chars)
+                )
+            except FileNotFoundError:
+                # Pruned while the search was being processed
+                log_error("Page content %s was pruned from the store", item["content_ref"])
+    return contents
 
 
 class SerpQueryResponse(BaseModel):
@@ -171,10 +235,12 @@ class SerpQueryResponse(BaseModel):
 
 async def generate_serp_queries(
     query: str,
-    client: openai.OpenAI,
+    client: "openai.OpenAI",
     model: str,
     num_queries: int = 3,
     learnings: Optional[List[str]] = None,
+    avoid_queries: Optional[List[str]] = None,
+    rate: bool = False,
 ) -> List[SerpQuery]:
     """Generate SERP queries based on user input and previous learnings."""
 
@@ -183,6 +249,12 @@ async def generate_serp_queries(
     if learnings:
         prompt += f"\n\nHere are some learnings from previous research, use them to generate more specific queries: {' '.join(learnings)}"
 
+    if avoid_queries:
+        prompt += f"\n\nThese queries have already been searched, do not repeat them or ask something similar: {json.dumps(avoid_queries, ensure_ascii=False)}"
+
+    if rate:
+        prompt += "\n\nAlso give each query object an 'expected_value' field: a number from 1 to 10 rating how much new, relevant information the query is likely to add to the research."
+
     response = await generate_completions(
         client=client,
         model=model,
@@ -192,19 +264,16 @@ async def generate_serp_queries(
         ],
         # format=SerpQueryResponse.model_json_schema(),
         format={"type": "json_object"},
+        stage="generate_serp_queries",
     )
 
     try:
         if get_service() == "ollama":
-            result = SerpQueryResponse.model_validate_json(response.message.content)
+            result = SerpQueryResponse.model_validate_json(await extract(response.message.content))
             parse_ollama_token_consume("generate_serp_queries", response)
         else:
-            # json格式兜底
-            json_response = response.choices[0].message.content
-            try:
-                json.loads(json_response) # 为正常json
-            except:
-                json_response = re.findall(r"```(?:json)?\s*(.*?)\s*```", json_response, re.DOTALL)[0]
+            # json格式兜底: 去掉推理内容, 再取 ```json 代码块或最外层的 {}
+            json_response = await extract(response.choices[0].message.content)
 
             result = SerpQueryResponse.model_validate_json(
                 json_response
@@ -212,18 +281,18 @@ async def generate_serp_queries(
             parse_openai_token_consume("generate_serp_queries", response)
 
         queries = result.queries if result.queries else []
-        log_event(f"Generated {len(queries)} SERP queries for research query: {query}")
-        log_event(f"Got queries: {queries}")
+        log_event("Generated %s SERP queries for research query: %s", len(queries), query)
+        log_event("Got queries: %s", queries)
 
-        with st.chat_message("assistant"):
-            st.markdown(f"Generated {len(queries)} SERP queries for research query: {query}")
-            st.markdown(f"Got queries: {queries}")
+        emit(SerpQueriesEvent(query=query, queries=[q.query for q in queries]))
         return queries[:num_queries]
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON response: {e}")
         print(f"Raw response: {response.choices[0].message.content}")
         log_error(
-            f"Failed to parse JSON response for query: {query}, raw response: {response.choices[0].message.content}"
+            "Failed to parse JSON response for query: %s, raw response: %s",
+            query,
+            response.choices[0].message.content,
         )
         return []
 
@@ -236,18 +305,31 @@ class SerpResultResponse(BaseModel):
 async def process_serp_result(
     query: str,
     search_result: SearchResponse,
-    client: openai.OpenAI,
+    client: "openai.OpenAI",
     model: str,
     num_learnings: int = 3,
     num_follow_up_questions: int = 3,
 ) -> Dict[str, List[str]]:
     """Process search results to extract learnings and follow-up questions."""
 
-    contents = [
-        trim_prompt(item.get("markdown", ""), 25_000)
-        for item in search_result["data"]
-        if item.get("markdown")
-    ]
+    # The pages share what the smallest model the stage may be routed to can
+    # take, leaving room for the instructions and the answer
+    pages = sum(
+        1 for item in search_result["data"] if item.get("markdown") or item.get("content_ref")
+    )
+    page_tokens = page_token_budget(
+        stage_context_window("process_serp_result", get_service(), model), pages
+    )
+    # Long pages are trimmed in the CPU pool, all at once
+    contents = await asyncio.gather(
+        *(
+            trim(content, page_tokens)
+            for content in await read_contents(
+                search_result, min(MAX_CONTENT_CHARS, page_tokens * 4)
+            )
+            if content
+        )
+    )
 
     # Create the contents string separately
     contents_str = "".join(f"<content>\n{content}\n</content>" for content in contents)
@@ -270,20 +352,17 @@ async def process_serp_result(
         ],
         # format=SerpResultResponse.model_json_schema(),
         format={"type": "json_object"},
+        stage="process_serp_result",
     )
 
     try:
         if get_service() == "ollama":
-            result = SerpResultResponse.model_validate_json(response.message.content)
+            result = SerpResultResponse.model_validate_json(await extract(response.message.content))
             parse_ollama_token_consume("process_serp_result", response)
         else:
 
-            # json格式兜底
-            json_response = response.choices[0].message.content
-            try:
-                json.loads(json_response) # 为正常json
-            except:
-                json_response =re.findall(r"```(?:json)?\s*(.*?)\s*```", json_response, re.DOTALL)[0]
+            # json格式兜底: 去掉推理内容, 再取 ```json 代码块或最外层的 {}
+            json_response = await extract(response.choices[0].message.content)
 
             result = SerpResultResponse.model_validate_json(
                 json_response
@@ -291,15 +370,23 @@ async def process_serp_result(
             parse_openai_token_consume("process_serp_result", response)
 
         log_event(
-            f"Processed SERP results for query: {query}, found {len(result.learnings)} learnings and {len(result.followUpQuestions)} follow-up questions"
+            "Processed SERP results for query: %s, found %s learnings and %s follow-up questions",
+            query,
+            len(result.learnings),
+            len(result.followUpQuestions),
         )
         log_event(
-            f"Got learnings: {len(result.learnings)} and follow-up questions: {len(result.followUpQuestions)}"
+            "Got learnings: %s and follow-up questions: %s",
+            len(result.learnings),
+            len(result.followUpQuestions),
         )
-        with st.chat_message("assistant"):
-            st.markdown(
-                f"Processed SERP results for query: {query}, found {len(result.learnings)} learnings and {len(result.followUpQuestions)} follow-up questions"
+        emit(
+            SerpResultEvent(
+                query=query,
+                learnings=result.learnings[:num_learnings],
+                follow_up_questions=result.followUpQuestions[:num_follow_up_questions],
             )
+        )
 
         return {
             "learnings": result.learnings[:num_learnings],
@@ -309,31 +396,36 @@ async def process_serp_result(
         print(f"Error parsing JSON response: {e}")
         print(f"Raw response: {response.choices[0].message.content}")
         log_error(
-            f"Failed to parse SERP results for query: {query}, raw response: {response.choices[0].message.content}"
+            "Failed to parse SERP results for query: %s, raw response: %s",
+            query,
+            response.choices[0].message.content,
         )
         return {"learnings": [], "followUpQuestions": []}
 
 
+def learnings_report(learnings: List[str]) -> str:
+    """Plain report listing the learnings, for when there is no time to write one."""
+    return "# Research Findings\n\n" + "\n".join(f"- {learning}" for learning in learnings)
+
+
 class FinalReportResponse(BaseModel):
     reportMarkdown: str
 
-import sys
-sys.path.append('../deep_research_py')
-from gen_outline_acticle import *
+from .gen_outline_acticle import write_outline, write_outline_polish, generate_article
 async def write_final_report(
     prompt: str,
     learnings: List[str],
     visited_urls: List[str],
-    client: openai.OpenAI,
+    client: "openai.OpenAI",
     model: str,
     writing_method="serial"
 ) -> str:
     """Generate final report based on all research learnings."""
 
-    learnings_string = trim_prompt(
-        "\n".join([f"<learning>\n{learning}\n</learning>" for learning in learnings]),
-        150_000,
-    )
+    # Related learnings are condensed into a digest instead of being cut off at
+    # the token limit; the limit stays as a safety net
+    digest = await compress_learnings(learnings, prompt, client, model)
+    learnings_string = await trim(digest.to_prompt(), 150_000)
 
     user_prompt = (
         f"Given the following prompt from the user, write a final report on the topic using "
@@ -343,27 +435,31 @@ async def write_final_report(
         f"Here are all the learnings from research:\n\n<learnings>\n{learnings_string}\n</learnings>"
     )
 
-    # step1: 生成outline
-    draft_outlines = await write_outline(prompt, learnings_string, client, model)
-    print(
-        f"gen draft outlines:\n {draft_outlines}"
-    )
-    log_event(f"gen draft outlines:\n {draft_outlines}")
-    with st.chat_message('assistant'):
-        st.markdown(f"gen draft outlines:\n {draft_outlines}")
-
-    # # step2: 润色outline
-    outlines = await write_outline_polish(prompt, learnings_string, client, model, draft_outlines)
-    print(
-        f"gen polish outlines:\n {outlines}"
-    )
-    log_event(f"gen polish outlines:\n {outlines}")
-    with st.chat_message('assistant'):
-        st.markdown(f"gen polish outlines:\n {outlines}")
-    
-    # # step3: 生成文章
-    report =  await generate_article(prompt, learnings_string, client, model, outlines, writing_method)
-    
+    # Out of time, a report is still written: polishing is skipped, missing
+    # sections are left out, and without an outline the learnings are listed
+    try:
+        # step1: 生成outline
+        draft_outlines = await write_outline(prompt, learnings_string, client, model)
+        log_event("gen draft outlines:\n %s", draft_outlines)
+        emit(OutlineEvent(outline=draft_outlines, draft=True))
+
+        # # step2: 润色outline
+        try:
+            outlines = await write_outline_polish(prompt, learnings_string, client, model, draft_outlines)
+        except asyncio.TimeoutError:
+            record_cancellation("outline", 1, 0, "timeout")
+            outlines = draft_outlines
+        log_event("gen polish outlines:\n %s", outlines)
+        emit(OutlineEvent(outline=outlines))
+
+        # # step3: 生成文章
+        report =  await generate_article(prompt, learnings_string, client, model, outlines, writing_method)
+    except asyncio.TimeoutError:
+        record_cancellation("report", 1, 0, "timeout")
+        report = ""
+    if not report.strip():
+        report = learnings_report(learnings)
+
 
     try:
         # if get_service() == "ollama":
@@ -377,7 +473,9 @@ async def write_final_report(
 
         # report = result.reportMarkdown if result.reportMarkdown else ""
         log_event(
-            f"Generated final report based on {len(learnings)} learnings from {len(visited_urls)} sources"
+            "Generated final report based on %s learnings from %s sources",
+            len(learnings),
+            len(visited_urls),
         )
         # Append sources
         urls_section = "\n\n## Sources\n\n" + "\n".join(
@@ -387,21 +485,110 @@ async def write_final_report(
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON response: {e}")
         # print(f"Raw response: {response.choices[0].message.content}")
-        log_error(
-            f"Failed to generate final report for research query, raw response:"
-        )
+        log_error("Failed to generate final report for research query, raw response:")
         return "Error generating report"
 
 
+async def select_serp_queries(
+    query: str,
+    client: "openai.OpenAI",
+    model: str,
+    breadth: int,
+    learnings: List[str],
+    registry: QueryRegistry,
+    replacement_rounds: int = 1,
+    rate: bool = False,
+) -> List[SerpQuery]:
+    """Generates SERP queries, dropping ones the run has already (nearly) asked.
+
+    The slots of dropped queries are refilled by asking the model for replacements
+    that avoid every query scheduled so far.
+    """
+    serp_queries = await generate_serp_queries(
+        query=query,
+        client=client,
+        model=model,
+        num_queries=breadth,
+        learnings=learnings,
+        rate=rate,
+    )
+    selected = [q for q in serp_queries if registry.admit(q.query)]
+    missing = len(serp_queries) - len(selected)
+
+    for _ in range(replacement_rounds):
+        if missing <= 0:
+            break
+        registry.replacements_requested += missing
+        replacements = await generate_serp_queries(
+            query=query,
+            client=client,
+            model=model,
+            num_queries=missing,
+            learnings=learnings,
+            avoid_queries=registry.queries,
+            rate=rate,
+        )
+        admitted = [q for q in replacements if registry.admit(q.query)]
+        selected.extend(admitted)
+        missing -= len(admitted)
+
+    return selected
+
+
+@dataclass
+class ResearchRun:
+    """State shared by every node of one research run."""
+
+    store: ResearchStore
+    registry: QueryRegistry
+    novelty: NoveltyTracker
+    concurrency: int
+    client: "openai.OpenAI"
+    model: str
+    knowledge: Optional[KnowledgeBase] = None
+    knowledge_usage: KnowledgeUsage = field(default_factory=KnowledgeUsage)
+
+
+async def seed_from_knowledge(
+    run: ResearchRun, query: str, learnings: List[str], visited_urls: List[str]
+) -> Tuple[List[str], List[str]]:
+    """Adds the learnings of earlier runs related to `query` to the run's starting point."""
+    if run.knowledge is None:
+        return learnings, visited_urls
+    prior, urls = await asyncio.to_thread(run.knowledge.recall, query)
+    new = [learning for learning in prior if learning not in learnings]
+    run.knowledge_usage.seeded_learnings += len(new)
+    if new:
+        emit(StatusEvent(message=f"Starting from {len(new)} learnings of earlier runs"))
+    return learnings + new, list(dict.fromkeys(visited_urls + urls))
+
+
+def report_knowledge_usage(run: ResearchRun) -> None:
+    if run.knowledge is None:
+        return
+    usage = run.knowledge_usage
+    log_event("Knowledge base reuse: %s", usage.to_dict())
+    if usage.seeded_learnings or usage.skipped_searches:
+        emit(
+            StatusEvent(
+                message=f"Knowledge base: {usage.seeded_learnings} learnings seeded, "
+                f"{usage.skipped_searches} searches skipped, {usage.added_learnings} learnings added"
+            )
+        )
+
+
 async def deep_research(
     query: str,
     breadth: int,
     depth: int,
     concurrency: int,
-    client: openai.OpenAI,
+    client: "openai.OpenAI",
     model: str,
     learnings: List[str] = None,
     visited_urls: List[str] = None,
+    registry: Optional[QueryRegistry] = None,
+    novelty: Optional[NoveltyTracker] = None,
+    store: Optional[ResearchStore] = None,
 ) -> ResearchResult:
     """
     Main research function that recursively explores a topic.
@@ -412,90 +599,226 @@ async def deep_research(
         depth: How many levels deep to research
         learnings: Previous learnings to build upon
         visited_urls: Previously visited URLs
+        registry: Queries already scheduled, to avoid asking them again
+        novelty: Decides which branches are worth expanding
+        store: Receives the run's learnings and sources as records
+    """
+    run = ResearchRun(
+        store=store if store is not None else ResearchStore(),
+        registry=registry if registry is not None else QueryRegistry(),
+        novelty=novelty if novelty is not None else NoveltyTracker(),
+        concurrency=concurrency,
+        client=client,
+        model=model,
+        knowledge=get_knowledge_base(),
+    )
+    learnings, visited_urls = await seed_from_knowledge(
+        run, query, learnings or [], visited_urls or []
+    )
+    run.novelty.add_known(learnings)
+
+    try:
+        await _research_level(
+            query, breadth, depth, run.store.root_view(learnings, visited_urls), run
+        )
+    except asyncio.TimeoutError:
+        # No time left to even plan the first queries
+        record_cancellation("research", 1, 0, "timeout")
+
+    if run.registry.avoided:
+        log_event("SERP query registry: %s", run.registry.stats())
+        emit(StatusEvent(message=f"Skipped {run.registry.avoided} redundant SERP queries"))
+    if run.novelty.pruned:
+        log_event("Branch novelty: %s", run.novelty.stats())
+        emit(
+            StatusEvent(
+                message=f"Stopped {run.novelty.pruned} branches with little new information"
+            )
+        )
+    report_knowledge_usage(run)
+
+    # Every branch appends to the store, so it holds the whole run's findings
+    return {"learnings": run.store.learning_texts(), "visited_urls": run.store.urls()}
+
+
+@dataclass
+class NodeResult:
+    view: BranchView
+    learnings: List[str]
+    follow_up_questions: List[str]
+    urls: List[str]
+    novelty: float
+
+
+async def research_node(
+    serp_query: SerpQuery,
+    node_id: str,
+    view: BranchView,
+    run: ResearchRun,
+    num_follow_up_questions: int,
+) -> NodeResult:
+    """Searches one SERP query, extracts learnings and records them in the run's store.
+
+    A query that an earlier run researched recently reuses that run's findings instead.
     """
-    learnings = learnings or []
-    visited_urls = visited_urls or []
+    if run.knowledge is not None:
+        covered = await asyncio.to_thread(run.knowledge.covering, serp_query.query)
+        if covered is not None:
+            log_event(
+                "Reusing %s learnings of %r (similarity %.2f, %.1f days old) for %r",
+                len(covered.learnings),
+                covered.query,
+                covered.score,
+                covered.age_days,
+                serp_query.query,
+            )
+            run.knowledge_usage.skipped_searches += 1
+            run.knowledge_usage.reused_learnings += len(covered.learnings)
+            emit(
+                SerpResultEvent(
+                    query=serp_query.query,
+                    learnings=covered.learnings,
+                    follow_up_questions=covered.follow_up_questions,
+                )
+            )
+            source_ids = run.store.add_sources((url, "") for url in covered.urls)
+            learning_ids = run.store.add_learnings(
+                covered.learnings, node_id=node_id, source_ids=source_ids
+            )
+            return NodeResult(
+                view=view.extend(learning_ids, source_ids),
+                learnings=covered.learnings,
+                follow_up_questions=covered.follow_up_questions,
+                urls=covered.urls,
+                novelty=run.novelty.observe(covered.learnings),
+            )
+
+    # Search for content
+    result = await firecrawl.search(serp_query.query, timeout=15000, limit=5)
 
+    # Collect new URLs
+    urls = [item["url"] for item in result["data"] if item.get("url")]
+    source_ids = run.store.add_sources(
+        (item["url"], item.get("title", "")) for item in result["data"] if item.get("url")
+    )
+
+    # Process the search results
+    new_learnings = await process_serp_result(
+        query=serp_query.query,
+        search_result=result,
+        num_follow_up_questions=num_follow_up_questions,
+        client=run.client,
+        model=run.model,
+    )
+    # Page bodies are only needed for extraction; don't hold them while
+    # the branch below runs
+    del result
+
+    learning_ids = run.store.add_learnings(
+        new_learnings["learnings"], node_id=node_id, source_ids=source_ids
+    )
+    if run.knowledge is not None and new_learnings["learnings"]:
+        run.knowledge_usage.added_learnings += await asyncio.to_thread(
+            run.knowledge.add,
+            serp_query.query,
+            serp_query.research_goal,
+            new_learnings["learnings"],
+            new_learnings["followUpQuestions"],
+            urls,
+        )
+        run.knowledge_usage.added_queries += 1
+    return NodeResult(
+        view=view.extend(learning_ids, source_ids),
+        learnings=new_learnings["learnings"],
+        follow_up_questions=new_learnings["followUpQuestions"],
+        urls=urls,
+        novelty=run.novelty.observe(new_learnings["learnings"]),
+    )
+
+
+def follow_up_query(serp_query: SerpQuery, follow_up_questions: List[str]) -> str:
+    """The prompt for the level below a node."""
+    return f"""
+    Previous research goal: {serp_query.research_goal}
+    Follow-up research directions: {" ".join(follow_up_questions)}
+    """.strip()
+
+
+async def _research_level(
+    query: str, breadth: int, depth: int, view: BranchView, run: ResearchRun
+) -> None:
+    """Researches one level of the tree below `view` and recurses into its branches."""
     # Generate search queries
-    serp_queries = await generate_serp_queries(
+    serp_queries = await select_serp_queries(
         query=query,
-        client=client,
-        model=model,
-        num_queries=breadth,
-        learnings=learnings,
+        client=run.client,
+        model=run.model,
+        breadth=breadth,
+        learnings=view.learnings(),
+        registry=run.registry,
     )
 
     # Create a semaphore to limit concurrent requests
-    semaphore = asyncio.Semaphore(concurrency)
+    semaphore = asyncio.Semaphore(run.concurrency)
+
+    parent_node_id = get_node_id()
 
-    async def process_query(serp_query: SerpQuery) -> ResearchResult:
+    async def process_query(index: int, serp_query: SerpQuery) -> None:
+        # 每个 SERP 查询是树上的一个节点, 如 "0.2.1", 写入日志便于按节点过滤
+        node_id = f"{parent_node_id}.{index}" if parent_node_id else str(index)
+        set_log_context(node_id=node_id)
         async with semaphore:
             try:
-                # Search for content
-                result = await firecrawl.search(
-                    serp_query.query, timeout=15000, limit=5
-                )
-
-                # Collect new URLs
-                new_urls = [
-                    item.get("url") for item in result["data"] if item.get("url")
-                ]
-
                 # Calculate new breadth and depth for next iteration
                 new_breadth = max(1, breadth // 2)
                 new_depth = depth - 1
 
-                # Process the search results
-                new_learnings = await process_serp_result(
-                    query=serp_query.query,
-                    search_result=result,
-                    num_follow_up_questions=new_breadth,
-                    client=client,
-                    model=model,
+                node = await research_node(serp_query, node_id, view, run, new_breadth)
+
+                # Branches that mostly repeat what the run already knows stop here
+                novelty = run.novelty
+                expand = new_depth > 0 and novelty.should_expand(node.novelty, new_breadth)
+                extra_breadth = novelty.extra_breadth(node.novelty, new_breadth) if expand else 0
+                log_event(
+                    "Branch %r novelty %.2f, expand: %s, extra breadth: %s",
+                    serp_query.query,
+                    node.novelty,
+                    expand,
+                    extra_breadth,
                 )
-
-                all_learnings = learnings + new_learnings["learnings"]
-                all_urls = visited_urls + new_urls
-
-                # If we have more depth to go, continue research
-                if new_depth > 0:
-                    print(
-                        f"Researching deeper, breadth: {new_breadth}, depth: {new_depth}"
+                emit(
+                    NoveltyEvent(
+                        node_id=node_id,
+                        query=serp_query.query,
+                        novelty=round(node.novelty, 3),
+                        expanded=expand,
+                        extra_breadth=extra_breadth,
                     )
+                )
+                new_breadth += extra_breadth
 
-                    next_query = f"""
-                    Previous research goal: {serp_query.research_goal}
-                    Follow-up research directions: {" ".join(new_learnings["followUpQuestions"])}
-                    """.strip()
-
-                    return await deep_research(
-                        query=next_query,
-                        breadth=new_breadth,
-                        depth=new_depth,
-                        concurrency=concurrency,
-                        learnings=all_learnings,
-                        visited_urls=all_urls,
-                        client=client,
-                        model=model,
+                # If we have more depth to go, continue research
+                if expand:
+                    emit(
+                        StatusEvent(
+                            message=f"Researching deeper, breadth: {new_breadth}, depth: {new_depth}"
+                        )
                     )
 
-                return {"learnings": all_learnings, "visited_urls": all_urls}
+                    next_query = follow_up_query(serp_query, node.follow_up_questions)
+                    await _research_level(next_query, new_breadth, new_depth, node.view, run)
 
             except Exception as e:
-                if "Timeout" in str(e):
+                if isinstance(e, asyncio.TimeoutError) or "Timeout" in str(e):
                     print(f"Timeout error running query: {serp_query.query}: {e}")
                 else:
                     print(f"Error running query: {serp_query.query}: {e}")
-                return {"learnings": [], "visited_urls": []}
 
-    # Process all queries concurrently
-    results = await asyncio.gather(*[process_query(query) for query in serp_queries])
-
-    # Combine all results
-    all_learnings = list(
-        set(learning for result in results for learning in result["learnings"])
+    # Process all queries concurrently; branches still running at the deadline, or
+    # long after most of the level is done, are cancelled and the run keeps what
+    # they had stored
+    await gather_partial(
+        [process_query(i, query) for i, query in enumerate(serp_queries)],
+        stage="research",
+        straggler_quantile=BRANCH_QUORUM,
     )
-
-    all_urls = list(set(url for result in results for url in result["visited_urls"]))
-
-    return {"learnings": all_learnings, "visited_urls": all_urls}
@@ -0,0 +1,206 @@
+"""Hierarchical compression of research learnings for the report writers.
+
+The outline and every section used to receive all learnings, trimmed to 150k
+tokens, so large runs lost whatever came after the cut. Instead, related
+learnings are grouped locally by shingle overlap (no model call), and each
+group is condensed in parallel into a few dense digest lines. Each line keeps
+the ids of the learnings it came from. If the digest is still too large, its
+lines are grouped and condensed again, up to `max_levels` times.
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, FrozenSet, List, Set, Tuple
+
+from pydantic import BaseModel
+
+from .ai.providers import generate_completions
+from .common.cpu import count_tokens, extract
+from .common.deadline import gather_partial
+from .common.logging import log_event, log_warning
+from .common.similarity import shingles
+from .common.token_cunsumption import parse_ollama_token_consume, parse_openai_token_consume
+from .prompt import system_prompt
+from .utils import get_service
+
+if TYPE_CHECKING:
+    import openai
+
+# Once this share of the groups is condensed, the rest get 3x as long as that took;
+# groups cut off keep their learnings as they are
+DIGEST_QUORUM = 0.75
+
+
+@dataclass
+class DigestLine:
+    text: str
+    # Indexes into `Digest.learnings`
+    learning_ids: Tuple[int, ...]
+
+
+@dataclass
+class Digest:
+    learnings: List[str]
+    lines: List[DigestLine]
+    levels: int = 0
+
+    def to_prompt(self) -> str:
+        return "\n".join(f"<learning>\n{line.text}\n</learning>" for line in self.lines)
+
+    def sources(self, line: DigestLine) -> List[str]:
+        """The original learnings behind a digest line."""
+        return [self.learnings[i] for i in line.learning_ids]
+
+    def mapping(self) -> List[dict]:
+        return [{"line": line.text, "learnings": list(line.learning_ids)} for line in self.lines]
+
+
+class _DigestLineResponse(BaseModel):
+    text: str
+    sources: List[int]
+
+
+class _DigestResponse(BaseModel):
+    lines: List[_DigestLineResponse]
+
+
+def cluster_lines(
+    texts: List[str], threshold: float = 0.3, max_chars: int = 12_000
+) -> List[List[int]]:
+    """Groups related texts; returns lists of indexes into `texts`.
+
+    Each group is led by its first text. A text joins the group whose leader
+    contains the largest share of its shingles, if that share reaches
+    `threshold` and the group stays under `max_chars`; otherwise it leads a new
+    group. Comparing with leaders only keeps groups from drifting apart.
+    """
+    groups: List[List[int]] = []
+    leaders: List[FrozenSet[str]] = []
+    sizes: List[int] = []
+    for i, text in enumerate(texts):
+        candidate = shingles(text)
+        best, best_score = None, threshold
+        if candidate:
+            for g, leader in enumerate(leaders):
+                if sizes[g] + len(text) > max_chars:
+                    continue
+                score = len(candidate & leader) / len(candidate)
+                if score >= best_score:
+                    best, best_score = g, score
+        if best is None:
+            groups.append([i])
+            leaders.append(candidate)
+            sizes.append(len(text))
+        else:
+            groups[best].append(i)
+            sizes[best] += len(text)
+    return groups
+
+
+async def digest_group(
+    texts: List[str], topic: str, client: "openai.OpenAI", model: str
+) -> List[Tuple[str, Tuple[int, ...]]]:
+    """Condenses related texts into digest lines with the (local) indexes they draw on."""
+    numbered = "\n".join(f"[{i}] {text}" for i, text in enumerate(texts))
+    prompt = (
+        f"The following numbered learnings come from research on <topic>{topic}</topic>. "
+        f"Condense them into fewer, information-dense lines without losing any entity, metric, "
+        f"number or date; merge learnings that say the same thing. Return a JSON object with a "
+        f"'lines' array; each line has a 'text' field and a 'sources' field listing the numbers "
+        f"of the learnings it is based on. Every learning must be a source of at least one line.\n\n"
+        f"<learnings>\n{numbered}\n</learnings>"
+    )
+    response = await generate_completions(
+        client=client,
+        model=model,
+        messages=[
+            {"role": "system", "content": system_prompt()},
+            {"role": "user", "content": prompt},
+        ],
+        format={"type": "json_object"},
+        stage="digest_learnings",
+    )
+    if get_service() == "ollama":
+        result = _DigestResponse.model_validate_json(await extract(response.message.content))
+        parse_ollama_token_consume("digest_learnings", response)
+    else:
+        result = _DigestResponse.model_validate_json(
+            await extract(response.choices[0].message.content)
+        )
+        parse_openai_token_consume("digest_learnings", response)
+
+    lines = []
+    covered: Set[int] = set()
+    for line in result.lines:
+        sources = tuple(sorted({i for i in line.sources if 0 <= i < len(texts)}))
+        if line.text.strip() and sources:
+            lines.append((line.text.strip(), sources))
+            covered.update(sources)
+    # Learnings the model dropped are kept as they are
+    lines.extend((texts[i], (i,)) for i in range(len(texts)) if i not in covered)
+    return lines
+
+
+async def compress_learnings(
+    learnings: List[str],
+    topic: str,
+    client: "openai.OpenAI",
+    model: str,
+    target_tokens: int = 30_000,
+    max_levels: int = 2,
+    concurrency: int = 8,
+) -> Digest:
+    """Compresses `learnings` until they fit in `target_tokens`.
+
+    Learnings that already fit are returned one per line. A group whose digest
+    call fails or runs out of time keeps its lines unchanged.
+    """
+    digest = Digest(learnings, [DigestLine(text, (i,)) for i, text in enumerate(learnings)])
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def condense(group: List[int]) -> List[DigestLine]:
+        lines = [digest.lines[i] for i in group]
+        if len(lines) == 1:
+            return lines
+        async with semaphore:
+            condensed = await digest_group([line.text for line in lines], topic, client, model)
+        return [
+            DigestLine(
+                text,
+                tuple(sorted({j for i in local for j in lines[i].learning_ids})),
+            )
+            for text, local in condensed
+        ]
+
+    for level in range(max_levels):
+        tokens = await count_tokens(digest.to_prompt())
+        if tokens <= target_tokens:
+            break
+        groups = cluster_lines([line.text for line in digest.lines])
+        if len(groups) == len(digest.lines):
+            # Nothing is related enough to merge
+            break
+        results = await gather_partial(
+            [condense(group) for group in groups], stage="digest", straggler_quantile=DIGEST_QUORUM
+        )
+        lines: List[DigestLine] = []
+        for group, result in zip(groups, results):
+            lines.extend(result if result is not None else [digest.lines[i] for i in group])
+        log_event(
+            "Digest level %s: %s lines (%s tokens) -> %s lines in %s groups",
+            level + 1,
+            len(digest.lines),
+            tokens,
+            len(lines),
+            len(groups),
+        )
+        digest = Digest(learnings, lines, level + 1)
+    else:
+        tokens = await count_tokens(digest.to_prompt())
+        if tokens > target_tokens:
+            log_warning("Digest still has %s tokens after %s levels", tokens, max_levels)
+
+    if digest.levels:
+        log_event("Digest mapping: %s", json.dumps(digest.mapping(), ensure_ascii=False))
+    return digest
@@ -0,0 +1,621 @@
+"""Distributed execution of research-tree nodes.
+
+In distributed mode, every node of the tree (search, extract learnings, plan
+children) is a task in a durable queue. Stateless workers, in any number of
+processes and hosts, claim tasks, run them, enqueue the node's children and
+write the node's result back. The coordinator plans the first level, waits for
+the run's tasks to drain and assembles the `ResearchResult`.
+
+Queues are opened by URL (see `open_queue`):
+
+    sqlite:///path/queue.db    a SQLite file, shared by the processes of one host
+    http://host:8000           the queue of a research service (`server.py`), for many hosts
+
+Other backends can be added with `register_queue_backend`. Claimed tasks hold
+a lease that their worker renews. If a worker dies, its tasks are handed out
+again once the lease expires, up to `max_attempts` times. Node ids are unique
+per run, so a retried node never enqueues its children twice.
+
+Workers keep no state between tasks. Each node carries what it needs: its
+branch's learnings and URLs, and the queries already scheduled by its ancestors
+and siblings. Novelty and duplicate queries are therefore judged per branch,
+not across the whole run as in a single process.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from .common.deadline import expired, record_cancellation, remaining
+from .common.events import SerpResultEvent, StatusEvent, emit
+from .common.logging import log_error, log_event, set_log_context
+from .deep_research import (
+    ResearchResult,
+    ResearchRun,
+    SerpQuery,
+    follow_up_query,
+    report_knowledge_usage,
+    research_node,
+    seed_from_knowledge,
+    select_serp_queries,
+)
+from .knowledge_base import get_knowledge_base
+from .novelty import NoveltyTracker
+from .query_registry import QueryRegistry
+from .research_store import ResearchStore
+from .search import close_search_sessions
+
+if TYPE_CHECKING:
+    import openai
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+@dataclass
+class Task:
+    id: int
+    run_id: str
+    node_id: str
+    payload: Dict[str, Any]
+    attempts: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "run_id": self.run_id,
+            "node_id": self.node_id,
+            "payload": self.payload,
+            "attempts": self.attempts,
+        }
+
+
+class TaskQueue(ABC):
+    """A durable queue of research-tree nodes, shared by a coordinator and its workers."""
+
+    @abstractmethod
+    async def put(self, run_id: str, tasks: List[Dict[str, Any]]) -> int:
+        """Enqueues `{"node_id", "payload"}` dicts; returns how many were new."""
+
+    @abstractmethod
+    async def claim(self, worker: str, lease: float) -> Optional[Task]:
+        """The oldest available task, leased to `worker` for `lease` seconds."""
+
+    @abstractmethod
+    async def heartbeat(self, task_id: int, lease: float) -> None:
+        """Extends the lease of a running task."""
+
+    @abstractmethod
+    async def complete(self, task_id: int, result: Dict[str, Any]) -> None:
+        pass
+
+    @abstractmethod
+    async def fail(self, task_id: int, error: str) -> None:
+        """Gives the task back for another attempt, or fails it after the last one."""
+
+    @abstractmethod
+    async def status(self, run_id: str) -> Dict[str, int]:
+        """Tasks of the run per state."""
+
+    @abstractmethod
+    async def results(self, run_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        """Results of the run's finished tasks with an id above `after`, oldest first."""
+
+    @abstractmethod
+    async def cancel(self, run_id: str) -> int:
+        """Cancels the run's queued and running tasks; returns how many."""
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteTaskQueue(TaskQueue):
+    """Task queue in a SQLite file; safe for many processes on one host.
+
+    Args:
+        path: The database file, created if missing.
+        max_attempts: Claims of a task before it fails for good.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL,
+                    node_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    lease_until REAL,
+                    result TEXT,
+                    error TEXT,
+                    updated REAL NOT NULL,
+                    UNIQUE (run_id, node_id)
+                );
+                CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_until);
+                CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id, state);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per call: calls run in worker threads
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _put(self, run_id: str, tasks: List[Dict[str, Any]]) -> int:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO tasks (run_id, node_id, payload, updated) VALUES (?, ?, ?, ?)",
+                [
+                    (run_id, task["node_id"], json.dumps(task["payload"], ensure_ascii=False), now)
+                    for task in tasks
+                ],
+            )
+            added = db.total_changes - before
+            db.execute("COMMIT")
+        return added
+
+    def _claim(self, worker: str, lease: float) -> Optional[Task]:
+        now = time.time()
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            # Leases of dead workers expire; their last attempt fails the task
+            db.execute(
+                "UPDATE tasks SET state = ?, error = 'lease expired', updated = ? "
+                "WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts),
+            )
+            row = db.execute(
+                "SELECT id, run_id, node_id, payload, attempts FROM tasks "
+                "WHERE state = ? OR (state = ? AND lease_until < ?) ORDER BY id LIMIT 1",
+                (QUEUED, RUNNING, now),
+            ).fetchone()
+            if row is not None:
+                db.execute(
+                    "UPDATE tasks SET state = ?, attempts = attempts + 1, worker = ?, "
+                    "lease_until = ?, updated = ? WHERE id = ?",
+                    (RUNNING, worker, now + lease, now, row[0]),
+                )
+            db.execute("COMMIT")
+        if row is None:
+            return None
+        return Task(row[0], row[1], row[2], json.loads(row[3]), row[4] + 1)
+
+    def _execute(self, sql: str, params: tuple) -> int:
+        with self._connect() as db:
+            return db.execute(sql, params).rowcount
+
+    def _fail(self, task_id: int, error: str) -> None:
+        self._execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "error = ?, lease_until = NULL, updated = ? WHERE id = ? AND state = ?",
+            (self.max_attempts, FAILED, QUEUED, error, time.time(), task_id, RUNNING),
+        )
+
+    def _status(self, run_id: str) -> Dict[str, int]:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT state, COUNT(*) FROM tasks WHERE run_id = ? GROUP BY state", (run_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def _results(self, run_id: str, after: int) -> List[Dict[str, Any]]:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id, node_id, result FROM tasks "
+                "WHERE run_id = ? AND state = ? AND id > ? ORDER BY id",
+                (run_id, DONE, after),
+            ).fetchall()
+        return [{"id": id, "node_id": node_id, **json.loads(result)} for id, node_id, result in rows]
+
+    async def put(self, run_id: str, tasks: List[Dict[str, Any]]) -> int:
+        return await asyncio.to_thread(self._put, run_id, tasks)
+
+    async def claim(self, worker: str, lease: float) -> Optional[Task]:
+        return await asyncio.to_thread(self._claim, worker, lease)
+
+    async def heartbeat(self, task_id: int, lease: float) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE tasks SET lease_until = ? WHERE id = ? AND state = ?",
+            (time.time() + lease, task_id, RUNNING),
+        )
+
+    async def complete(self, task_id: int, result: Dict[str, Any]) -> None:
+        await asyncio.to_thread(
+            self._execute,
+            "UPDATE tasks SET state = ?, result = ?, lease_until = NULL, updated = ? "
+            "WHERE id = ? AND state = ?",
+            (DONE, json.dumps(result, ensure_ascii=False), time.time(), task_id, RUNNING),
+        )
+
+    async def fail(self, task_id: int, error: str) -> None:
+        await asyncio.to_thread(self._fail, task_id, error)
+
+    async def status(self, run_id: str) -> Dict[str, int]:
+        return await asyncio.to_thread(self._status, run_id)
+
+    async def results(self, run_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        return await asyncio.to_thread(self._results, run_id, after)
+
+    async def cancel(self, run_id: str) -> int:
+        return await asyncio.to_thread(
+            self._execute,
+            "UPDATE tasks SET state = ?, updated = ? WHERE run_id = ? AND state IN (?, ?)",
+            (CANCELLED, time.time(), run_id, QUEUED, RUNNING),
+        )
+
+
+class HttpTaskQueue(TaskQueue):
+    """The queue of a research service, over HTTP (see `server.py`)."""
+
+    def __init__(self, base_url: str, timeout: float = 30.0):
+        import httpx
+
+        self.http = httpx.AsyncClient(base_url=base_url.rstrip("/"), timeout=timeout)
+
+    async def _post(self, path: str, body: Dict[str, Any]) -> Any:
+        response = await self.http.post(path, json=body)
+        response.raise_for_status()
+        return response.json()
+
+    async def _get(self, path: str, **params: Any) -> Any:
+        response = await self.http.get(path, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def put(self, run_id: str, tasks: List[Dict[str, Any]]) -> int:
+        return (await self._post("/queue/tasks", {"run_id": run_id, "tasks": tasks}))["added"]
+
+    async def claim(self, worker: str, lease: float) -> Optional[Task]:
+        task = (await self._post("/queue/claim", {"worker": worker, "lease": lease}))["task"]
+        return Task(**task) if task else None
+
+    async def heartbeat(self, task_id: int, lease: float) -> None:
+        await self._post(f"/queue/tasks/{task_id}/heartbeat", {"lease": lease})
+
+    async def complete(self, task_id: int, result: Dict[str, Any]) -> None:
+        await self._post(f"/queue/tasks/{task_id}/complete", {"result": result})
+
+    async def fail(self, task_id: int, error: str) -> None:
+        await self._post(f"/queue/tasks/{task_id}/fail", {"error": error})
+
+    async def status(self, run_id: str) -> Dict[str, int]:
+        return await self._get(f"/queue/runs/{run_id}")
+
+    async def results(self, run_id: str, after: int = 0) -> List[Dict[str, Any]]:
+        return await self._get(f"/queue/runs/{run_id}/results", after=after)
+
+    async def cancel(self, run_id: str) -> int:
+        return (await self._post(f"/queue/runs/{run_id}/cancel", {}))["cancelled"]
+
+    async def close(self) -> None:
+        await self.http.aclose()
+
+
+_queue_backends: Dict[str, Callable[[str], TaskQueue]] = {
+    "sqlite": lambda url: SQLiteTaskQueue(url[len("sqlite://") :] if url.startswith("sqlite://") else url),
+    "http": HttpTaskQueue,
+    "https": HttpTaskQueue,
+}
+
+
+def register_queue_backend(scheme: str, factory: Callable[[str], TaskQueue]) -> None:
+    """Makes `open_queue` create queues for `<scheme>://...` URLs with `factory(url)`."""
+    _queue_backends[scheme] = factory
+
+
+def open_queue(url: str) -> TaskQueue:
+    """The queue at `url`; a plain path is a SQLite file."""
+    scheme = url.split("://", 1)[0] if "://" in url else "sqlite"
+    if scheme not in _queue_backends:
+        raise ValueError(f"No task queue backend for {url!r}")
+    return _queue_backends[scheme](url)
+
+
+def node_task(
+    node_id: str,
+    serp_query: SerpQuery,
+    breadth: int,
+    depth: int,
+    learnings: List[str],
+    urls: List[str],
+    queries: List[str],
+) -> Dict[str, Any]:
+    return {
+        "node_id": node_id,
+        "payload": {
+            "query": serp_query.query,
+            "research_goal": serp_query.research_goal,
+            "breadth": breadth,
+            "depth": depth,
+            "learnings": learnings,
+            "urls": urls,
+            "queries": queries,
+        },
+    }
+
+
+async def run_node(task: Task, queue: TaskQueue, client: "openai.OpenAI", model: str) -> Dict[str, Any]:
+    """Researches one node, enqueues its children and returns its result."""
+    payload = task.payload
+    serp_query = SerpQuery(query=payload["query"], research_goal=payload["research_goal"])
+    breadth, depth = payload["breadth"], payload["depth"]
+    registry = QueryRegistry()
+    registry.add_known(payload["queries"])
+    run = ResearchRun(
+        store=ResearchStore(),
+        registry=registry,
+        novelty=NoveltyTracker(),
+        concurrency=1,
+        client=client,
+        model=model,
+        knowledge=get_knowledge_base(),
+    )
+    run.novelty.add_known(payload["learnings"])
+    view = run.store.root_view(payload["learnings"], payload["urls"])
+
+    node = await research_node(serp_query, task.node_id, view, run, breadth)
+    children = []
+    if depth > 0 and run.novelty.should_expand(node.novelty, breadth):
+        serp_queries = await select_serp_queries(
+            query=follow_up_query(serp_query, node.follow_up_questions),
+            client=client,
+            model=model,
+            breadth=breadth,
+            learnings=node.view.learnings(),
+            registry=registry,
+        )
+        children = [
+            node_task(
+                f"{task.node_id}.{i}",
+                child,
+                max(1, breadth // 2),
+                depth - 1,
+                node.view.learnings(),
+                node.view.urls(),
+                registry.queries,
+            )
+            for i, child in enumerate(serp_queries)
+        ]
+        await queue.put(task.run_id, children)
+    return {
+        "query": serp_query.query,
+        "learnings": node.learnings,
+        "follow_up_questions": node.follow_up_questions,
+        "urls": node.urls,
+        "novelty": round(node.novelty, 3),
+        "children": len(children),
+        "reused": run.knowledge_usage.skipped_searches > 0,
+    }
+
+
+async def run_worker(
+    queue: TaskQueue,
+    client: "openai.OpenAI",
+    model: str,
+    concurrency: int = 4,
+    lease: float = 120.0,
+    poll_interval: float = 0.5,
+    idle_exit: Optional[float] = None,
+    worker_id: Optional[str] = None,
+) -> int:
+    """Claims and runs tasks until cancelled, or idle for `idle_exit` seconds.
+
+    The idle clock starts with the first claimed task, so a worker started before
+    its run has queued anything waits for it. Returns the number of tasks this
+    worker finished.
+    """
+    worker_id = worker_id or f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    active: set = set()
+    finished = 0
+    idle_since: Optional[float] = None
+
+    async def handle(task: Task) -> None:
+        nonlocal finished
+        set_log_context(run_id=task.run_id, node_id=task.node_id)
+
+        async def keep_lease() -> None:
+            while True:
+                await asyncio.sleep(lease / 3)
+                await queue.heartbeat(task.id, lease)
+
+        renewer = asyncio.create_task(keep_lease())
+        try:
+            result = await run_node(task, queue, client, model)
+        except Exception as e:
+            log_error("Node %s of run %s failed: %r", task.node_id, task.run_id, e)
+            await queue.fail(task.id, repr(e))
+        else:
+            await queue.complete(task.id, result)
+            finished += 1
+        finally:
+            renewer.cancel()
+
+    try:
+        while True:
+            task = await queue.claim(worker_id, lease) if len(active) < concurrency else None
+            if task is None:
+                if active:
+                    idle_since = time.monotonic()
+                elif (
+                    idle_exit is not None
+                    and idle_since is not None
+                    and time.monotonic() - idle_since > idle_exit
+                ):
+                    break
+                # Wake up when a slot frees, or poll again for new tasks
+                if active:
+                    await asyncio.wait(active, timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(poll_interval)
+                continue
+            log_event("Worker %s claimed node %s of run %s", worker_id, task.node_id, task.run_id)
+            idle_since = time.monotonic()
+            running = asyncio.create_task(handle(task))
+            active.add(running)
+            running.add_done_callback(active.discard)
+    finally:
+        for running in active:
+            running.cancel()
+    return finished
+
+
+def _worker_process(url: str, model: str, concurrency: int, idle_exit: Optional[float]) -> None:
+    from .ai.providers import get_ai_client
+    from .utils import resolve_service, set_model, set_service
+
+    service, model = resolve_service(model)
+    set_service(service)
+    set_model(model)
+
+    async def main() -> None:
+        queue = open_queue(url)
+        try:
+            await run_worker(queue, get_ai_client(), model, concurrency, idle_exit=idle_exit)
+        finally:
+            await queue.close()
+            await close_search_sessions()
+
+    asyncio.run(main())
+
+
+def start_worker_processes(
+    url: str, model: str, processes: int, concurrency: int = 4, idle_exit: Optional[float] = None
+) -> list:
+    """Starts `processes` local worker processes on the queue at `url`."""
+    import multiprocessing
+
+    # Fresh interpreters: the caller may be running threads and an event loop
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(
+            target=_worker_process, args=(url, model, concurrency, idle_exit), daemon=True
+        )
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+async def distributed_research(
+    query: str,
+    breadth: int,
+    depth: int,
+    client: "openai.OpenAI",
+    model: str,
+    queue: TaskQueue,
+    learnings: Optional[List[str]] = None,
+    visited_urls: Optional[List[str]] = None,
+    poll_interval: float = 0.5,
+    claim_timeout: Optional[float] = 60.0,
+) -> ResearchResult:
+    """Coordinates a research run whose nodes are executed by queue workers.
+
+    Plans the first level, enqueues it and waits until no node of the run is
+    queued or running. At the run's deadline the remaining nodes are cancelled.
+    When no node is running and none finishes for `claim_timeout` seconds, no
+    worker is consuming the queue: the run is cancelled and `RuntimeError` raised.
+    """
+    run_id = uuid.uuid4().hex
+    registry = QueryRegistry()
+    # Only for seeding and reporting; the nodes run on the workers
+    run = ResearchRun(
+        store=ResearchStore(),
+        registry=registry,
+        novelty=NoveltyTracker(),
+        concurrency=1,
+        client=client,
+        model=model,
+        knowledge=get_knowledge_base(),
+    )
+    learnings, visited_urls = await seed_from_knowledge(
+        run, query, learnings or [], visited_urls or []
+    )
+    serp_queries = await select_serp_queries(
+        query=query,
+        client=client,
+        model=model,
+        breadth=breadth,
+        learnings=learnings,
+        registry=registry,
+    )
+    await queue.put(
+        run_id,
+        [
+            node_task(str(i), serp_query, max(1, breadth // 2), depth - 1, learnings, visited_urls, registry.queries)
+            for i, serp_query in enumerate(serp_queries)
+        ],
+    )
+    log_event("Distributed run %s: %s nodes queued", run_id, len(serp_queries))
+
+    results: List[Dict[str, Any]] = []
+    last_id = 0
+    last_progress = time.monotonic()
+    while True:
+        counts = await queue.status(run_id)
+        new = await queue.results(run_id, after=last_id)
+        for result in new:
+            emit(
+                SerpResultEvent(
+                    query=result["query"],
+                    learnings=result["learnings"],
+                    follow_up_questions=result["follow_up_questions"],
+                )
+            )
+        if new:
+            last_id = new[-1]["id"]
+            results.extend(new)
+            emit(
+                StatusEvent(
+                    message=f"Distributed research: {counts.get(DONE, 0)} nodes done, "
+                    f"{counts.get(RUNNING, 0)} running, {counts.get(QUEUED, 0)} queued"
+                )
+            )
+        pending = counts.get(QUEUED, 0) + counts.get(RUNNING, 0)
+        if not pending:
+            break
+        if new or counts.get(RUNNING, 0):
+            last_progress = time.monotonic()
+        elif claim_timeout is not None and time.monotonic() - last_progress > claim_timeout:
+            await queue.cancel(run_id)
+            raise RuntimeError(
+                f"No worker claimed a node of distributed run {run_id} for {claim_timeout:.0f}s; "
+                "start workers with `deep-research worker` or set RESEARCH_WORKERS"
+            )
+        if expired():
+            cancelled = await queue.cancel(run_id)
+            record_cancellation("research", cancelled, counts.get(DONE, 0), "deadline")
+            break
+        left = remaining()
+        await asyncio.sleep(poll_interval if left is None else max(0.0, min(poll_interval, left)))
+
+    if counts.get(FAILED):
+        log_event("Distributed run %s: %s nodes failed", run_id, counts[FAILED])
+    for result in results:
+        if result.get("reused"):
+            run.knowledge_usage.skipped_searches += 1
+            run.knowledge_usage.reused_learnings += len(result["learnings"])
+        else:
+            run.knowledge_usage.added_learnings += len(result["learnings"])
+    report_knowledge_usage(run)
+    # Nodes in tree order, so the learnings read like a single-process run
+    results.sort(key=lambda r: [int(part) for part in r["node_id"].split(".")])
+    all_learnings = list(dict.fromkeys(learnings + [learning for r in results for learning in r["learnings"]]))
+    all_urls = list(dict.fromkeys(visited_urls + [u for r in results for u in r["urls"]]))
+    return {"learnings": all_learnings, "visited_urls": all_urls}
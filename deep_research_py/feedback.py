@@ -1,6 +1,4 @@
-from typing import List, Optional
-import openai
-import ollama
+from typing import TYPE_CHECKING, List, Optional, Union
 import json
 from .prompt import system_prompt
 from .common.logging import log_error, log_event
@@ -13,13 +11,17 @@ from deep_research_py.utils import get_service
 from pydantic import BaseModel
 import re
 
+if TYPE_CHECKING:
+    import ollama
+    import openai
+
 class FeedbackResponse(BaseModel):
     questions: List[str]
 
 
 async def generate_feedback(
     query: str,
-    client: Optional[openai.OpenAI | ollama.Client],
+    client: Optional[Union["openai.OpenAI", "ollama.Client"]],
     model: str,
     max_feedbacks: int = 5,
 ) -> List[str]:
@@ -44,6 +46,7 @@ Requirements for the follow-up questions:
         ],
         # format=FeedbackResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="generate_feedback",
     )
 
     # Parse the JSON response
@@ -66,12 +69,12 @@ Requirements for the follow-up questions:
             parse_openai_token_consume("generate_feedback", response)
 
         log_event(
-            f"Generated {max_feedbacks} feedback follow-up questions for query: {query}"
+            "Generated %s feedback follow-up questions for query: %s", max_feedbacks, query
         )
-        log_event(f"Got feedback follow-up questions: {result}")
+        log_event("Got feedback follow-up questions: %s", result)
         return [result]
     except json.JSONDecodeError as e:
         print(f"Error parsing JSON response: {e}")
         print(f"Raw response: {response.choices[0].message.content}")
-        log_error(f"Failed to parse JSON response for query: {query}")
+        log_error("Failed to parse JSON response for query: %s", query)
         return []
@@ -0,0 +1,232 @@
+"""Fetches pages the search engine returned without content.
+
+Such results used to contribute only their snippet. `PageFetcher` downloads them
+concurrently over one shared aiohttp connection pool, with a cap on connections
+per host, honours robots.txt, skips non-text content types, and stops reading
+after a size and time limit. HTML is converted to markdown in the CPU process
+pool so parsing large pages never blocks the event loop.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+from .common.cpu import run_in_process
+from .common.deadline import gather_partial, timeout_for
+from .common.html_markdown import html_to_markdown
+from .common.logging import log_event
+from .common.profiling import timed
+
+USER_AGENT = "deep-research-py/0.1 (+https://github.com/epuerta9/deep-research-py)"
+TEXT_TYPES = ("text/html", "application/xhtml+xml", "text/plain")
+CHUNK_SIZE = 64 * 1024
+# Once this share of the pages is fetched, the rest get 3x as long as that took
+FETCH_QUORUM = 0.8
+
+
+class PageFetcher:
+    """Downloads pages as markdown.
+
+    Args:
+        max_connections: Open connections across all hosts.
+        per_host: Open connections to one host.
+        timeout: Seconds a page (headers and body) may take; never past the run's deadline.
+        max_bytes: Bytes of a body read at most; longer pages are cut.
+        respect_robots: Skip URLs the host's robots.txt disallows for `user_agent`.
+        content_types: Accepted media types; other responses are skipped unread.
+        robots_ttl: Seconds a host's robots.txt is cached.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 32,
+        per_host: int = 2,
+        timeout: float = 10.0,
+        max_bytes: int = 2_000_000,
+        respect_robots: bool = True,
+        user_agent: str = USER_AGENT,
+        content_types: Tuple[str, ...] = TEXT_TYPES,
+        robots_ttl: float = 3600.0,
+    ):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self.content_types = content_types
+        self.robots_ttl = robots_ttl
+        self._session = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._robots: Dict[str, Tuple[float, Optional[RobotFileParser]]] = {}
+        self._robot_locks: Dict[str, asyncio.Lock] = {}
+        self.counts = {
+            "fetched": 0,
+            "truncated": 0,
+            "robots": 0,
+            "content_type": 0,
+            "errors": 0,
+            "timeouts": 0,
+        }
+
+    async def _get_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Sessions belong to one event loop; every run of the CLI has its own
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections, limit_per_host=self.per_host, ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector, headers={"User-Agent": self.user_agent}
+            )
+            self._loop = loop
+            self._robot_locks = {}
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+
+    async def _load_robots(self, origin: str) -> Optional[RobotFileParser]:
+        """The host's rules, or None when every URL may be fetched."""
+        import aiohttp
+
+        session = await self._get_session()
+        try:
+            async with session.get(
+                origin + "/robots.txt", timeout=aiohttp.ClientTimeout(total=min(5.0, self.timeout))
+            ) as response:
+                if response.status in (401, 403):
+                    parser = RobotFileParser()
+                    parser.disallow_all = True
+                    return parser
+                if response.status >= 400:
+                    return None
+                text = (await response.content.read(512 * 1024)).decode("utf-8", "replace")
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        parser = RobotFileParser()
+        parser.parse(text.splitlines())
+        return parser
+
+    async def allowed(self, url: str) -> bool:
+        parts = urlsplit(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        entry = self._robots.get(origin)
+        if entry is None or entry[0] < time.monotonic():
+            # One robots.txt request per host, however many of its pages are fetched
+            async with self._robot_locks.setdefault(origin, asyncio.Lock()):
+                entry = self._robots.get(origin)
+                if entry is None or entry[0] < time.monotonic():
+                    entry = (time.monotonic() + self.robots_ttl, await self._load_robots(origin))
+                    self._robots[origin] = entry
+        return entry[1] is None or entry[1].can_fetch(self.user_agent, url)
+
+    async def fetch(self, url: str) -> Optional[str]:
+        """The page as markdown (plain text as is), or None if it was skipped or failed."""
+        import aiohttp
+
+        if not url.startswith(("http://", "https://")):
+            return None
+        if self.respect_robots and not await self.allowed(url):
+            self.counts["robots"] += 1
+            return None
+        timeout = timeout_for(self.timeout)
+        if timeout is not None and timeout <= 0:
+            return None
+
+        session = await self._get_session()
+        body = bytearray()
+        try:
+            async with session.get(
+                url, timeout=aiohttp.ClientTimeout(total=timeout), max_redirects=5
+            ) as response:
+                if response.status != 200:
+                    self.counts["errors"] += 1
+                    return None
+                content_type = response.content_type.lower()
+                if content_type not in self.content_types:
+                    self.counts["content_type"] += 1
+                    return None
+                charset = response.charset or "utf-8"
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    body += chunk
+                    if len(body) >= self.max_bytes:
+                        self.counts["truncated"] += 1
+                        del body[self.max_bytes :]
+                        break
+        except asyncio.TimeoutError:
+            self.counts["timeouts"] += 1
+            return None
+        except (aiohttp.ClientError, ValueError):
+            self.counts["errors"] += 1
+            return None
+
+        try:
+            text = body.decode(charset, errors="replace")
+        except LookupError:
+            text = body.decode("utf-8", errors="replace")
+        del body
+        self.counts["fetched"] += 1
+        if content_type == "text/plain":
+            return text
+        with timed("cpu", "html_to_markdown"):
+            return await run_in_process(html_to_markdown, text)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counts)
+
+
+async def fill_missing_contents(
+    results: List[Dict[str, Any]], fetcher: "PageFetcher"
+) -> List[Dict[str, Any]]:
+    """Fetches, all at once, the pages of results that came without content."""
+    missing = [
+        item
+        for item in results
+        if isinstance(item, dict)
+        and item.get("url")
+        and not item.get("content")
+        and not item.get("markdown")
+    ]
+    if not missing:
+        return results
+    pages = await gather_partial(
+        [fetcher.fetch(item["url"]) for item in missing],
+        stage="fetch",
+        straggler_quantile=FETCH_QUORUM,
+    )
+    filled = 0
+    for item, page in zip(missing, pages):
+        if page:
+            item["content"] = page
+            filled += 1
+    log_event("Fetched %s of %s pages missing from search results", filled, len(missing))
+    return results
+
+
+_page_fetcher: Optional[PageFetcher] = None
+
+
+def get_page_fetcher() -> Optional[PageFetcher]:
+    """The process-wide fetcher; None when `FETCH_PAGES=0`."""
+    global _page_fetcher
+    if _page_fetcher is None and os.getenv("FETCH_PAGES", "1") != "0":
+        _page_fetcher = PageFetcher(
+            per_host=int(os.getenv("FETCH_PER_HOST", "2")),
+            timeout=float(os.getenv("FETCH_TIMEOUT", "10")),
+            max_bytes=int(os.getenv("FETCH_MAX_BYTES", "2000000")),
+            respect_robots=os.getenv("FETCH_RESPECT_ROBOTS", "1") != "0",
+        )
+    return _page_fetcher
+
+
+def set_page_fetcher(fetcher: Optional[PageFetcher]) -> None:
+    global _page_fetcher
+    _page_fetcher = fetcher
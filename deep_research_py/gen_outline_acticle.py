@@ -1,9 +1,14 @@
 
 from datetime import datetime
-from ai.providers import trim_prompt, generate_completions
-from prompt import system_prompt
+from .ai.providers import trim_prompt, generate_completions
+from .prompt import system_prompt
+from .common.deadline import gather_partial, record_cancellation
+from .common.token_cunsumption import parse_openai_token_consume
+from .common.events import SectionEvent, StatusEvent, emit
 import asyncio
-import streamlit as st
+
+# Once this share of the sections is written, the rest get 3x as long as that took
+SECTION_QUORUM = 0.75
 
 
 async def write_outline(prompt, learnings_string, client, model):
@@ -43,7 +48,9 @@ The topic you want to write:{prompt}
         ],
         # format=FinalReportResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="write_outline",
     )
+    parse_openai_token_consume("write_outline", response)
 
     outlines = response.choices[0].message.content
 
@@ -94,7 +101,9 @@ Draft outline:
         ],
         # format=FinalReportResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="write_outline_polish",
     )
+    parse_openai_token_consume("write_outline_polish", response)
     outlines = response.choices[0].message.content
 
     return outlines
@@ -171,8 +180,11 @@ section writing potin:{second_subtitle_str}
         ],
         # format=FinalReportResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="generate_section",
     )
+    parse_openai_token_consume("generate_section", response)
     section_content = response.choices[0].message.content
+    emit(SectionEvent(title=first_subtitle, content=section_content))
     return section_content
 
 
@@ -204,9 +216,7 @@ Already written text:
 {prev_article}
 """
 
-    print("> continue writing section ...")
-    with st.chat_message("assistant"):
-        st.markdown("> Already writing a section,continue writing section ...")
+    emit(StatusEvent(message="> Already writing a section,continue writing section ..."))
 
     response = await generate_completions(
         client=client,
@@ -217,8 +227,11 @@ Already written text:
         ],
         # format=FinalReportResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="generate_section",
     )
+    parse_openai_token_consume("generate_section", response)
     section_content = response.choices[0].message.content
+    emit(SectionEvent(title=first_subtitle, content=section_content))
     return section_content
 
 
@@ -243,7 +256,7 @@ The draft article:
 {article}
 """
 
-    print("> polish acticle ")    
+    emit(StatusEvent(message="> polish acticle "))
     response = await generate_completions(
         client=client,
         model=model,
@@ -253,7 +266,9 @@ The draft article:
         ],
         # format=FinalReportResponse.model_json_schema(),
         # format={"type": "json_object"},
+        stage="polish_article",
     )
+    parse_openai_token_consume("polish_article", response)
     full_content = response.choices[0].message.content
     return full_content
     
@@ -273,7 +288,7 @@ async def generate_article(prompt, learnings_string, client, model, outlines, wr
     section_output_dict_collection = {}
 
     if writing_method == "parallel" or writing_method == "polish":
-        print("< parallel generate article ")
+        emit(StatusEvent(message="< parallel generate article "))
         tasks = []
 
         for index, section_title in enumerate(sections_to_write):
@@ -283,29 +298,39 @@ async def generate_article(prompt, learnings_string, client, model, outlines, wr
             tasks.append(generate_section(prompt, learnings_string, model, client, outlines, first_subtitle, second_subtitle))
             # tasks.append((task, index))
         
-        tasks = await asyncio.gather(*tasks)
+        tasks = await gather_partial(tasks, stage="sections", straggler_quantile=SECTION_QUORUM)
     
         # 收集结果，保持顺序
         # for task, index in tasks:
         #     section_output_dict_collection[index] = task.result().strip()
         # sorted_dict = dict(sorted(section_output_dict_collection.items(), key=lambda item: item[0]))
         
-        article = "\n\n".join(tasks)
+        # 超时被取消的章节为 None, 直接跳过
+        article = "\n\n".join(section for section in tasks if section)
 
         # polish the article
-        if writing_method == "polish":
-            article = await polish_article(prompt, outlines, article, model, client)
+        if writing_method == "polish" and article:
+            try:
+                article = await polish_article(prompt, outlines, article, model, client)
+            except asyncio.TimeoutError:
+                # Keep the unpolished article
+                record_cancellation("polish", 1, 0, "timeout")
     elif writing_method == "serial":
         # serial generate the article
         prev_article = ""
-        print("< serial generate article ")
+        emit(StatusEvent(message="< serial generate article "))
         article = ""
-        for section_title in sections_to_write:
+        for index, section_title in enumerate(sections_to_write):
             first_subtitle = section_title['first_subtitle']
             second_subtitle = section_title['second_subtitle']
 
 
-            section_content = await generate_section_serial(prompt, learnings_string, model, client, outlines, first_subtitle, second_subtitle, prev_article)
+            try:
+                section_content = await generate_section_serial(prompt, learnings_string, model, client, outlines, first_subtitle, second_subtitle, prev_article)
+            except asyncio.TimeoutError:
+                # Out of time: the article ends with the sections written so far
+                record_cancellation("sections", len(sections_to_write) - index, index, "timeout")
+                break
 
             article = article + "\n\n" + section_content
             prev_article = section_content
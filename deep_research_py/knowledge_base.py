@@ -0,0 +1,330 @@
+"""Knowledge base of learnings kept across research runs.
+
+Every SERP query a run researches is stored with its learnings, follow-up
+questions, source URLs and time in `<root>/knowledge.db`. Queries and learnings
+also get a local embedding: the character shingles of the text (see
+`common/similarity.py`) hashed into a fixed number of signed buckets and
+normalized. No model call is needed, and it works the same for English and
+Chinese. The vectors are float32 rows appended to `queries.f32` and
+`learnings.f32`; row `i` belongs to the record with id `i + 1`. Searches
+read the files through mmap, with NumPy when it is installed and in pure Python
+otherwise.
+
+A run uses the knowledge base in two ways:
+
+- Before it searches, the learnings most similar to the topic that are younger
+  than `max_age_days` seed the run as prior learnings.
+- With `skip_searches`, a SERP query close to one researched less than
+  `fresh_days` ago is not searched again; the earlier query's learnings are
+  reused. Otherwise every query is still searched.
+"""
+
+import heapq
+import json
+import math
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from dataclasses import asdict, dataclass
+from operator import mul
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .common.logging import log_event
+from .common.similarity import shingles
+
+DIM = 512
+DAY = 24 * 60 * 60
+
+
+def embed(text: str, dim: int = DIM) -> array:
+    """Unit-length float32 vector of the text's hashed shingles."""
+    vector = array("f", bytes(4 * dim))
+    for gram in shingles(text):
+        h = zlib.crc32(gram.encode("utf-8"))
+        # Low bits pick the bucket, the top bit its sign
+        vector[h % dim] += -1.0 if h & 0x80000000 else 1.0
+    norm = math.sqrt(sum(v * v for v in vector))
+    if norm:
+        for i in range(dim):
+            vector[i] /= norm
+    return vector
+
+
+class VectorIndex:
+    """Float32 vectors in a flat file, one row per record id, searched through mmap."""
+
+    def __init__(self, path: str, dim: int = DIM):
+        self.path = path
+        self.dim = dim
+        self.row_bytes = 4 * dim
+        if not os.path.exists(path):
+            open(path, "ab").close()
+
+    def write(self, record_id: int, vector: array) -> None:
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, vector.tobytes(), (record_id - 1) * self.row_bytes)
+        finally:
+            os.close(fd)
+
+    def nearest(self, vector: array, min_score: float, limit: int) -> List[Tuple[int, float]]:
+        """(record id, cosine similarity) of the best rows scoring at least `min_score`."""
+        rows = os.path.getsize(self.path) // self.row_bytes
+        if not rows:
+            return []
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            try:
+                import numpy
+            except ImportError:
+                return self._nearest_python(mapped, rows, vector, min_score, limit)
+            matrix = numpy.frombuffer(mapped, dtype=numpy.float32, count=rows * self.dim)
+            scores = matrix.reshape(rows, self.dim) @ numpy.frombuffer(vector, dtype=numpy.float32)
+            # The mmap cannot close while an array still points into it
+            del matrix
+        candidates = numpy.flatnonzero(scores >= min_score)
+        if len(candidates) > limit:
+            candidates = candidates[numpy.argpartition(scores[candidates], -limit)[-limit:]]
+        return sorted(((int(row) + 1, float(scores[row])) for row in candidates), key=lambda item: -item[1])
+
+    def _nearest_python(
+        self, mapped: mmap.mmap, rows: int, vector: array, min_score: float, limit: int
+    ) -> List[Tuple[int, float]]:
+        dim = self.dim
+        with memoryview(mapped) as raw, raw.cast("f") as floats:
+            scores = [sum(map(mul, floats[row * dim : (row + 1) * dim], vector)) for row in range(rows)]
+        best = heapq.nlargest(limit, range(rows), key=scores.__getitem__)
+        return [(row + 1, scores[row]) for row in best if scores[row] >= min_score]
+
+
+@dataclass
+class Coverage:
+    """An earlier query close enough to a new one to reuse its findings."""
+
+    query: str
+    score: float
+    age_days: float
+    learnings: List[str]
+    follow_up_questions: List[str]
+    urls: List[str]
+
+
+@dataclass
+class KnowledgeUsage:
+    """What one run took from and gave to the knowledge base."""
+
+    seeded_learnings: int = 0
+    skipped_searches: int = 0
+    reused_learnings: int = 0
+    added_learnings: int = 0
+    added_queries: int = 0
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class KnowledgeBase:
+    """Learnings of past runs, with their queries, sources and embeddings.
+
+    Args:
+        root: Directory of the knowledge base; shared by every run that uses it.
+        max_age_days: Learnings older than this do not seed runs.
+        fresh_days: Queries older than this are researched again.
+        min_score: Similarity a learning needs to the topic to seed a run.
+        cover_threshold: Similarity of a new SERP query to a fresh earlier one
+            at which its search is skipped.
+        skip_searches: Reuse the learnings of fresh, nearly identical queries
+            instead of searching again.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_age_days: float = 90,
+        fresh_days: float = 7,
+        min_score: float = 0.25,
+        cover_threshold: float = 0.8,
+        skip_searches: bool = False,
+        dim: int = DIM,
+    ):
+        self.root = root
+        self.max_age_days = max_age_days
+        self.fresh_days = fresh_days
+        self.min_score = min_score
+        self.cover_threshold = cover_threshold
+        self.skip_searches = skip_searches
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "knowledge.db")
+        self.query_index = VectorIndex(os.path.join(root, "queries.f32"), dim)
+        self.learning_index = VectorIndex(os.path.join(root, "learnings.f32"), dim)
+        self.dim = dim
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS queries (
+                    id INTEGER PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    research_goal TEXT NOT NULL,
+                    follow_up_questions TEXT NOT NULL,
+                    urls TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS learnings (
+                    id INTEGER PRIMARY KEY,
+                    query_id INTEGER NOT NULL REFERENCES queries (id),
+                    text TEXT NOT NULL UNIQUE,
+                    created REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS learnings_query ON learnings (query_id);
+                """
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def add(
+        self,
+        query: str,
+        research_goal: str,
+        learnings: Sequence[str],
+        follow_up_questions: Sequence[str],
+        urls: Sequence[str],
+    ) -> int:
+        """Stores a researched query and its learnings; returns how many learnings were new."""
+        now = time.time()
+        query_vector = embed(query, self.dim)
+        learning_vectors = [embed(learning, self.dim) for learning in learnings]
+        added = 0
+        with self._lock, self._connect() as db:
+            # Ids and vector rows are assigned together, in one writer at a time
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                query_id = db.execute(
+                    "INSERT INTO queries (query, research_goal, follow_up_questions, urls, created) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        query,
+                        research_goal,
+                        json.dumps(list(follow_up_questions), ensure_ascii=False),
+                        json.dumps(list(urls), ensure_ascii=False),
+                        now,
+                    ),
+                ).lastrowid
+                self.query_index.write(query_id, query_vector)
+                for learning, vector in zip(learnings, learning_vectors):
+                    cursor = db.execute(
+                        "INSERT OR IGNORE INTO learnings (query_id, text, created) VALUES (?, ?, ?)",
+                        (query_id, learning, now),
+                    )
+                    if cursor.rowcount:
+                        self.learning_index.write(cursor.lastrowid, vector)
+                        added += 1
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return added
+
+    def recall(self, text: str, limit: int = 20) -> Tuple[List[str], List[str]]:
+        """Learnings related to `text` that are not older than `max_age_days`, and their URLs."""
+        matches = self.learning_index.nearest(embed(text, self.dim), self.min_score, limit * 4)
+        if not matches:
+            return [], []
+        cutoff = time.time() - self.max_age_days * DAY
+        ids = [record_id for record_id, _ in matches]
+        with self._connect() as db:
+            rows = db.execute(
+                f"SELECT learnings.id, learnings.text, queries.urls FROM learnings "
+                f"JOIN queries ON queries.id = learnings.query_id "
+                f"WHERE learnings.id IN ({','.join('?' * len(ids))}) AND learnings.created >= ?",
+                (*ids, cutoff),
+            ).fetchall()
+        by_id = {record_id: (text, urls) for record_id, text, urls in rows}
+        learnings: List[str] = []
+        urls: Dict[str, None] = {}
+        for record_id in ids:
+            if record_id in by_id and len(learnings) < limit:
+                learnings.append(by_id[record_id][0])
+                urls.update(dict.fromkeys(json.loads(by_id[record_id][1])))
+        return learnings, list(urls)
+
+    def covering(self, query: str) -> Optional[Coverage]:
+        """The closest query researched within `fresh_days` that found learnings, if close
+        enough; always None unless `skip_searches` is set."""
+        if not self.skip_searches:
+            return None
+        matches = self.query_index.nearest(embed(query, self.dim), self.cover_threshold, 5)
+        if not matches:
+            return None
+        now = time.time()
+        with self._connect() as db:
+            for record_id, score in matches:
+                row = db.execute(
+                    "SELECT query, follow_up_questions, urls, created FROM queries WHERE id = ? AND created >= ?",
+                    (record_id, now - self.fresh_days * DAY),
+                ).fetchone()
+                if row is None:
+                    continue
+                learnings = [
+                    text
+                    for (text,) in db.execute(
+                        "SELECT text FROM learnings WHERE query_id = ? ORDER BY id", (record_id,)
+                    )
+                ]
+                if not learnings:
+                    # Learnings first found by another query are stored with that one
+                    continue
+                return Coverage(
+                    query=row[0],
+                    score=score,
+                    age_days=(now - row[3]) / DAY,
+                    learnings=learnings,
+                    follow_up_questions=json.loads(row[1]),
+                    urls=json.loads(row[2]),
+                )
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._connect() as db:
+            queries = db.execute("SELECT COUNT(*) FROM queries").fetchone()[0]
+            learnings = db.execute("SELECT COUNT(*) FROM learnings").fetchone()[0]
+        return {"queries": queries, "learnings": learnings}
+
+
+_knowledge_base: Optional[KnowledgeBase] = None
+_knowledge_base_loaded = False
+
+
+def get_knowledge_base() -> Optional[KnowledgeBase]:
+    """The process-wide knowledge base in `KNOWLEDGE_DIR` (default `.deep_research/knowledge`).
+
+    Only used with `KNOWLEDGE_BASE=1`, and never while a cassette is replayed, so
+    replays see the same searches as the recording. Searches are only skipped
+    with `KNOWLEDGE_SKIP_SEARCHES=1`.
+    """
+    global _knowledge_base, _knowledge_base_loaded
+    if not _knowledge_base_loaded:
+        from .cassette import get_cassette
+
+        _knowledge_base_loaded = True
+        cassette = get_cassette()
+        if os.getenv("KNOWLEDGE_BASE", "0") != "0" and not (cassette and cassette.replaying):
+            _knowledge_base = KnowledgeBase(
+                os.getenv("KNOWLEDGE_DIR", os.path.join(".deep_research", "knowledge")),
+                max_age_days=float(os.getenv("KNOWLEDGE_MAX_AGE_DAYS", "90")),
+                fresh_days=float(os.getenv("KNOWLEDGE_FRESH_DAYS", "7")),
+                skip_searches=os.getenv("KNOWLEDGE_SKIP_SEARCHES", "0") != "0",
+            )
+            log_event("Knowledge base: %s", _knowledge_base.stats())
+    return _knowledge_base
+
+
+def set_knowledge_base(knowledge_base: Optional[KnowledgeBase]) -> None:
+    global _knowledge_base, _knowledge_base_loaded
+    _knowledge_base = knowledge_base
+    _knowledge_base_loaded = True
@@ -0,0 +1,85 @@
+"""Novelty scoring of research branches.
+
+After a SERP query has been processed, its new learnings are compared with
+everything the run has learned so far. A branch whose learnings are mostly
+already known is unlikely to get better further down, so it stops expanding.
+Optionally the searches such a branch would have spent are handed to branches
+that are still finding new things.
+"""
+
+import threading
+from typing import FrozenSet, List
+
+from .common.similarity import max_similarity, shingles
+
+
+class NoveltyTracker:
+    """Run-wide record of known learnings, used to score and prune branches.
+
+    Args:
+        threshold: Branches scoring below this novelty (0..1) stop expanding.
+        reassign_budget: Give the searches saved by pruned branches to branches
+            scoring at least `boost_threshold`.
+        boost_threshold: Novelty a branch needs to receive saved budget.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.15,
+        reassign_budget: bool = False,
+        boost_threshold: float = 0.6,
+    ):
+        self.threshold = threshold
+        self.reassign_budget = reassign_budget
+        self.boost_threshold = boost_threshold
+        self._known: List[FrozenSet[str]] = []
+        self._lock = threading.Lock()
+        self.pruned = 0
+        self.saved_budget = 0
+        self.reassigned = 0
+
+    def add_known(self, learnings: List[str]) -> None:
+        with self._lock:
+            self._known.extend(shingles(learning) for learning in learnings)
+
+    def observe(self, learnings: List[str]) -> float:
+        """Scores `learnings` against what is known, then adds them to it.
+
+        The score is the mean over the learnings of one minus their highest
+        shingle similarity to a known learning; no learnings at all score 0.
+        """
+        candidates = [shingles(learning) for learning in learnings]
+        with self._lock:
+            if not candidates:
+                return 0.0
+            novelty = sum(1 - max_similarity(c, self._known) for c in candidates) / len(candidates)
+            self._known.extend(candidates)
+        return novelty
+
+    def should_expand(self, novelty: float, breadth: int) -> bool:
+        """Whether a branch with this novelty goes deeper; records the saved budget if not."""
+        if novelty >= self.threshold:
+            return True
+        with self._lock:
+            self.pruned += 1
+            self.saved_budget += breadth
+        return False
+
+    def extra_breadth(self, novelty: float, breadth: int) -> int:
+        """Saved searches granted to a productive branch, at most doubling its breadth."""
+        if not self.reassign_budget or novelty < self.boost_threshold:
+            return 0
+        with self._lock:
+            extra = min(breadth, self.saved_budget - self.reassigned)
+            if extra <= 0:
+                return 0
+            self.reassigned += extra
+        return extra
+
+    def stats(self) -> dict:
+        return {
+            "known_learnings": len(self._known),
+            "pruned_branches": self.pruned,
+            "saved_searches": self.saved_budget,
+            "reassigned_searches": self.reassigned,
+        }
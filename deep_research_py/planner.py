@@ -0,0 +1,374 @@
+"""Best-first research planner.
+
+The classic tree gives every branch the same effort: `breadth` queries on the
+first level, `max(1, breadth // 2)` below each of them, down to `depth`. The
+planner instead keeps every candidate SERP query in a priority queue and always
+researches the most promising one next, until a global node or token budget is
+spent. A candidate's score combines how novel and how diverse its parent's
+findings were with the model's own rating of the query.
+"""
+
+import asyncio
+import heapq
+import itertools
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .common.deadline import cancel_all, expired, record_cancellation, remaining
+from .common.events import NoveltyEvent, StatusEvent, emit
+from .common.logging import log_event, set_log_context
+from .common.token_cunsumption import counter
+from .deep_research import (
+    ResearchResult,
+    ResearchRun,
+    SerpQuery,
+    report_knowledge_usage,
+    research_node,
+    seed_from_knowledge,
+    select_serp_queries,
+)
+from .knowledge_base import get_knowledge_base
+from .novelty import NoveltyTracker
+from .query_registry import QueryRegistry
+from .research_store import BranchView, ResearchStore
+
+if TYPE_CHECKING:
+    import openai
+
+# Weights of the candidate score; they sum to 1
+NOVELTY_WEIGHT = 0.5
+DIVERSITY_WEIGHT = 0.2
+RATING_WEIGHT = 0.3
+# Each level down is worth a bit less, so equally scored candidates stay shallow
+DEPTH_DISCOUNT = 0.9
+
+
+@dataclass
+class PlannerBudget:
+    """Global limits of a planner run.
+
+    Args:
+        max_nodes: SERP queries researched at most.
+        max_tokens: Input plus output tokens after which no new node starts.
+            Counted on the process-wide token counter.
+    """
+
+    max_nodes: int
+    max_tokens: Optional[int] = None
+
+
+@dataclass
+class _Candidate:
+    serp_query: SerpQuery
+    node_id: str
+    view: BranchView
+    level: int
+
+
+def source_diversity(urls: List[str]) -> float:
+    """Share of distinct hosts among `urls`; 0 for no URLs."""
+    if not urls:
+        return 0.0
+    return len({urlparse(url).netloc for url in urls}) / len(urls)
+
+
+def score_candidate(
+    serp_query: SerpQuery, parent_novelty: float, parent_diversity: float, level: int
+) -> float:
+    """Expected information gain of researching `serp_query`, from 0 to 1."""
+    if serp_query.expected_value is None:
+        rating = 0.5
+    else:
+        rating = min(max(serp_query.expected_value / 10, 0.0), 1.0)
+    score = (
+        NOVELTY_WEIGHT * parent_novelty
+        + DIVERSITY_WEIGHT * parent_diversity
+        + RATING_WEIGHT * rating
+    )
+    return score * DEPTH_DISCOUNT ** (level - 1)
+
+
+def _tokens_used() -> int:
+    return counter.total_input_tokens + counter.total_output_tokens
+
+
+async def best_first_research(
+    query: str,
+    breadth: int,
+    depth: int,
+    concurrency: int,
+    client: "openai.OpenAI",
+    model: str,
+    budget: PlannerBudget,
+    learnings: List[str] = None,
+    visited_urls: List[str] = None,
+    registry: Optional[QueryRegistry] = None,
+    novelty: Optional[NoveltyTracker] = None,
+    store: Optional[ResearchStore] = None,
+) -> ResearchResult:
+    """
+    Researches a topic best-first until the budget is spent.
+
+    Args:
+        query: Research query/topic
+        breadth: Number of SERP queries generated for the topic
+        depth: Deepest level a candidate may be on
+        budget: Global node and token limits
+        learnings: Previous learnings to build upon
+        visited_urls: Previously visited URLs
+        registry: Queries already scheduled, to avoid asking them again
+        novelty: Scores branches; branches below its threshold get no children
+        store: Receives the run's learnings and sources as records
+    """
+    run = ResearchRun(
+        store=store if store is not None else ResearchStore(),
+        registry=registry if registry is not None else QueryRegistry(),
+        novelty=novelty if novelty is not None else NoveltyTracker(),
+        concurrency=concurrency,
+        client=client,
+        model=model,
+        knowledge=get_knowledge_base(),
+    )
+    learnings, visited_urls = await seed_from_knowledge(
+        run, query, learnings or [], visited_urls or []
+    )
+    run.novelty.add_known(learnings)
+    child_breadth = max(2, breadth // 2)
+    tokens_at_start = _tokens_used()
+    started = 0
+
+    def exhausted() -> bool:
+        if started >= budget.max_nodes or expired():
+            return True
+        return bool(budget.max_tokens) and _tokens_used() - tokens_at_start >= budget.max_tokens
+
+    frontier: list = []
+    order = itertools.count()
+
+    def push(
+        queries: List[SerpQuery],
+        parent_id: str,
+        view: BranchView,
+        level: int,
+        parent_novelty: float,
+        parent_diversity: float,
+    ) -> None:
+        for i, serp_query in enumerate(queries):
+            score = score_candidate(serp_query, parent_novelty, parent_diversity, level)
+            candidate = _Candidate(
+                serp_query=serp_query,
+                node_id=f"{parent_id}.{i}" if parent_id else str(i),
+                view=view,
+                level=level,
+            )
+            # The counter breaks ties, so candidates themselves are never compared
+            heapq.heappush(frontier, (-score, next(order), candidate))
+
+    async def expand(candidate: _Candidate) -> None:
+        serp_query = candidate.serp_query
+        set_log_context(node_id=candidate.node_id)
+        try:
+            node = await research_node(
+                serp_query, candidate.node_id, candidate.view, run, child_breadth
+            )
+            grow = (
+                candidate.level < depth
+                and not exhausted()
+                and run.novelty.should_expand(node.novelty, child_breadth)
+            )
+            log_event(
+                "Node %r novelty %.2f, expand: %s", serp_query.query, node.novelty, grow
+            )
+            emit(
+                NoveltyEvent(
+                    node_id=candidate.node_id,
+                    query=serp_query.query,
+                    novelty=round(node.novelty, 3),
+                    expanded=grow,
+                )
+            )
+            if not grow:
+                return
+
+            next_query = f"""
+            Previous research goal: {serp_query.research_goal}
+            Follow-up research directions: {" ".join(node.follow_up_questions)}
+            """.strip()
+            children = await select_serp_queries(
+                query=next_query,
+                client=run.client,
+                model=run.model,
+                breadth=child_breadth,
+                learnings=node.view.learnings(),
+                registry=run.registry,
+                rate=True,
+            )
+            push(
+                children,
+                candidate.node_id,
+                node.view,
+                candidate.level + 1,
+                node.novelty,
+                source_diversity(node.urls),
+            )
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError) or "Timeout" in str(e):
+                print(f"Timeout error running query: {serp_query.query}: {e}")
+            else:
+                print(f"Error running query: {serp_query.query}: {e}")
+
+    root = run.store.root_view(learnings, visited_urls)
+    try:
+        root_queries = await select_serp_queries(
+            query=query,
+            client=client,
+            model=model,
+            breadth=breadth,
+            learnings=learnings,
+            registry=run.registry,
+            rate=True,
+        )
+    except asyncio.TimeoutError:
+        record_cancellation("research", 1, 0, "timeout")
+        root_queries = []
+    push(root_queries, "", root, 1, 1.0, 1.0)
+
+    running = set()
+    try:
+        while frontier or running:
+            while frontier and len(running) < concurrency and not exhausted():
+                _, _, candidate = heapq.heappop(frontier)
+                started += 1
+                running.add(asyncio.create_task(expand(candidate)))
+            if not running:
+                break
+            done, running = await asyncio.wait(
+                running, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                # Deadline: keep what the finished nodes stored
+                await cancel_all(running, "research", "deadline", started - len(running))
+                break
+    except asyncio.CancelledError:
+        await cancel_all(running, "research", "parent cancelled", started - len(running))
+        raise
+
+    stats = {
+        "nodes": started,
+        "unexplored": len(frontier),
+        "tokens": _tokens_used() - tokens_at_start,
+    }
+    log_event("Planner: %s, registry: %s, novelty: %s", stats, run.registry.stats(), run.novelty.stats())
+    emit(
+        StatusEvent(
+            message=(
+                f"Researched {stats['nodes']} nodes best-first, "
+                f"{stats['unexplored']} candidates left unexplored"
+            )
+        )
+    )
+    report_knowledge_usage(run)
+    return {"learnings": run.store.learning_texts(), "visited_urls": run.store.urls()}
+
+
+# Rough tokens per call, measured on typical runs
+EXTRACT_TOKENS = (15_000, 400)
+QUERY_TOKENS = (1_500, 300)
+REPORT_TOKENS = (8_000, 1_500)
+# Outline, outline polish and about six sections
+REPORT_CALLS = 8
+
+# USD per million input and output tokens
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "o1-mini": (1.1, 4.4),
+    "o3-mini": (1.1, 4.4),
+    "o1": (15.0, 60.0),
+    "deepseek-chat": (0.27, 1.1),
+    "deepseek-reasoner": (0.55, 2.19),
+}
+
+
+@dataclass
+class Forecast:
+    nodes: int
+    searches: int
+    llm_calls: int
+    input_tokens: int
+    output_tokens: int
+    cost: Optional[float]
+
+    def describe(self) -> str:
+        cost = f"${self.cost:.2f}" if self.cost is not None else "unknown for this model"
+        return (
+            f"Forecast: {self.nodes} nodes, {self.searches} searches, "
+            f"{self.llm_calls} LLM calls, ~{self.input_tokens:,} input / "
+            f"{self.output_tokens:,} output tokens, cost {cost}"
+        )
+
+
+def tree_size(breadth: int, depth: int) -> tuple:
+    """Nodes of the classic tree, and how many of them generate child queries."""
+    nodes = internal = 0
+    level_nodes = 1
+    for level in range(depth):
+        level_nodes *= breadth
+        nodes += level_nodes
+        if level < depth - 1:
+            internal += level_nodes
+        breadth = max(1, breadth // 2)
+    return nodes, internal
+
+
+def forecast(
+    breadth: int,
+    depth: int,
+    model: str,
+    budget: Optional[PlannerBudget] = None,
+    stage_models: Optional[Dict[str, str]] = None,
+) -> Forecast:
+    """Estimates the calls and cost of a run before it starts.
+
+    Without a budget this is the classic tree; with one, the node budget caps the
+    tree and every node may generate children. A token budget caps the research
+    tokens; the report is written after it either way. `stage_models` prices the
+    calls of a stage at the model it is routed to.
+    """
+    nodes, internal = tree_size(breadth, depth)
+    if budget is not None:
+        nodes = min(nodes, budget.max_nodes)
+        internal = nodes
+    query_calls = 1 + internal
+    # (calls, input, output) per stage
+    usage = {
+        "process_serp_result": [nodes, nodes * EXTRACT_TOKENS[0], nodes * EXTRACT_TOKENS[1]],
+        "generate_serp_queries": [
+            query_calls, query_calls * QUERY_TOKENS[0], query_calls * QUERY_TOKENS[1]
+        ],
+    }
+    research_tokens = sum(u[1] + u[2] for u in usage.values())
+    if budget is not None and budget.max_tokens and research_tokens > budget.max_tokens:
+        share = budget.max_tokens / research_tokens
+        for u in usage.values():
+            u[1], u[2] = int(u[1] * share), int(u[2] * share)
+    usage["generate_section"] = [
+        REPORT_CALLS, REPORT_CALLS * REPORT_TOKENS[0], REPORT_CALLS * REPORT_TOKENS[1]
+    ]
+
+    cost: Optional[float] = 0.0
+    for stage, (_, input_tokens, output_tokens) in usage.items():
+        prices = MODEL_PRICES.get((stage_models or {}).get(stage, model))
+        if prices is None:
+            cost = None
+            break
+        cost += (input_tokens * prices[0] + output_tokens * prices[1]) / 1_000_000
+    return Forecast(
+        nodes=nodes,
+        searches=nodes,
+        llm_calls=sum(u[0] for u in usage.values()),
+        input_tokens=sum(u[1] for u in usage.values()),
+        output_tokens=sum(u[2] for u in usage.values()),
+        cost=cost,
+    )
@@ -0,0 +1,57 @@
+"""Run-wide registry of the SERP queries a research run has already scheduled.
+
+`generate_serp_queries` only keeps the queries of one call apart. Deeper in the
+tree, different branches tend to come up with the same questions again, and each
+one costs a search plus an extraction call. The registry remembers every query
+the run has scheduled and rejects new ones that are too similar to any of them.
+"""
+
+import threading
+from typing import FrozenSet, List, Tuple
+
+from .common.logging import log_event
+from .common.similarity import jaccard, shingles
+
+
+class QueryRegistry:
+    """Remembers scheduled queries and filters out near-duplicates.
+
+    Args:
+        threshold: Shingle Jaccard similarity at or above which a query counts as
+            a duplicate of one already scheduled.
+    """
+
+    def __init__(self, threshold: float = 0.6):
+        self.threshold = threshold
+        self._queries: List[Tuple[str, FrozenSet[str]]] = []
+        self._lock = threading.Lock()
+        self.avoided = 0
+        self.replacements_requested = 0
+
+    def add_known(self, queries: List[str]) -> None:
+        """Registers queries scheduled elsewhere (e.g. by another worker) without checking them."""
+        with self._lock:
+            self._queries.extend((query, shingles(query)) for query in queries)
+
+    @property
+    def queries(self) -> List[str]:
+        return [query for query, _ in self._queries]
+
+    def admit(self, query: str) -> bool:
+        """Registers `query` and returns True, unless it duplicates a registered query."""
+        candidate = shingles(query)
+        with self._lock:
+            for existing, existing_shingles in self._queries:
+                if jaccard(candidate, existing_shingles) >= self.threshold:
+                    self.avoided += 1
+                    log_event("Skipping SERP query %r, too similar to %r", query, existing)
+                    return False
+            self._queries.append((query, candidate))
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "queries": len(self._queries),
+            "avoided": self.avoided,
+            "replacements_requested": self.replacements_requested,
+        }
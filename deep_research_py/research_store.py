@@ -0,0 +1,118 @@
+"""Run-scoped store of what a research run has learned and where from.
+
+Records are appended once and never copied. A branch of the research tree sees
+its learnings through a `BranchView`: the ids the branch added plus a pointer to
+its parent's view, so going one level deeper costs only the new ids instead of a
+copy of every learning and URL above it.
+"""
+
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class Source:
+    __slots__ = ("url", "title")
+
+    def __init__(self, url: str, title: str = ""):
+        self.url = url
+        self.title = title
+
+
+class Learning:
+    __slots__ = ("text", "node_id", "source_ids")
+
+    def __init__(self, text: str, node_id: Optional[str], source_ids: Tuple[int, ...]):
+        self.text = text
+        self.node_id = node_id
+        self.source_ids = source_ids
+
+
+class ResearchStore:
+    """Append-only learnings and sources of one run; duplicates are stored once."""
+
+    def __init__(self):
+        self.learnings: List[Learning] = []
+        self.sources: List[Source] = []
+        self._learning_ids: Dict[str, int] = {}
+        self._source_ids: Dict[str, int] = {}
+
+    def add_sources(self, items: Iterable[Tuple[str, str]]) -> Tuple[int, ...]:
+        """Adds `(url, title)` pairs and returns their ids; known URLs keep their id."""
+        ids = []
+        for url, title in items:
+            source_id = self._source_ids.get(url)
+            if source_id is None:
+                url = sys.intern(url)
+                source_id = self._source_ids[url] = len(self.sources)
+                self.sources.append(Source(url, title))
+            ids.append(source_id)
+        return tuple(ids)
+
+    def add_learnings(
+        self, texts: Iterable[str], node_id: Optional[str] = None, source_ids: Tuple[int, ...] = ()
+    ) -> Tuple[int, ...]:
+        ids = []
+        for text in texts:
+            learning_id = self._learning_ids.get(text)
+            if learning_id is None:
+                learning_id = self._learning_ids[text] = len(self.learnings)
+                self.learnings.append(Learning(text, node_id, source_ids))
+            ids.append(learning_id)
+        return tuple(ids)
+
+    def root_view(self, learnings: Iterable[str] = (), urls: Iterable[str] = ()) -> "BranchView":
+        return BranchView(
+            self,
+            None,
+            self.add_learnings(learnings),
+            self.add_sources((url, "") for url in urls),
+        )
+
+    def learning_texts(self) -> List[str]:
+        return [learning.text for learning in self.learnings]
+
+    def urls(self) -> List[str]:
+        return [source.url for source in self.sources]
+
+
+class BranchView:
+    """The learnings and sources visible to one branch: its own plus its ancestors'."""
+
+    __slots__ = ("store", "parent", "learning_ids", "source_ids")
+
+    def __init__(
+        self,
+        store: ResearchStore,
+        parent: Optional["BranchView"],
+        learning_ids: Tuple[int, ...],
+        source_ids: Tuple[int, ...],
+    ):
+        self.store = store
+        self.parent = parent
+        self.learning_ids = learning_ids
+        self.source_ids = source_ids
+
+    def extend(self, learning_ids: Tuple[int, ...], source_ids: Tuple[int, ...]) -> "BranchView":
+        return BranchView(self.store, self, learning_ids, source_ids)
+
+    def _chain(self) -> List["BranchView"]:
+        views = []
+        view: Optional[BranchView] = self
+        while view is not None:
+            views.append(view)
+            view = view.parent
+        return views[::-1]
+
+    def _ids(self, attr: str) -> Iterator[int]:
+        seen = set()
+        for view in self._chain():
+            for i in getattr(view, attr):
+                if i not in seen:
+                    seen.add(i)
+                    yield i
+
+    def learnings(self) -> List[str]:
+        return [self.store.learnings[i].text for i in self._ids("learning_ids")]
+
+    def urls(self) -> List[str]:
+        return [self.store.sources[i].url for i in self._ids("source_ids")]
@@ -1,25 +1,50 @@
-from dotenv import load_dotenv
 import asyncio
+import os
+import sys
 import typer
+from contextlib import asynccontextmanager
 from functools import wraps
-from prompt_toolkit import PromptSession
+from typing import Optional
 from rich.panel import Panel
 from rich.progress import Progress, SpinnerColumn, TextColumn
 from rich import print as rprint
 
-from deep_research_py.deep_research import deep_research, write_final_report
+from deep_research_py.deep_research import combine_query, deep_research, write_final_report
+from deep_research_py.distributed import distributed_research, open_queue, start_worker_processes
 from deep_research_py.feedback import generate_feedback
-from deep_research_py.ai.providers import get_ai_client
-
-from deep_research_py.utils import console, set_service, set_model
+from deep_research_py.fetcher import get_page_fetcher
+from deep_research_py.search import close_search_sessions
+from deep_research_py.planner import PlannerBudget, best_first_research, forecast
+from deep_research_py.ai.pool import ClientPool
+from deep_research_py.ai.providers import fallback_stats, get_ai_client
+from deep_research_py.ai.routing import stage_models
+from deep_research_py.cassette import get_cassette
+
+from deep_research_py.utils import console, get_service, resolve_service, set_service, set_model
 from deep_research_py.common.token_cunsumption import counter
-from deep_research_py.common.logging import log_event
+from deep_research_py.common.deadline import deadline_scope
+from deep_research_py.common.profiling import profile_run
+from deep_research_py.common.logging import log_event, set_log_context
+from deep_research_py.common.singleflight import coalescing_stats
+from deep_research_py.common.events import (
+    ConsoleSink,
+    EventBus,
+    FeedbackEvent,
+    JsonlSink,
+    LearningsEvent,
+    ReportEvent,
+    StatusEvent,
+    StreamlitSink,
+    current_bus,
+    emit,
+)
 from datetime import datetime
-import streamlit as st
 
-load_dotenv()
 app = typer.Typer()
-session = PromptSession()
+session = None
+
+# Share of a run's deadline given to research; the rest is kept for the report
+RESEARCH_SHARE = 0.6
 
 
 def coro(f):
@@ -32,8 +57,152 @@ def coro(f):
 
 async def async_prompt(message: str, default: str = "") -> str:
     """Async wrapper for prompt_toolkit."""
+    global session
+    if session is None:
+        from prompt_toolkit import PromptSession
+
+        session = PromptSession()
     return await session.prompt_async(message)
 
+def run_name(query: str, start_time: datetime) -> str:
+    """Base name of the log, event and report files of a run."""
+    return f"{query}_{start_time.strftime('%Y%m%d%H%M%S')}"
+
+
+@asynccontextmanager
+async def ui_events(log_path: Optional[str], name: str):
+    """Routes progress events to the console, Streamlit and a JSONL file.
+
+    Runs driven by a job or background task already have a bus; events then go there.
+    """
+    if current_bus() is not None:
+        yield current_bus()
+        return
+
+    sinks = [ConsoleSink(console)]
+    if "streamlit" in sys.modules:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        if get_script_run_ctx() is not None:
+            sinks.append(StreamlitSink())
+    if log_path:
+        os.makedirs(log_path, exist_ok=True)
+        sinks.append(JsonlSink(os.path.join(log_path, f"{name}.events.jsonl")))
+    async with EventBus(sinks) as bus:
+        yield bus
+
+
+def reasoning_summary(stages) -> str:
+    """One line per stage that spent reasoning tokens."""
+    lines = [
+        f"- {stage}: {usage['reasoning']:,} reasoning / {usage['output']:,} output tokens in {usage['calls']} calls"
+        for stage, usage in stages.items()
+        if usage["reasoning"]
+    ]
+    return "Reasoning tokens by stage:\n" + "\n".join(lines)
+
+
+async def research(combined_query, breadth, depth, concurrency, client, model, budget=None):
+    """Runs the fixed research tree, or best-first research with a budget.
+
+    With `RESEARCH_QUEUE` set, the tree's nodes run on the workers of that queue;
+    `RESEARCH_WORKERS` (default 1) local worker processes are started for the run.
+    The run fails when no worker claims a node for `RESEARCH_CLAIM_TIMEOUT` seconds.
+    """
+    queue_url = os.getenv("RESEARCH_QUEUE")
+    if queue_url and budget is None:
+        queue = open_queue(queue_url)
+        # The workers live as long as the run; they are terminated below
+        local_workers = start_worker_processes(
+            queue_url, model, int(os.getenv("RESEARCH_WORKERS", "1")), concurrency
+        )
+        try:
+            return await distributed_research(
+                query=combined_query,
+                breadth=breadth,
+                depth=depth,
+                client=client,
+                model=model,
+                queue=queue,
+                claim_timeout=float(os.getenv("RESEARCH_CLAIM_TIMEOUT", "60")) or None,
+            )
+        finally:
+            await queue.close()
+            for worker in local_workers:
+                worker.terminate()
+    if budget is not None:
+        return await best_first_research(
+            query=combined_query,
+            breadth=breadth,
+            depth=depth,
+            concurrency=concurrency,
+            client=client,
+            model=model,
+            budget=budget,
+        )
+    return await deep_research(
+        query=combined_query,
+        breadth=breadth,
+        depth=depth,
+        concurrency=concurrency,
+        client=client,
+        model=model,
+    )
+
+
+async def research_and_report(
+    combined_query, breadth, depth, concurrency, client, model, budget=None
+):
+    """Runs the research tree and writes the final report.
+
+    With a `PlannerBudget` the research runs best-first instead of as a fixed tree.
+    """
+    estimate = forecast(breadth, depth, model, budget, stage_models(get_service(), model))
+    emit(StatusEvent(message=estimate.describe()))
+
+    # Now use Progress for the research phase
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        console=console,
+    ) as progress:
+        # Do research
+        task = progress.add_task(
+            "[yellow]Researching your topic...[/yellow]", total=None
+        )
+        with deadline_scope(fraction=RESEARCH_SHARE):
+            research_results = await research(
+                combined_query, breadth, depth, concurrency, client, model, budget
+            )
+        progress.remove_task(task)
+
+        log_event("\n[yellow]Learnings:[/yellow]")
+        for learning in research_results["learnings"]:
+            log_event("• %s", learning)
+        emit(
+            LearningsEvent(
+                learnings=research_results["learnings"],
+                visited_urls=research_results["visited_urls"],
+            )
+        )
+
+        # Generate report
+        task = progress.add_task("Writing final report...", total=None)
+        report = await write_final_report(
+            prompt=combined_query,
+            learnings=research_results["learnings"],
+            visited_urls=research_results["visited_urls"],
+            client=client,
+            model=model,
+        )
+        progress.remove_task(task)
+
+    log_event("\n[bold green]Research Complete![/bold green]")
+    log_event("\n[yellow]Final Report:[/yellow]")
+    emit(ReportEvent(report=report))
+    return report
+
+
 # @app.command()
 # @coro
 async def get_feedback(
@@ -77,11 +246,7 @@ async def get_feedback(
 ):
     # 进行澄清
     # 根据模型设置service
-    if model.startswith("ep-") or model.startswith("deepseek"):
-        service = "deepseek"
-        model = "ep-20250208165153-wn9ft"
-    else:
-        service = "openai"
+    service, model = resolve_service(model)
     set_service(service)
     set_model(model)
 
@@ -90,7 +255,7 @@ async def get_feedback(
     if enable_logging:
         from deep_research_py.common.logging import initial_logger
 
-        initial_logger(logging_path=log_path, enable_stdout=log_to_stdout, log_file_name=f"{query}_{start_time.strftime('%Y%m%d%H%M%S')}")
+        initial_logger(logging_path=log_path, enable_stdout=log_to_stdout, log_file_name=run_name(query, start_time))
         console.print(f"[dim]Logging enabled. Logs will be saved to {log_path}[/dim]")
 
     """Deep Research CLI"""
@@ -101,57 +266,42 @@ async def get_feedback(
         )
     )
 
-    console.print(f"🛠️ Using [bold green]{service.upper()}[/bold green] service.")
-    with st.chat_message('assistant').container():
-        st.markdown(f"🛠️ Using {service.upper()} service.")
-        st.markdown(f"🔍 What would you like to research?: {query}")
-        st.markdown(f"📊 Research breadth (recommended 2-10) [4]: {breadth}")
-        st.markdown(f"🔍 Research depth (recommended 1-5) [2]: {depth}")
-        st.markdown("\nCreating research plan...")
-
-
-    # Get initial inputs with clear formatting
-    # query = await async_prompt("\n🔍 What would you like to research? ")
-    console.print(f"🔍 What would you like to research?: {query}")
-    log_event(f"🔍 What would you like to research?: {query}")
+    async with ui_events(log_path if enable_logging else None, run_name(query, start_time)):
+        console.print(f"🛠️ Using [bold green]{service.upper()}[/bold green] service.")
+        emit(StatusEvent(message=f"🛠️ Using {service.upper()} service."))
 
-    # breadth_prompt = "📊 Research breadth (recommended 2-10) [4]: "
-    # breadth = int((await async_prompt(breadth_prompt)) or "4")
-    console.print(f"📊 Research breadth (recommended 2-10) [4]: {breadth}")
-    log_event(f"📊 Research breadth (recommended 2-10) [4]: {breadth}")
+        # Get initial inputs with clear formatting
+        # query = await async_prompt("\n🔍 What would you like to research? ")
+        emit(StatusEvent(message=f"🔍 What would you like to research?: {query}"))
+        log_event("🔍 What would you like to research?: %s", query)
 
-    # depth_prompt = "🔍 Research depth (recommended 1-5) [2]: "
-    # depth = int((await async_prompt(depth_prompt)) or "2")
-    console.print(f"🔍 Research depth (recommended 1-5) [2]: {depth}")
-    log_event(f"🔍 Research depth (recommended 1-5) [2]: {depth}")
+        # breadth_prompt = "📊 Research breadth (recommended 2-10) [4]: "
+        # breadth = int((await async_prompt(breadth_prompt)) or "4")
+        emit(StatusEvent(message=f"📊 Research breadth (recommended 2-10) [4]: {breadth}"))
+        log_event("📊 Research breadth (recommended 2-10) [4]: %s", breadth)
 
+        # depth_prompt = "🔍 Research depth (recommended 1-5) [2]: "
+        # depth = int((await async_prompt(depth_prompt)) or "2")
+        emit(StatusEvent(message=f"🔍 Research depth (recommended 1-5) [2]: {depth}"))
+        log_event("🔍 Research depth (recommended 1-5) [2]: %s", depth)
 
-    # First show progress for research plan
-    console.print("\n[yellow]Creating research plan...[/yellow]")
-    log_event("\n[yellow]Creating research plan...[/yellow]")
-    
-    follow_up_questions = await generate_feedback(
-        query, client, model, max_followup_questions
-    )
+        # First show progress for research plan
+        emit(StatusEvent(message="\nCreating research plan..."))
+        log_event("\n[yellow]Creating research plan...[/yellow]")
 
-    if len(follow_up_questions) != 0:
-        # Then collect answers separately from progress display
-        console.print("\n[bold yellow]Follow-up Questions:[/bold yellow]")
-        log_event("\n[bold yellow]Follow-up Questions:[/bold yellow]")
-
-        answers = []
-        for i, question in enumerate(follow_up_questions, 1):
-            console.print(f"\n[bold blue]Q{i}:[/bold blue] {question}")
-            log_event(f"\n[bold blue]Q{i}:[/bold blue] {question}")
+        follow_up_questions = await generate_feedback(
+            query, client, model, max_followup_questions
+        )
 
-            with st.chat_message('assistant').container():
-                st.markdown("\nFollow-up Questions:")
-                st.markdown(f"\n{question}")
+        if len(follow_up_questions) != 0:
+            log_event("\n[bold yellow]Follow-up Questions:[/bold yellow]")
+            for i, question in enumerate(follow_up_questions, 1):
+                log_event("\n[bold blue]Q%s:[/bold blue] %s", i, question)
+            emit(FeedbackEvent(questions=follow_up_questions))
+        else:
+            emit(StatusEvent(message="\nNo follow-up questions needed!"))
+            log_event("\n[bold green]No follow-up questions needed![/bold green]")
 
-    else:
-        console.print("\n[bold green]No follow-up questions needed![/bold green]")
-        log_event("\n[bold green]No follow-up questions needed![/bold green]")
-    
     return follow_up_questions
 
 
@@ -195,17 +345,29 @@ async def answer_main(
         default=2,
         help="Depth of research.",
     ),
+    max_nodes: int = typer.Option(
+        default=0,
+        help="Research best-first until this many nodes are done; 0 keeps the fixed tree.",
+    ),
+    max_tokens: int = typer.Option(
+        default=0,
+        help="Token budget of best-first research; 0 for no limit.",
+    ),
+    deadline: int = typer.Option(
+        default=0,
+        help="Seconds the research and report may take in total; 0 for no limit.",
+    ),
+    profile: bool = typer.Option(
+        default=False,
+        help="Write a sampling profile (flamegraph input) and a time breakdown to output/.",
+    ),
     start_time = "",
     follow_up_questions = [],
     answers = [],    
 ):  
 
     # 根据模型设置service
-    if model.startswith("ep-") or model.startswith("deepseek"):
-        service = "deepseek"
-        model = "ep-20250208165153-wn9ft"
-    else:
-        service = "openai"
+    service, model = resolve_service(model)
     set_service(service)
     set_model(model)
 
@@ -215,108 +377,228 @@ async def answer_main(
     
 
     # Combine information
-    combined_query = f"""
-    Initial Query: {query}
-    Follow-up Questions and Answers:
-    {chr(10).join(f"Q: {q} A: {a}" for q, a in zip(follow_up_questions, answers))}
-    """
+    combined_query = combine_query(query, follow_up_questions, answers)
+    set_log_context(run_id=run_name(query, start_time))
     
-    with st.chat_message('assistant'):
-        st.markdown(f"\n{combined_query}")
-
-    # Now use Progress for the research phase
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        console=console,
-    ) as progress:
-        # Do research
-        task = progress.add_task(
-            "[yellow]Researching your topic...[/yellow]", total=None
-        )
-        research_results = await deep_research(
-            query=combined_query,
-            breadth=breadth,
-            depth=depth,
-            concurrency=concurrency,
-            client=client,
-            model=model,
-        )
-        progress.remove_task(task)
-
-        # Show learnings
-        console.print("\n[yellow]Learnings:[/yellow]")
-        log_event("\n[yellow]Learnings:[/yellow]")
-        for learning in research_results["learnings"]:
-            rprint(f"• {learning}")
-            log_event(f"• {learning}")
-        
-        with st.chat_message('assistant'):
-            st.markdown("\nLearnings:")
-            for learning in research_results["learnings"]:
-                st.markdown(f"• {learning}")
-
-
-        # Generate report
-        task = progress.add_task("Writing final report...", total=None)
-        report = await write_final_report(
-            prompt=combined_query,
-            learnings=research_results["learnings"],
-            visited_urls=research_results["visited_urls"],
-            client=client,
-            model=model,
+    async with ui_events(log_path if enable_logging else None, run_name(query, start_time)):
+        emit(StatusEvent(message=f"\n{combined_query}"))
+        budget = (
+            PlannerBudget(max_nodes=max_nodes, max_tokens=max_tokens or None)
+            if max_nodes
+            else None
         )
-        progress.remove_task(task)
-
-        # Show results
-        console.print("\n[bold green]Research Complete![/bold green]")
-        console.print("\n[yellow]Final Report:[/yellow]")
-        console.print(Panel(report, title="Research Report"))
-        log_event("\n[bold green]Research Complete![/bold green]")
-        log_event("\n[yellow]Final Report:[/yellow]")
-
-        with st.chat_message('assistant'):
-            st.markdown("\nFinal Report:\n")
-            st.markdown(report)
+        # Every stage below stops in time and works with what it has
+        async with profile_run(profile) as profiler:
+            with deadline_scope(seconds=deadline or None):
+                report = await research_and_report(
+                    combined_query, breadth, depth, concurrency, client, model, budget
+                )
 
+        if get_cassette() is not None:
+            # Failed branches do not stop a run, but a strict replay that missed calls does
+            get_cassette().check()
 
-        # Show sources
-        console.print("\n[yellow]Sources:[/yellow]")
-        for url in research_results["visited_urls"]:
-            rprint(f"• {url}")
+        if counter.total_reasoning_tokens:
+            emit(StatusEvent(message=reasoning_summary(counter.by_stage())))
 
         end_time = datetime.now()
         print(f"Total time: {end_time - start_time}")
-        log_event(f"Total time: {end_time - start_time}")
+        log_event("Total time: %s", end_time - start_time)
 
         # Save report
-        with open(f"output/{query}_{start_time.strftime('%Y%m%d%H%M%S')}.md", "w") as f:
+        with open(f"output/{run_name(query, start_time)}.md", "w") as f:
             f.write(report)
 
+        if profiler is not None:
+            folded_path, summary_path = profiler.write(f"output/{run_name(query, start_time)}")
+            emit(StatusEvent(message=f"Profile saved to {summary_path} and {folded_path}"))
+            log_event("Profile:\n%s", profiler.summary())
+
         if enable_logging:
             log_event(
-                (
-                    f"\nReport has been saved to output.md"
-                    f"\nToken usage:"
-                    f"Total Input Tokens: {counter.total_input_tokens} "
-                    f"Total Output Tokens: {counter.total_output_tokens} "
-                    f"Total Reasoning Tokens: {counter.total_reasoning_tokens} "
-                    "\nToken usage details:\n"
-                    f"{counter}"
-                )
+                "\nReport has been saved to output.md"
+                "\nToken usage:"
+                "Total Input Tokens: %s "
+                "Total Output Tokens: %s "
+                "Total Reasoning Tokens: %s "
+                "\nToken usage details:\n"
+                "%s",
+                counter.total_input_tokens,
+                counter.total_output_tokens,
+                counter.total_reasoning_tokens,
+                counter,
             )
-        
-        # 读取搜索的日志信息
-        with open(f"logs/{query}_{start_time.strftime('%Y%m%d%H%M%S')}.log", "r") as f:
-            log_content = f.read()
-        with st.expander("ALL Logs:"):
-            st.markdown(log_content)
+            log_event("Token usage by stage: %s", counter.by_stage())
+            log_event("Token usage by model: %s", counter.by_model())
+            if fallback_stats():
+                log_event("Fallback calls by stage: %s", fallback_stats())
+            if get_cassette() is not None:
+                log_event("Cassette: %s", get_cassette().stats())
+            if isinstance(client, ClientPool):
+                log_event("Endpoint stats: %s", client.stats())
+            log_event("Coalesced calls: %s", coalescing_stats())
+
+        fetcher = get_page_fetcher()
+        if fetcher is not None:
+            if enable_logging:
+                log_event("Page fetches: %s", fetcher.stats())
+            await fetcher.close()
+        await close_search_sessions()
+
+        return report
+
+
+@app.command("research")
+def research_command(
+    query: str = typer.Argument(..., help="Query for research."),
+    model: str = typer.Option(default="ep-20250208165153-wn9ft", help="Which model to use?"),
+    breadth: int = typer.Option(default=2, help="Breadth of research."),
+    depth: int = typer.Option(default=2, help="Depth of research."),
+    concurrency: int = typer.Option(
+        default=2, help="Number of concurrent tasks, depending on your API rate limits."
+    ),
+    max_nodes: int = typer.Option(
+        default=0,
+        help="Research best-first until this many nodes are done; 0 keeps the fixed tree.",
+    ),
+    max_tokens: int = typer.Option(
+        default=0,
+        help="Token budget of best-first research; 0 for no limit.",
+    ),
+    deadline: int = typer.Option(
+        default=0,
+        help="Seconds the research and report may take in total; 0 for no limit.",
+    ),
+    profile: bool = typer.Option(
+        default=False,
+        help="Write a sampling profile (flamegraph input) and a time breakdown to output/.",
+    ),
+    log_path: str = typer.Option(default="logs", help="Path to save the logs."),
+):
+    """Research a query without follow-up questions and save the report to output/."""
+    from deep_research_py.common.logging import initial_logger
+
+    os.makedirs("output", exist_ok=True)
+    start_time = datetime.now()
+    # No get_feedback step here to set up the logger
+    initial_logger(logging_path=log_path, log_file_name=run_name(query, start_time))
+    console.print(f"[dim]Logging enabled. Logs will be saved to {log_path}[/dim]")
+    asyncio.run(
+        answer_main(
+            concurrency=concurrency,
+            service="",
+            model=model,
+            max_followup_questions=0,
+            enable_logging=True,
+            log_path=log_path,
+            log_to_stdout=False,
+            query=query,
+            breadth=breadth,
+            depth=depth,
+            max_nodes=max_nodes,
+            max_tokens=max_tokens,
+            deadline=deadline,
+            profile=profile,
+            start_time=start_time,
+            follow_up_questions=[],
+            answers=[],
+        )
+    )
+
+
+@app.command()
+def serve(
+    host: str = typer.Option(default="127.0.0.1", help="Host to bind."),
+    port: int = typer.Option(default=8000, help="Port to bind."),
+    model: str = typer.Option(default="gpt-4o-mini", help="Which model to use?"),
+    workers: int = typer.Option(
+        default=2, help="Number of research jobs that run at the same time."
+    ),
+    concurrency: int = typer.Option(
+        default=2, help="Number of concurrent tasks per research job."
+    ),
+    max_concurrent_completions: int = typer.Option(
+        default=8, help="Cap on in-flight LLM calls shared by all jobs."
+    ),
+):
+    """Run the research job service."""
+    import uvicorn
+    from deep_research_py.server import create_app
+
+    uvicorn.run(
+        create_app(
+            model=model,
+            workers=workers,
+            concurrency=concurrency,
+            max_concurrent_completions=max_concurrent_completions,
+        ),
+        host=host,
+        port=port,
+    )
+
+
+@app.command()
+def worker(
+    queue: str = typer.Option(
+        default=..., help="Task queue URL, e.g. sqlite:///queue.db or http://host:8000."
+    ),
+    model: str = typer.Option(default="gpt-4o-mini", help="Which model to use?"),
+    processes: int = typer.Option(default=1, help="Number of worker processes."),
+    concurrency: int = typer.Option(default=4, help="Research nodes run at the same time per process."),
+):
+    """Run distributed research workers on a task queue."""
+    workers = start_worker_processes(queue, model, processes, concurrency)
+    console.print(f"[dim]{processes} worker process(es) on {queue}[/dim]")
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+
+
+@app.command()
+def submit(
+    query: str = typer.Argument(..., help="Query for research."),
+    server: str = typer.Option(
+        default="http://localhost:8000", help="URL of the research job service."
+    ),
+    breadth: int = typer.Option(default=2, help="Breadth of research."),
+    depth: int = typer.Option(default=2, help="Depth of research."),
+    writing_method: str = typer.Option(
+        default="serial", help="How to write the report [serial|parallel|polish]."
+    ),
+):
+    """Submit a research job to a running service and follow its progress."""
+    from deep_research_py.client import ResearchServiceClient
+
+    client = ResearchServiceClient(server)
+    job = client.submit(
+        query, breadth=breadth, depth=depth, writing_method=writing_method
+    )
+    console.print(f"[dim]Submitted job {job['id']}[/dim]")
+    for event in client.events(job["id"]):
+        data = event["data"]
+        if event["kind"] == "status":
+            console.print(f"[yellow]Job {data['status']}[/yellow]")
+        elif event["kind"] == "serp_result":
+            for learning in data["learnings"]:
+                rprint(f"• {learning}")
+        elif event["kind"] == "outline":
+            console.print(Panel(data["outline"], title="Outline"))
+
+    result = client.job(job["id"])
+    if result["status"] == "done":
+        console.print(Panel(result["report"], title="Research Report"))
+    else:
+        console.print(f"[red]Research failed: {result['error']}[/red]")
+        raise typer.Exit(1)
 
 
 def run():
     """Synchronous entry point for the CLI tool."""
-    asyncio.run(app())
+    app()
 
 
 if __name__ == "__main__":
-    asyncio.run(app())
+    app()
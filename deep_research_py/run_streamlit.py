@@ -1,25 +1,111 @@
 import streamlit as st
-import subprocess
-from run import *
-import asyncio
+import os
 from datetime import datetime
+from deep_research_py.background import BackgroundJob
+from deep_research_py.run import answer_main, get_feedback, run_name
+from deep_research_py.common.logging import LogTail, log_file_path
+from deep_research_py.common.events import FeedbackEvent, StatusEvent, emit, event_from_dict, render_markdown
 
 st.set_page_config(layout="wide")
 st.title('📖 Hithink Deep Research V2')
 
+# 后台任务每次最多取出的进度事件数
+MAX_EVENTS_PER_POLL = 200
+# 日志面板保留的行数
+MAX_LOG_LINES = 300
+
+
 def clean():
+    # 停止后台任务
+    job = st.session_state.get('job')
+    if job is not None:
+        job.cancel()
+
     # 保持用户输入为空
     st.session_state['user_input'] = []
     st.session_state['input_type'] = ""
     st.session_state["follow_up_questions"] = []
     st.session_state["start_time"] = ""
-    
+    st.session_state['job'] = None
+    st.session_state['messages'] = []
+    st.session_state['log_tail'] = None
+
     # 使用rerun来刷新整个页面
     st.rerun()
 
 
+async def follow_server_job(client, **job_kwargs):
+    """Submits the research to the job service and relays its progress events."""
+    job = client.submit(**job_kwargs)
+    emit(StatusEvent(message=f"Submitted research job `{job['id']}`"))
+    for event in client.events(job['id']):
+        event = event_from_dict(event['kind'], event['data'])
+        if event is not None:
+            emit(event)
+    result = client.job(job['id'])
+    if result['status'] != 'done':
+        raise RuntimeError(result['error'])
+    return result['report']
+
+
+async def request_server_feedback(client, query, max_followup_questions):
+    follow_up_questions = client.feedback(query, max_followup_questions)
+    emit(FeedbackEvent(questions=follow_up_questions))
+    return follow_up_questions
+
+
+def start_job(input_type, coro_fn, *args, **kwargs):
+    st.session_state['job'] = BackgroundJob(coro_fn, *args, **kwargs).start()
+    st.session_state['input_type'] = input_type
+
+
+def finish_job(job):
+    """Moves the page to its next state once the background job has finished."""
+    st.session_state['job'] = None
+    if job.error is not None:
+        st.session_state['messages'].append(f"Research failed: {job.error}")
+        st.session_state['input_type'] = ""
+    elif st.session_state['input_type'] == "feedback_running":
+        st.session_state['follow_up_questions'] = job.result
+        st.session_state['input_type'] = "feedback"
+    else:
+        st.session_state['input_type'] = ""
+
+
+@st.fragment(run_every=1)
+def render_progress():
+    """Polls the background job and renders new progress without blocking the page."""
+    job = st.session_state.get('job')
+    # Check `done` before polling: once the thread has ended nothing is added to its
+    # queue, so draining it here keeps the last events (learnings, report)
+    finished = job is not None and job.done
+    if job is not None:
+        while True:
+            events = job.poll(MAX_EVENTS_PER_POLL)
+            for event in events:
+                message = render_markdown(event)
+                if message:
+                    st.session_state['messages'].append(message)
+            if not finished or len(events) < MAX_EVENTS_PER_POLL:
+                break
+
+    for message in st.session_state['messages']:
+        st.chat_message('assistant').markdown(message)
+
+    log_tail = st.session_state.get('log_tail')
+    if log_tail is not None:
+        log_tail.read_new()
+        with st.expander("ALL Logs:"):
+            st.code("\n".join(log_tail.lines))
+
+    if job is not None:
+        if finished:
+            finish_job(job)
+            st.rerun()
+        else:
+            st.caption("⏳ Researching your topic...")
+
 
-    
 def main():
     if 'user_input' not in st.session_state:
         st.session_state['user_input'] = []
@@ -29,38 +115,65 @@ def main():
         st.session_state["follow_up_questions"] = []
     if "start_time" not in st.session_state:
         st.session_state["start_time"] = ""
+    if 'job' not in st.session_state:
+        st.session_state['job'] = None
+    if 'messages' not in st.session_state:
+        st.session_state['messages'] = []
+    if 'log_tail' not in st.session_state:
+        st.session_state['log_tail'] = None
 
     model = st.sidebar.selectbox('选择模型', ['gpt-4o-mini', 'gpt-4o', 'deepseek-r1'])
     breadth = st.sidebar.slider('选择宽度', min_value=2, max_value=10, value=5)
     depth = st.sidebar.slider('选择深度', min_value=1, max_value=5, value=5)
     max_followup_questions = st.sidebar.slider('最大澄清问题数', min_value=1, max_value=5, value=5)
+    # 节点预算大于 0 时按优先级搜索, 先展开最有价值的问题
+    max_nodes = st.sidebar.number_input('最大节点数 (0 为固定树)', min_value=0, max_value=500, value=0)
+    # 超过时间限制时取消未完成的搜索和章节, 用已有结果生成报告
+    deadline = st.sidebar.number_input('时间限制 (秒, 0 为不限)', min_value=0, max_value=7200, value=0)
+    # 在 output/ 中生成火焰图数据和耗时分析
+    profile = st.sidebar.checkbox('性能分析', value=False)
     clear = st.sidebar.button("clear")
     if clear:
         clean()
 
-    user_input = st.chat_input("Enter a question:")
+    # 后台任务运行时不接受新的输入
+    running = st.session_state['job'] is not None
+    user_input = st.chat_input("Enter a question:", disabled=running)
+
+    # 配置了研究服务时只作为客户端
+    server_url = os.getenv("DEEP_RESEARCH_SERVER")
+    if server_url:
+        from deep_research_py.client import ResearchServiceClient
 
+        client = ResearchServiceClient(server_url)
 
     if user_input and st.session_state['input_type'] == "":
         # 第一次输入
         start_time = datetime.now()
-        follow_up_questions = asyncio.run(get_feedback(concurrency=5, service="", max_followup_questions=max_followup_questions, enable_logging=True, log_path="logs", log_to_stdout=False, query=user_input, model=model, depth=depth, breadth=breadth, start_time=start_time))
-
-        st.session_state['input_type'] = "feedback"
         st.session_state['user_input'].append(user_input)
-        st.session_state['follow_up_questions'] = follow_up_questions
         st.session_state['start_time'] = start_time
+        if server_url:
+            st.session_state['messages'].append(f"🔍 What would you like to research?: {user_input}")
 
+        if server_url:
+            start_job("feedback_running", request_server_feedback, client, user_input, max_followup_questions)
+        else:
+            start_job("feedback_running", get_feedback, concurrency=5, service="", max_followup_questions=max_followup_questions, enable_logging=True, log_path="logs", log_to_stdout=False, query=user_input, model=model, depth=depth, breadth=breadth, start_time=start_time)
+            st.session_state['log_tail'] = LogTail(log_file_path("logs", run_name(user_input, start_time)), max_lines=MAX_LOG_LINES)
 
     elif user_input and st.session_state['input_type'] == "feedback":
         follow_up_answers = [user_input]
         user_input_orig = st.session_state['user_input'][0]
         follow_up_questions = st.session_state['follow_up_questions']
         start_time = st.session_state['start_time']
+        st.session_state['messages'].append(user_input)
 
-        asyncio.run(answer_main(concurrency=5, service="", max_followup_questions=max_followup_questions, enable_logging=True, log_path="logs", log_to_stdout=False, query=user_input_orig, model=model, depth=depth, breadth=breadth, start_time=start_time, follow_up_questions=follow_up_questions, answers=follow_up_answers))
-        st.session_state['input_type'] = ""
-                  
+        if server_url:
+            start_job("research_running", follow_server_job, client, query=user_input_orig, breadth=breadth, depth=depth, follow_up_questions=follow_up_questions, answers=follow_up_answers)
+        else:
+            start_job("research_running", answer_main, concurrency=5, service="", max_followup_questions=max_followup_questions, enable_logging=True, log_path="logs", log_to_stdout=False, query=user_input_orig, model=model, depth=depth, breadth=breadth, max_nodes=max_nodes, max_tokens=0, deadline=deadline, profile=profile, start_time=start_time, follow_up_questions=follow_up_questions, answers=follow_up_answers)
+
+    render_progress()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,357 @@
+"""Search providers and the router that spreads queries over them.
+
+Every engine behind the search endpoint (BING, BAIDU, ...) is a `SearchProvider`.
+`SearchRouter` keeps per-engine latency and error statistics and uses them to
+pick engines. In "hedge" mode it asks the best engine first and, if that engine
+has not answered within its own latency percentile, fires the next one too; the
+first useful answer wins and the other request is cancelled. In "fanout" mode it
+asks all engines at once and merges the results, dropping duplicate URLs.
+"""
+
+import asyncio
+import collections
+import os
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from .common.deadline import record_cancellation
+from .common.logging import log_error, log_event, log_warning
+from .utils import load_env
+
+SEARCH_URL = "https://tgenerator.aicubes.cn/iwc-index-search-engine/search_engine/v1/search"
+SEARCH_HEADERS = {"X-Arsenal-Auth": "arsenal-tools"}
+
+SearchResult = Dict[str, Any]
+
+
+def search_params(query: str, limit: int, engine: str) -> Dict[str, Any]:
+    return {
+        "query": query,
+        "se": engine,
+        "limit": limit,
+        "user_id": "test",
+        "app_id": "test",
+        "trace_id": "test",
+        "with_content": True,
+    }
+
+
+def parse_search_response(response: List[Dict[str, Any]]) -> List[SearchResult]:
+    """Converts the endpoint's `data` list to serpapi-style organic results."""
+    # 替换为serapi googlesearch的格式
+    organic_results_lst = []
+    for idx, t in enumerate(response):
+        date = t.get("publish_time") or ""
+        if date:
+            date = datetime.fromtimestamp(date).strftime("%Y-%m-%d %H:%M:%S")
+        organic_results_lst.append(
+            {
+                "position": idx + 1,
+                "title": t.get("title") or "",
+                "url": t.get("url"),
+                "snippet": t.get("summary") or "",
+                "date": date,
+                "source": t.get("data_source") or "",
+                "content": t.get("content") or "",
+            }
+        )
+    return organic_results_lst
+
+
+def normalize_query(query: str) -> str:
+    """Key under which trivially different spellings of a query are the same search."""
+    return " ".join(query.casefold().split()).strip(" ?？.。!！")
+
+
+def normalize_url(url: str) -> str:
+    """Key used to detect the same page returned by different engines."""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[4:]
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.startswith("utm_")
+    )
+    path = parts.path.rstrip("/")
+    # http/https and www. variants of a page count as the same page
+    return urlunsplit(("", host, path, urlencode(query), ""))
+
+
+def merge_results(result_lists: Sequence[List[SearchResult]], limit: int) -> List[SearchResult]:
+    """Interleaves results by rank across engines and drops duplicate URLs."""
+    merged: List[SearchResult] = []
+    seen = set()
+    for rank in range(max((len(results) for results in result_lists), default=0)):
+        for results in result_lists:
+            if rank >= len(results):
+                continue
+            item = results[rank]
+            url = item.get("url")
+            if not url:
+                continue
+            key = normalize_url(url)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(item)
+    for position, item in enumerate(merged[:limit], 1):
+        item["position"] = position
+    return merged[:limit]
+
+
+class SearchProvider(ABC):
+    """A single search engine."""
+
+    name: str = "search"
+
+    @abstractmethod
+    async def search(self, query: str, limit: int) -> List[SearchResult]:
+        """Returns organic results; raises on failure so the router can count it."""
+        pass
+
+    async def close(self) -> None:
+        """Releases connections held between searches."""
+        pass
+
+
+class SearchEngineProvider(SearchProvider):
+    """One engine (`se`) of the shared search endpoint, queried with aiohttp.
+
+    Searches share one session, and so its kept-alive connections. Cancelling a
+    search closes its connection, so a request that lost a hedge doesn't keep
+    running.
+    """
+
+    def __init__(self, engine: str = "BING", url: str = SEARCH_URL, timeout: float = 15.0):
+        self.name = engine
+        self.engine = engine
+        self.url = url
+        self.timeout = timeout
+        self._session = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_session(self):
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            # Sessions belong to one event loop; every run of the CLI has its own
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout), headers=SEARCH_HEADERS
+            )
+            self._loop = loop
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and self._loop is asyncio.get_running_loop():
+            await self._session.close()
+        self._session = None
+
+    async def search(self, query: str, limit: int) -> List[SearchResult]:
+        params = {k: str(v) for k, v in search_params(query, limit, self.engine).items()}
+        session = await self._get_session()
+        async with session.post(self.url, data=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"{self.engine} search failed with status {response.status}")
+            body = await response.json(content_type=None)
+        return parse_search_response(body["data"])
+
+
+class EngineStats:
+    """Sliding window of latencies and outcomes of one engine."""
+
+    def __init__(self, window: int = 200):
+        self.latencies: Deque[float] = collections.deque(maxlen=window)
+        self.outcomes: Deque[bool] = collections.deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.cancelled = 0
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def score(self, default_latency: float) -> float:
+        """Expected cost of asking this engine; lower is better."""
+        p50 = self.percentile(0.5)
+        latency = default_latency if p50 is None else p50
+        return latency * (1 + 4 * self.error_rate)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 3),
+            "wins": self.wins,
+            "cancelled": self.cancelled,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+        }
+
+
+class SearchRouter:
+    """Routes searches over several providers using their observed latency and errors.
+
+    Args:
+        providers: Engines to use, in order of preference before any stats exist.
+        mode: "hedge" to ask engines one after another, "fanout" to ask all at once.
+        hedge_percentile: Latency percentile of the current engine after which the
+            next engine is asked as well.
+        hedge_delay: Hedge delay used while an engine has too few samples.
+        min_samples: Samples needed before an engine's percentile is trusted.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[SearchProvider],
+        mode: str = "hedge",
+        hedge_percentile: float = 0.9,
+        hedge_delay: float = 3.0,
+        min_samples: int = 5,
+    ):
+        if not providers:
+            raise ValueError("SearchRouter needs at least one provider")
+        if mode not in ("hedge", "fanout"):
+            raise ValueError(f"Unknown search mode: {mode}")
+        self.providers = list(providers)
+        self.mode = mode
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_samples = min_samples
+        self._stats: Dict[str, EngineStats] = {p.name: EngineStats() for p in self.providers}
+
+    def ranked(self) -> List[SearchProvider]:
+        """Providers ordered from most to least promising."""
+        return sorted(self.providers, key=lambda p: self._stats[p.name].score(self.hedge_delay))
+
+    def hedge_after(self, provider: SearchProvider) -> float:
+        stats = self._stats[provider.name]
+        if len(stats.latencies) < self.min_samples:
+            return self.hedge_delay
+        return stats.percentile(self.hedge_percentile)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    async def search(self, query: str, limit: int = 5, timeout: float = 15.0) -> List[SearchResult]:
+        try:
+            if self.mode == "fanout" and len(self.providers) > 1:
+                return await asyncio.wait_for(self._fanout(query, limit), timeout)
+            return await asyncio.wait_for(self._hedged(query, limit), timeout)
+        except asyncio.TimeoutError:
+            log_warning("Search timed out after %ss: %s", timeout, query)
+            record_cancellation("search", 1, 0, "timeout")
+            return []
+
+    async def _timed(self, provider: SearchProvider, query: str, limit: int) -> List[SearchResult]:
+        start = time.monotonic()
+        try:
+            results = await provider.search(query, limit)
+        except asyncio.CancelledError:
+            # The time spent so far is a lower bound of the engine's latency;
+            # leaving it out would make slow engines look fast
+            self._stats[provider.name].latencies.append(time.monotonic() - start)
+            self._stats[provider.name].cancelled += 1
+            raise
+        except Exception as e:
+            self._stats[provider.name].record(time.monotonic() - start, ok=False)
+            log_error("Search engine %s failed for %s: %s", provider.name, query, e)
+            raise
+        self._stats[provider.name].record(time.monotonic() - start, ok=True)
+        return results
+
+    async def _fanout(self, query: str, limit: int) -> List[SearchResult]:
+        providers = self.ranked()
+        outcomes = await asyncio.gather(
+            *[self._timed(p, query, limit) for p in providers], return_exceptions=True
+        )
+        result_lists = [r for r in outcomes if isinstance(r, list)]
+        if not result_lists:
+            return []
+        return merge_results(result_lists, limit)
+
+    async def _hedged(self, query: str, limit: int) -> List[SearchResult]:
+        waiting = self.ranked()
+        running: Dict[asyncio.Task, SearchProvider] = {}
+        try:
+            while waiting or running:
+                if waiting and not running:
+                    provider = waiting.pop(0)
+                    running[asyncio.ensure_future(self._timed(provider, query, limit))] = provider
+                # Fire the next engine if the newest request runs past its percentile
+                newest = list(running.values())[-1]
+                timeout = self.hedge_after(newest) if waiting else None
+                done, _ = await asyncio.wait(
+                    running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    provider = waiting.pop(0)
+                    log_event("Hedging search with %s: %s", provider.name, query)
+                    running[asyncio.ensure_future(self._timed(provider, query, limit))] = provider
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if not task.cancelled() and task.exception() is None and task.result():
+                        self._stats[provider.name].wins += 1
+                        return task.result()
+            return []
+        finally:
+            for task in running:
+                task.cancel()
+
+
+def default_providers() -> List[SearchProvider]:
+    """Engines named in `SEARCH_ENGINES` (comma separated), BING by default."""
+    engines = os.environ.get("SEARCH_ENGINES", "BING")
+    return [SearchEngineProvider(name.strip().upper()) for name in engines.split(",") if name.strip()]
+
+
+_search_router: Optional[SearchRouter] = None
+
+
+def get_search_router() -> SearchRouter:
+    """The process-wide router, built from `SEARCH_ENGINES`/`SEARCH_MODE` on first use."""
+    global _search_router
+    if _search_router is None:
+        load_env()
+        _search_router = SearchRouter(
+            default_providers(), mode=os.environ.get("SEARCH_MODE", "hedge")
+        )
+    return _search_router
+
+
+def set_search_router(router: Optional[SearchRouter]) -> None:
+    global _search_router
+    _search_router = router
+
+
+def search_stats() -> Dict[str, Dict[str, Any]]:
+    return _search_router.stats() if _search_router is not None else {}
+
+
+async def close_search_sessions() -> None:
+    """Closes the connections the router's engines keep between searches."""
+    if _search_router is not None:
+        for provider in _search_router.providers:
+            await provider.close()
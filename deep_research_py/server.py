@@ -0,0 +1,476 @@
+"""Research job service.
+
+Accepts research jobs over HTTP, queues them and runs them on a bounded pool of
+worker tasks that share one LLM client, the search client and a process-wide
+completion limiter. Job status, progress (as server-sent events) and results are
+exposed over a small ASGI app; run it with `deep-research serve` or any ASGI server.
+The app also serves the task queue of distributed research (see `distributed.py`)
+to workers on other hosts.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from .ai.pool import ClientPool
+from .ai.providers import get_ai_client, set_max_concurrent_completions
+from .common.logging import log_error, log_event, set_log_context
+from .common.singleflight import coalescing_stats
+from .common.events import (
+    CallbackSink,
+    EventBus,
+    JobStatusEvent,
+    LearningsEvent,
+    ProgressEvent,
+    ReportEvent,
+    emit,
+)
+from .deep_research import combine_query, deep_research, write_final_report
+from .distributed import SQLiteTaskQueue, TaskQueue
+from .feedback import generate_feedback
+from .fetcher import get_page_fetcher
+from .search import close_search_sessions, search_stats
+from .utils import resolve_service, set_model, set_service
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Events kept per job for late subscribers; older ones are dropped
+MAX_JOB_EVENTS = 1000
+
+
+@dataclass
+class ResearchJob:
+    query: str
+    breadth: int = 2
+    depth: int = 2
+    follow_up_questions: List[str] = field(default_factory=list)
+    answers: List[str] = field(default_factory=list)
+    writing_method: str = "serial"
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    report: Optional[str] = None
+    learnings: List[str] = field(default_factory=list)
+    visited_urls: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+    events: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=MAX_JOB_EVENTS))
+    event_count: int = 0
+    subscribers: List[asyncio.Queue] = field(default_factory=list)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def publish(self, event: ProgressEvent) -> None:
+        record = {
+            "seq": self.event_count,
+            "time": event.time,
+            "kind": event.kind,
+            "data": event.to_dict(),
+        }
+        self.events.append(record)
+        self.event_count += 1
+        for queue in self.subscribers:
+            queue.put_nowait(record)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "query": self.query,
+            "breadth": self.breadth,
+            "depth": self.depth,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = self.summary()
+        result.update(
+            {
+                "report": self.report,
+                "learnings": self.learnings,
+                "visited_urls": self.visited_urls,
+            }
+        )
+        return result
+
+
+class JobManager:
+    """Queues research jobs and runs them on a fixed number of workers.
+
+    Finished jobs are forgotten `job_ttl` seconds after they end; their reports
+    stay in `output_dir`.
+    """
+
+    def __init__(
+        self,
+        model: str = "gpt-4o-mini",
+        workers: int = 2,
+        concurrency: int = 2,
+        max_concurrent_completions: Optional[int] = 8,
+        output_dir: Optional[str] = "output",
+        job_ttl: float = 3600.0,
+    ):
+        self.service, self.model = resolve_service(model)
+        self.workers = workers
+        self.concurrency = concurrency
+        self.max_concurrent_completions = max_concurrent_completions
+        self.output_dir = output_dir
+        self.job_ttl = job_ttl
+        self.jobs: Dict[str, ResearchJob] = {}
+        self.client = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._task_queue: Optional[TaskQueue] = None
+
+    @property
+    def task_queue(self) -> TaskQueue:
+        """The distributed research queue served to workers, opened on first use."""
+        if self._task_queue is None:
+            self._task_queue = SQLiteTaskQueue(
+                os.getenv("RESEARCH_QUEUE_DB", os.path.join(".deep_research", "queue.db"))
+            )
+        return self._task_queue
+
+    async def start(self) -> None:
+        set_service(self.service)
+        set_model(self.model)
+        set_max_concurrent_completions(self.max_concurrent_completions)
+        self.client = get_ai_client()
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+        log_event("Job manager started with %s workers using %s", self.workers, self.model)
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        fetcher = get_page_fetcher()
+        if fetcher is not None:
+            await fetcher.close()
+        await close_search_sessions()
+
+    def evict_finished(self) -> int:
+        """Drops jobs that finished more than `job_ttl` seconds ago; returns how many."""
+        cutoff = time.time() - self.job_ttl
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished and job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return len(expired)
+
+    def submit(self, job: ResearchJob) -> ResearchJob:
+        self.evict_finished()
+        self.jobs[job.id] = job
+        job.publish(JobStatusEvent(status=QUEUED, position=self._queue.qsize()))
+        self._queue.put_nowait(job)
+        return job
+
+    async def feedback(self, query: str, max_feedbacks: int = 5) -> List[str]:
+        return await generate_feedback(query, self.client, self.model, max_feedbacks)
+
+    def subscribe(self, job: ResearchJob) -> asyncio.Queue:
+        """Returns a queue that receives every past and future event of `job`."""
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in job.events:
+            queue.put_nowait(event)
+        job.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, job: ResearchJob, queue: asyncio.Queue) -> None:
+        if queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+    def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "model": self.model,
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "jobs": counts,
+            "search": search_stats(),
+            "coalesced": coalescing_stats(),
+            "fetch": get_page_fetcher().stats() if get_page_fetcher() else {},
+            "endpoints": self.client.stats() if isinstance(self.client, ClientPool) else {},
+        }
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: ResearchJob) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        job.publish(JobStatusEvent(status=RUNNING))
+        set_log_context(run_id=job.id)
+        try:
+            async with EventBus([CallbackSink(job.publish)]):
+                await self._research(job)
+            job.status = DONE
+        except Exception as e:
+            log_error("Research job %s failed: %s", job.id, e)
+            job.status = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.publish(JobStatusEvent(status=job.status, error=job.error))
+
+    async def _research(self, job: ResearchJob) -> None:
+        combined_query = combine_query(job.query, job.follow_up_questions, job.answers)
+        research_results = await deep_research(
+            query=combined_query,
+            breadth=job.breadth,
+            depth=job.depth,
+            concurrency=self.concurrency,
+            client=self.client,
+            model=self.model,
+        )
+        job.learnings = research_results["learnings"]
+        job.visited_urls = research_results["visited_urls"]
+        emit(LearningsEvent(learnings=job.learnings, visited_urls=job.visited_urls))
+
+        job.report = await write_final_report(
+            prompt=combined_query,
+            learnings=job.learnings,
+            visited_urls=job.visited_urls,
+            client=self.client,
+            model=self.model,
+            writing_method=job.writing_method,
+        )
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, f"{job.id}.md"), "w") as f:
+                f.write(job.report)
+        emit(ReportEvent(report=job.report))
+
+
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class ResearchApp:
+    """Minimal ASGI app exposing a `JobManager`.
+
+    Routes:
+        POST /feedback          {"query", "max_followup_questions"} -> {"questions"}
+        POST /jobs              job parameters -> job summary (202)
+        GET  /jobs              all job summaries
+        GET  /jobs/{id}         job status and, once finished, its results
+        GET  /jobs/{id}/events  progress as server-sent events
+        GET  /jobs/{id}/report  the report as markdown
+        GET  /stats             queue and worker statistics
+
+    Distributed research queue (see `HttpTaskQueue`):
+        POST /queue/tasks                      {"run_id", "tasks"} -> {"added"}
+        POST /queue/claim                      {"worker", "lease"} -> {"task"}
+        POST /queue/tasks/{id}/heartbeat       {"lease"}
+        POST /queue/tasks/{id}/complete        {"result"}
+        POST /queue/tasks/{id}/fail            {"error"}
+        GET  /queue/runs/{run_id}              tasks of the run per state
+        GET  /queue/runs/{run_id}/results      finished nodes, `?after=<task id>`
+        POST /queue/runs/{run_id}/cancel       -> {"cancelled"}
+    """
+
+    def __init__(self, manager: JobManager):
+        self.manager = manager
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.manager.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.manager.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        method = scope["method"]
+        parts = [part for part in scope["path"].split("/") if part]
+        started = False
+        raw_send = send
+
+        # Remembers whether a response has begun, so errors never start a second one
+        async def send(message: Dict[str, Any]) -> None:
+            nonlocal started
+            started = started or message["type"] == "http.response.start"
+            await raw_send(message)
+
+        try:
+            if method == "POST" and parts == ["feedback"]:
+                body = await _read_json(receive)
+                questions = await self.manager.feedback(
+                    body["query"], int(body.get("max_followup_questions", 5))
+                )
+                await _send_json(send, 200, {"questions": questions})
+            elif method == "POST" and parts == ["jobs"]:
+                body = await _read_json(receive)
+                job = self.manager.submit(
+                    ResearchJob(
+                        query=body["query"],
+                        breadth=int(body.get("breadth", 2)),
+                        depth=int(body.get("depth", 2)),
+                        follow_up_questions=list(body.get("follow_up_questions", [])),
+                        answers=list(body.get("answers", [])),
+                        writing_method=body.get("writing_method", "serial"),
+                    )
+                )
+                await _send_json(send, 202, job.summary())
+            elif method == "GET" and parts == ["jobs"]:
+                self.manager.evict_finished()
+                await _send_json(
+                    send, 200, [job.summary() for job in self.manager.jobs.values()]
+                )
+            elif method == "GET" and parts == ["stats"]:
+                await _send_json(send, 200, self.manager.stats())
+            elif parts and parts[0] == "queue":
+                await self._queue_route(method, parts[1:], scope, receive, send)
+            elif method == "GET" and len(parts) >= 2 and parts[0] == "jobs":
+                job = self.manager.jobs.get(parts[1])
+                if job is None:
+                    await _send_json(send, 404, {"error": "job not found"})
+                elif len(parts) == 2:
+                    await _send_json(send, 200, job.to_dict())
+                elif parts[2:] == ["events"]:
+                    await self._stream_events(job, send)
+                elif parts[2:] == ["report"] and job.report is not None:
+                    await _send_body(send, 200, job.report.encode(), "text/markdown")
+                else:
+                    await _send_json(send, 404, {"error": "not found"})
+            else:
+                await _send_json(send, 404, {"error": "not found"})
+        except (KeyError, ValueError) as e:
+            if not started:
+                await _send_json(send, 400, {"error": f"bad request: {e}"})
+        except Exception as e:
+            log_error("%s %s failed: %r", method, scope["path"], e)
+            if not started:
+                await _send_json(send, 500, {"error": "internal server error"})
+
+    async def _queue_route(
+        self, method: str, parts: List[str], scope: Dict[str, Any], receive: Receive, send: Send
+    ) -> None:
+        queue = self.manager.task_queue
+        if method == "POST" and parts == ["tasks"]:
+            body = await _read_json(receive)
+            added = await queue.put(body["run_id"], list(body["tasks"]))
+            await _send_json(send, 200, {"added": added})
+        elif method == "POST" and parts == ["claim"]:
+            body = await _read_json(receive)
+            task = await queue.claim(body["worker"], float(body.get("lease", 120)))
+            await _send_json(send, 200, {"task": task.to_dict() if task else None})
+        elif method == "POST" and len(parts) == 3 and parts[0] == "tasks":
+            body = await _read_json(receive)
+            task_id, action = int(parts[1]), parts[2]
+            if action == "heartbeat":
+                await queue.heartbeat(task_id, float(body.get("lease", 120)))
+            elif action == "complete":
+                await queue.complete(task_id, body["result"])
+            elif action == "fail":
+                await queue.fail(task_id, str(body.get("error", "")))
+            else:
+                await _send_json(send, 404, {"error": "not found"})
+                return
+            await _send_json(send, 200, {})
+        elif method == "GET" and len(parts) == 2 and parts[0] == "runs":
+            await _send_json(send, 200, await queue.status(parts[1]))
+        elif method == "GET" and len(parts) == 3 and parts[0] == "runs" and parts[2] == "results":
+            query = dict(
+                pair.split("=", 1) for pair in scope.get("query_string", b"").decode().split("&") if "=" in pair
+            )
+            await _send_json(send, 200, await queue.results(parts[1], int(query.get("after", 0))))
+        elif method == "POST" and len(parts) == 3 and parts[0] == "runs" and parts[2] == "cancel":
+            await _send_json(send, 200, {"cancelled": await queue.cancel(parts[1])})
+        else:
+            await _send_json(send, 404, {"error": "not found"})
+
+    async def _stream_events(self, job: ResearchJob, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                ],
+            }
+        )
+        queue = self.manager.subscribe(job)
+        try:
+            while True:
+                event = await queue.get()
+                payload = json.dumps(event, ensure_ascii=False)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": f"id: {event['seq']}\nevent: {event['kind']}\ndata: {payload}\n\n".encode(),
+                        "more_body": True,
+                    }
+                )
+                if event["kind"] == "status" and event["data"]["status"] in (DONE, FAILED):
+                    break
+        finally:
+            self.manager.unsubscribe(job, queue)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _read_json(receive: Receive) -> Dict[str, Any]:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    return json.loads(body or b"{}")
+
+
+async def _send_body(send: Send, status: int, body: bytes, content_type: str) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", content_type.encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send: Send, status: int, data: Any) -> None:
+    await _send_body(send, status, json.dumps(data, ensure_ascii=False).encode(), "application/json")
+
+
+def create_app(**manager_kwargs: Any) -> ResearchApp:
+    """Creates the ASGI app; keyword arguments are passed to `JobManager`."""
+    return ResearchApp(JobManager(**manager_kwargs))
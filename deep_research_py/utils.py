@@ -1,8 +1,31 @@
-from rich.console import Console
+import os
+from typing import Tuple
 
-console = Console()
 service = "openai"
 model = "o3-mini"
+_env_loaded = False
+
+
+def __getattr__(name: str):
+    # The Rich console is created on first use; importing rich is not free
+    if name == "console":
+        global console
+        from rich.console import Console
+
+        console = Console()
+        return console
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_env() -> None:
+    """Loads `.env` into the environment once; called before reading API settings."""
+    global _env_loaded
+    if _env_loaded:
+        return
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    _env_loaded = True
 
 
 def get_service() -> str:
@@ -15,6 +38,20 @@ def set_service(new_service: str) -> None:
     service = new_service
 
 
+def resolve_service(model: str) -> Tuple[str, str]:
+    """Picks the service for a model name.
+
+    `ep-` endpoint ids are kept as they are; other DeepSeek names map to
+    `DEEPSEEK_MODEL`, by default our endpoint.
+    """
+    if model.startswith("ep-"):
+        return "deepseek", model
+    if model.startswith("deepseek"):
+        load_env()
+        return "deepseek", os.getenv("DEEPSEEK_MODEL", "ep-20250208165153-wn9ft")
+    return "openai", model
+
+
 def get_model() -> str:
     global model
     return model
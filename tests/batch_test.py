@@ -0,0 +1,151 @@
+import asyncio
+import json
+import os
+
+from deep_research_py.ai.batch import BatchCollector, LocalFileBatchBackend
+
+
+def completion(body):
+    return {
+        "id": "chatcmpl-test",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "echo: " + body["messages"][-1]["content"]},
+            }
+        ],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+def handler(body):
+    if body["messages"][-1]["content"] == "fail":
+        raise ValueError("bad request")
+    return completion(body)
+
+
+def ask(collector, content):
+    return collector.submit("gpt-4o-mini", [{"role": "user", "content": content}])
+
+
+def test_submit_poll_result(tmp_path):
+    backend = LocalFileBatchBackend(str(tmp_path / "backend"), handler)
+    collector = BatchCollector(
+        backend, work_dir=str(tmp_path / "work"), flush_interval=0.01, poll_interval=0.01
+    )
+
+    async def main():
+        return await asyncio.gather(ask(collector, "one"), ask(collector, "two"))
+
+    first, second = asyncio.run(main())
+    assert first.choices[0].message.content == "echo: one"
+    assert second.choices[0].message.content == "echo: two"
+    # Both requests went out in one batch
+    assert len([name for name in os.listdir(tmp_path / "backend") if name.endswith(".input.jsonl")]) == 1
+
+
+def test_batch_flushes_at_max_size(tmp_path):
+    backend = LocalFileBatchBackend(str(tmp_path), handler)
+    collector = BatchCollector(
+        backend, work_dir=str(tmp_path / "work"), max_batch_size=2, flush_interval=60, poll_interval=0.01
+    )
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(ask(collector, "a"), ask(collector, "b")), 5)
+
+    assert [r.choices[0].message.content for r in asyncio.run(main())] == ["echo: a", "echo: b"]
+
+
+def test_failed_item_fails_only_its_caller(tmp_path):
+    backend = LocalFileBatchBackend(str(tmp_path), handler)
+    collector = BatchCollector(
+        backend, work_dir=str(tmp_path / "work"), flush_interval=0.01, poll_interval=0.01
+    )
+
+    async def main():
+        return await asyncio.gather(ask(collector, "ok"), ask(collector, "fail"), return_exceptions=True)
+
+    ok, failed = asyncio.run(main())
+    assert ok.choices[0].message.content == "echo: ok"
+    assert isinstance(failed, RuntimeError)
+    assert "bad request" in str(failed)
+
+
+def test_expired_and_missing_items(tmp_path):
+    # No handler: the output file is produced "externally", as the Batch API does when
+    # the completion window ends before every request ran
+    backend = LocalFileBatchBackend(str(tmp_path))
+    collector = BatchCollector(
+        backend, work_dir=str(tmp_path / "work"), flush_interval=0.01, poll_interval=0.01
+    )
+
+    async def finish_externally():
+        while True:
+            inputs = [name for name in os.listdir(tmp_path) if name.endswith(".input.jsonl")]
+            if inputs:
+                break
+            await asyncio.sleep(0.01)
+        batch_id = inputs[0][: -len(".input.jsonl")]
+        with open(backend.input_path(batch_id), encoding="utf-8") as f:
+            requests = [json.loads(line) for line in f]
+        by_content = {r["body"]["messages"][-1]["content"]: r for r in requests}
+        lines = [
+            {
+                "custom_id": by_content["done"]["custom_id"],
+                "response": {"status_code": 200, "body": completion(by_content["done"]["body"])},
+                "error": None,
+            },
+            {
+                "custom_id": by_content["expired"]["custom_id"],
+                "response": None,
+                "error": {"code": "batch_expired", "message": "This request could not be executed before the completion window expired."},
+            },
+        ]
+        # "missing" gets no line at all
+        with open(backend.output_path(batch_id), "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line) + "\n" for line in lines))
+
+    async def main():
+        return await asyncio.gather(
+            ask(collector, "done"),
+            ask(collector, "expired"),
+            ask(collector, "missing"),
+            finish_externally(),
+            return_exceptions=True,
+        )
+
+    done, expired, missing, _ = asyncio.run(main())
+    assert done.choices[0].message.content == "echo: done"
+    assert isinstance(expired, RuntimeError) and "batch_expired" in str(expired)
+    assert isinstance(missing, RuntimeError) and "No batch result" in str(missing)
+
+
+def test_backend_error_fails_every_caller(tmp_path):
+    class BrokenBackend(LocalFileBatchBackend):
+        def poll(self, batch_id):
+            raise RuntimeError(f"Batch {batch_id} ended with status expired")
+
+    collector = BatchCollector(
+        BrokenBackend(str(tmp_path)), work_dir=str(tmp_path / "work"), flush_interval=0.01, poll_interval=0.01
+    )
+
+    async def main():
+        return await asyncio.gather(ask(collector, "a"), ask(collector, "b"), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) and "expired" in str(r) for r in results)
+
+
+def test_local_backend_poll_before_output(tmp_path):
+    backend = LocalFileBatchBackend(str(tmp_path))
+    source = tmp_path / "in.jsonl"
+    source.write_text("")
+    batch_id = backend.submit(str(source))
+    assert backend.poll(batch_id) is None
+    with open(backend.output_path(batch_id), "w"):
+        pass
+    assert backend.poll(batch_id) == backend.output_path(batch_id)
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from deep_research_py.cassette import Cassette, CassetteMiss
+
+
+def completion(content):
+    return {
+        "id": "chatcmpl-" + content,
+        "object": "chat.completion",
+        "created": 0,
+        "model": "gpt-4o-mini",
+        "choices": [
+            {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}
+        ],
+    }
+
+
+async def answer(content):
+    from openai.types.chat import ChatCompletion
+
+    return ChatCompletion.model_validate(completion(content))
+
+
+async def fail():
+    raise ValueError("rate limited")
+
+
+def record(path):
+    cassette = Cassette(str(path), mode="record")
+
+    async def main():
+        await cassette.completion("key-a", "openai", "gpt-4o-mini", "process_serp_result", lambda: answer("a"))
+        await cassette.completion("key-b", "openai", "gpt-4o-mini", "process_serp_result", lambda: answer("b"))
+        with pytest.raises(ValueError):
+            await cassette.completion("key-c", "openai", "gpt-4o-mini", "generate_section", fail)
+        await cassette.search("query", 5, lambda: asyncio.sleep(0, [{"url": "http://x/1"}]))
+
+    asyncio.run(main())
+    cassette.close()
+
+
+def not_called():
+    raise AssertionError("replays never call out")
+
+
+def test_replay_matches_recorded_calls(tmp_path):
+    path = tmp_path / "run.cassette.jsonl.gz"
+    record(path)
+    cassette = Cassette(str(path))
+
+    async def main():
+        b = await cassette.completion("key-b", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        a = await cassette.completion("key-a", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        with pytest.raises(RuntimeError, match="rate limited"):
+            await cassette.completion("key-c", "openai", "gpt-4o-mini", "generate_section", not_called)
+        results = await cassette.search("query", 5, not_called)
+        return a, b, results
+
+    a, b, results = asyncio.run(main())
+    assert (a.choices[0].message.content, b.choices[0].message.content) == ("a", "b")
+    assert results == [{"url": "http://x/1"}]
+    cassette.check()
+
+
+def test_strict_replay_raises_on_mismatch(tmp_path):
+    path = tmp_path / "run.cassette.jsonl.gz"
+    record(path)
+    cassette = Cassette(str(path))
+
+    async def main():
+        with pytest.raises(CassetteMiss):
+            await cassette.completion("key-x", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        with pytest.raises(CassetteMiss):
+            await cassette.search("other query", 5, not_called)
+
+    asyncio.run(main())
+    assert cassette.stats()["misses"] == 2
+    with pytest.raises(CassetteMiss):
+        cassette.check()
+
+
+def test_lenient_replay_uses_next_response_of_stage(tmp_path):
+    path = tmp_path / "run.cassette.jsonl.gz"
+    record(path)
+    cassette = Cassette(str(path), lenient=True)
+
+    async def main():
+        response = await cassette.completion("key-x", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        results = await cassette.search("other query", 5, not_called)
+        return response, results
+
+    response, results = asyncio.run(main())
+    assert response.choices[0].message.content == "a"
+    assert results == []
+    assert cassette.stats()["stage_matches"] == 1
+    cassette.check()
+
+
+def test_strict_replay_raises_on_calls_made_more_often_than_recorded(tmp_path):
+    path = tmp_path / "run.cassette.jsonl.gz"
+    record(path)
+    cassette = Cassette(str(path))
+
+    async def main():
+        await cassette.completion("key-a", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        with pytest.raises(CassetteMiss, match="left"):
+            await cassette.completion("key-a", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+        await cassette.search("query", 5, not_called)
+        with pytest.raises(CassetteMiss, match="left"):
+            await cassette.search("query", 5, not_called)
+
+    asyncio.run(main())
+    assert cassette.stats()["misses"] == 2
+    with pytest.raises(CassetteMiss):
+        cassette.check()
+
+
+def test_lenient_replay_repeats_the_last_recorded_answer(tmp_path):
+    path = tmp_path / "run.cassette.jsonl.gz"
+    record(path)
+    cassette = Cassette(str(path), lenient=True)
+
+    async def main():
+        responses = [
+            await cassette.completion("key-a", "openai", "gpt-4o-mini", "process_serp_result", not_called)
+            for _ in range(2)
+        ]
+        results = [await cassette.search("query", 5, not_called) for _ in range(2)]
+        return responses, results
+
+    responses, results = asyncio.run(main())
+    assert [r.choices[0].message.content for r in responses] == ["a", "a"]
+    assert results == [[{"url": "http://x/1"}]] * 2
+    assert cassette.stats()["misses"] == 2
+    cassette.check()
@@ -0,0 +1,20 @@
+from deep_research_py.deep_research import (
+    EXTRACTION_RESERVE_TOKENS,
+    MAX_PAGE_TOKENS,
+    MIN_PAGE_TOKENS,
+    page_token_budget,
+)
+
+
+def test_pages_share_the_window_up_to_a_cap():
+    assert page_token_budget(128_000, 2) == MAX_PAGE_TOKENS
+    assert page_token_budget(64_000, 5) == (64_000 - EXTRACTION_RESERVE_TOKENS) // 5
+    assert page_token_budget(64_000, 0) == MAX_PAGE_TOKENS
+
+
+def test_small_windows_keep_a_positive_page_budget():
+    # At most a quarter of the window is reserved
+    assert page_token_budget(8_000, 2) == 3_000
+    assert page_token_budget(4_000, 1) == 3_000
+    assert page_token_budget(2_000, 5) == MIN_PAGE_TOKENS
+    assert page_token_budget(0, 5) == MIN_PAGE_TOKENS
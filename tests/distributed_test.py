@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from deep_research_py import distributed
+from deep_research_py.distributed import DONE, FAILED, QUEUED, RUNNING, SQLiteTaskQueue, run_worker
+
+
+def test_claim_complete_and_results(tmp_path):
+    queue = SQLiteTaskQueue(str(tmp_path / "queue.db"))
+
+    async def main():
+        assert await queue.put("run", [{"node_id": "0", "payload": {"query": "q"}}]) == 1
+        # The same node is only queued once
+        assert await queue.put("run", [{"node_id": "0", "payload": {"query": "q"}}]) == 0
+        task = await queue.claim("worker", lease=60)
+        assert (task.node_id, task.payload, task.attempts) == ("0", {"query": "q"}, 1)
+        assert await queue.claim("other", lease=60) is None
+        await queue.complete(task.id, {"learnings": ["l"]})
+        return await queue.status("run"), await queue.results("run")
+
+    status, results = asyncio.run(main())
+    assert status == {DONE: 1}
+    assert results[0]["node_id"] == "0" and results[0]["learnings"] == ["l"]
+
+
+def test_expired_lease_is_claimed_again_until_max_attempts(tmp_path):
+    queue = SQLiteTaskQueue(str(tmp_path / "queue.db"), max_attempts=2)
+
+    async def main():
+        await queue.put("run", [{"node_id": "0", "payload": {}}])
+        first = await queue.claim("dead", lease=0.05)
+        assert await queue.claim("alive", lease=0.05) is None
+        await asyncio.sleep(0.1)
+        second = await queue.claim("alive", lease=0.05)
+        assert (second.id, second.attempts) == (first.id, 2)
+        await asyncio.sleep(0.1)
+        # The last attempt's lease expired too: the task fails for good
+        assert await queue.claim("alive", lease=0.05) is None
+        return await queue.status("run")
+
+    assert asyncio.run(main()) == {FAILED: 1}
+
+
+def test_failed_task_is_retried_until_max_attempts(tmp_path):
+    queue = SQLiteTaskQueue(str(tmp_path / "queue.db"), max_attempts=2)
+
+    async def main():
+        await queue.put("run", [{"node_id": "0", "payload": {}}])
+        await queue.fail((await queue.claim("w", lease=60)).id, "boom")
+        assert await queue.status("run") == {QUEUED: 1}
+        await queue.fail((await queue.claim("w", lease=60)).id, "boom")
+        return await queue.status("run")
+
+    assert asyncio.run(main()) == {FAILED: 1}
+
+
+def test_worker_started_before_tasks_waits_for_them(tmp_path, monkeypatch):
+    queue = SQLiteTaskQueue(str(tmp_path / "queue.db"))
+
+    async def fake_run_node(task, queue, client, model):
+        return {"learnings": [task.node_id]}
+
+    monkeypatch.setattr(distributed, "run_node", fake_run_node)
+
+    async def main():
+        worker = asyncio.create_task(run_worker(queue, None, "m", poll_interval=0.02, idle_exit=0.2))
+        # Longer than `idle_exit`, like planning the first level before anything is queued
+        await asyncio.sleep(0.5)
+        assert not worker.done()
+        await queue.put("run", [{"node_id": "0", "payload": {}}])
+        finished = await asyncio.wait_for(worker, 5)
+        return finished, await queue.status("run")
+
+    start = time.monotonic()
+    finished, status = asyncio.run(main())
+    assert finished == 1 and status == {DONE: 1}
+    assert RUNNING not in status
+    assert time.monotonic() - start < 5
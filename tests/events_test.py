@@ -0,0 +1,66 @@
+import asyncio
+
+from deep_research_py.common.events import EventBus, EventSink, ReportEvent, StatusEvent, emit
+
+
+class SlowSink(EventSink):
+    def __init__(self):
+        self.handled = []
+        self.closed = False
+
+    async def handle(self, event):
+        await asyncio.sleep(0.01)
+        self.handled.append(event)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_close_delivers_event_being_handled():
+    sink = SlowSink()
+
+    async def main():
+        async with EventBus([sink]):
+            emit(StatusEvent(message="working"))
+            emit(ReportEvent(report="# Report"))
+            # Let the sink pick up the first event, so it is mid-handle at close
+            await asyncio.sleep(0.005)
+
+    asyncio.run(main())
+    assert [event.kind for event in sink.handled] == ["message", "report"]
+    assert sink.closed
+
+
+def test_full_queue_drops_droppable_but_keeps_final_events():
+    sink = SlowSink()
+
+    async def main():
+        async with EventBus([sink], maxsize=2) as bus:
+            for i in range(10):
+                bus.emit(StatusEvent(message=str(i)))
+            for i in range(3):
+                bus.emit(ReportEvent(report=str(i)))
+        return bus
+
+    bus = asyncio.run(main())
+    reports = [event.report for event in sink.handled if event.kind == "report"]
+    assert reports == ["0", "1", "2"]
+    assert bus.coalesced + bus.dropped > 0
+
+
+def test_close_gives_up_after_timeout():
+    class StuckSink(SlowSink):
+        async def handle(self, event):
+            await asyncio.sleep(60)
+
+    sink = StuckSink()
+
+    async def main():
+        bus = EventBus([sink])
+        await bus.__aenter__()
+        bus.emit(ReportEvent(report="never"))
+        await asyncio.sleep(0)
+        await bus.aclose(timeout=0.05)
+
+    asyncio.run(asyncio.wait_for(main(), 5))
+    assert sink.closed
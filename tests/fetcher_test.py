@@ -0,0 +1,120 @@
+import asyncio
+
+from aiohttp import web
+
+from deep_research_py.fetcher import PageFetcher, fill_missing_contents
+
+ROBOTS = "User-agent: *\nDisallow: /private\n"
+
+
+def respond(**kwargs):
+    async def handler(request):
+        return web.Response(**kwargs)
+
+    return handler
+
+
+async def slow(request):
+    await asyncio.sleep(1)
+    return web.Response(text="too late")
+
+
+def make_app():
+    app = web.Application()
+    app.router.add_get("/robots.txt", respond(text=ROBOTS))
+    app.router.add_get("/page", respond(text="<h1>Title</h1><p>Body text</p>", content_type="text/html"))
+    app.router.add_get("/plain", respond(text="plain text"))
+    app.router.add_get("/private/page", respond(text="secret"))
+    app.router.add_get("/image", respond(body=b"\x89PNG", content_type="image/png"))
+    app.router.add_get("/large", respond(text="x" * 100_000))
+    app.router.add_get("/missing", respond(status=404))
+    app.router.add_get("/slow", slow)
+    return app
+
+
+def run_with_server(test, **fetcher_kwargs):
+    """Runs `test(fetcher, base_url)` against a local server on a free port."""
+
+    async def main():
+        runner = web.AppRunner(make_app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        fetcher = PageFetcher(**fetcher_kwargs)
+        try:
+            return await test(fetcher, f"http://127.0.0.1:{port}")
+        finally:
+            await fetcher.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_fetches_html_as_markdown_and_plain_text_as_is():
+    async def test(fetcher, base):
+        return await fetcher.fetch(base + "/page"), await fetcher.fetch(base + "/plain"), fetcher.stats()
+
+    page, plain, stats = run_with_server(test)
+    assert "Title" in page and "Body text" in page and "<h1>" not in page
+    assert plain == "plain text"
+    assert stats["fetched"] == 2
+
+
+def test_robots_txt_disallow():
+    async def test(fetcher, base):
+        return await fetcher.fetch(base + "/private/page"), await fetcher.fetch(base + "/plain"), fetcher.stats()
+
+    private, allowed, stats = run_with_server(test)
+    assert private is None
+    assert allowed == "plain text"
+    assert stats["robots"] == 1
+
+    async def ignore_robots(fetcher, base):
+        return await fetcher.fetch(base + "/private/page")
+
+    assert run_with_server(ignore_robots, respect_robots=False) == "secret"
+
+
+def test_non_text_content_type_is_skipped():
+    async def test(fetcher, base):
+        return await fetcher.fetch(base + "/image"), fetcher.stats()
+
+    image, stats = run_with_server(test)
+    assert image is None
+    assert stats["content_type"] == 1 and stats["fetched"] == 0
+
+
+def test_body_is_cut_at_max_bytes():
+    async def test(fetcher, base):
+        return await fetcher.fetch(base + "/large"), fetcher.stats()
+
+    page, stats = run_with_server(test, max_bytes=1000)
+    assert page == "x" * 1000
+    assert stats["truncated"] == 1
+
+
+def test_timeout():
+    async def test(fetcher, base):
+        return await fetcher.fetch(base + "/slow"), fetcher.stats()
+
+    page, stats = run_with_server(test, timeout=0.2)
+    assert page is None
+    assert stats["timeouts"] == 1
+
+
+def test_fill_missing_contents():
+    async def test(fetcher, base):
+        results = [
+            {"url": base + "/plain"},
+            {"url": base + "/page", "content": "from the search engine"},
+            {"url": base + "/missing"},
+            {"url": base + "/private/page"},
+        ]
+        return await fill_missing_contents(results, fetcher)
+
+    plain, kept, missing, private = run_with_server(test)
+    assert plain["content"] == "plain text"
+    assert kept["content"] == "from the search engine"
+    assert "content" not in missing
+    assert "content" not in private
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from deep_research_py.ai.pool import EJECTED, HEALTHY, ClientPool, Endpoint, create_client_pool
+
+
+class Client:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+async def call(client, model):
+    client.calls += 1
+    await asyncio.sleep(0)
+    if client.fail:
+        raise client.fail if isinstance(client.fail, Exception) else RuntimeError("down")
+    return model
+
+
+@pytest.mark.parametrize("weight", [0, -1])
+def test_non_positive_weight_is_rejected(weight):
+    with pytest.raises(ValueError, match="Endpoint b needs a positive weight"):
+        ClientPool([Endpoint("a", Client()), Endpoint("b", Client(), weight=weight)])
+    configs = [{"base_url": "http://b/v1", "name": "b", "weight": weight}]
+    with pytest.raises(ValueError, match="Endpoint b"):
+        create_client_pool(configs, "key", lambda api_key, base_url: Client())
+
+
+def test_calls_follow_the_weights():
+    heavy, light = Client(), Client()
+    pool = ClientPool([Endpoint("heavy", heavy, weight=3), Endpoint("light", light)])
+
+    async def main():
+        await asyncio.gather(*[pool.run(call, "m") for _ in range(40)])
+
+    asyncio.run(main())
+    assert (heavy.calls, light.calls) == (30, 10)
+
+
+def test_failed_call_is_retried_on_another_endpoint():
+    down, up = Client(fail=True), Client()
+    pool = ClientPool([Endpoint("down", down), Endpoint("up", up, model="ep-up")], model="m")
+
+    assert asyncio.run(pool.run(call, "m")) == "ep-up"
+    assert (down.calls, up.calls) == (1, 1)
+    assert pool.stats()["down"]["errors"] == 1
+
+
+def test_request_errors_are_not_retried():
+    first, second = Client(fail=BadRequest("bad request")), Client()
+    pool = ClientPool([Endpoint("first", first), Endpoint("second", second)])
+
+    with pytest.raises(BadRequest):
+        asyncio.run(pool.run(call, "m"))
+    assert second.calls == 0
+    assert pool.stats()["first"]["errors"] == 0
+
+
+def test_ejected_endpoint_is_probed_and_recovers():
+    down, up = Client(fail=True), Client()
+    pool = ClientPool(
+        [Endpoint("down", down), Endpoint("up", up)], max_consecutive_errors=2, eject_seconds=0.05
+    )
+
+    async def main():
+        for _ in range(2):
+            await pool.run(call, "m")
+        assert pool.stats()["down"]["state"] == EJECTED
+        # Ejected endpoints get no calls
+        await pool.run(call, "m")
+        assert down.calls == 2
+
+        # A failed probe ejects it again for twice as long
+        await asyncio.sleep(0.06)
+        await pool.run(call, "m")
+        assert down.calls == 3
+        assert pool.stats()["down"]["state"] == EJECTED
+        assert pool.endpoints[0].eject_seconds == pytest.approx(0.1)
+
+        # A successful probe puts it back in rotation
+        down.fail = False
+        await asyncio.sleep(0.11)
+        await pool.run(call, "m")
+        assert down.calls == 4
+
+    asyncio.run(main())
+    assert pool.stats()["down"]["state"] == HEALTHY
+    assert pool.stats()["down"]["ejections"] == 2
@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from deep_research_py import utils
+from deep_research_py.ai import providers
+from deep_research_py.ai.pool import ClientPool
+
+ENDPOINTS = [
+    {"base_url": "https://ark.example.com/api/v3", "model": "ep-aaa"},
+    {"base_url": "https://gateway.example.com/v1", "api_key": "sk-gateway"},
+]
+
+
+@pytest.fixture
+def deepseek_run(monkeypatch):
+    monkeypatch.setattr(utils, "service", "deepseek")
+    monkeypatch.setattr(utils, "_env_loaded", True)
+    monkeypatch.setattr(providers, "_service_clients", {})
+    monkeypatch.setenv("LLM_ENDPOINTS", json.dumps(ENDPOINTS))
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "sk-deepseek")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-openai")
+    monkeypatch.setenv("OPENAI_BASE_URL", "https://openai.example.com/v1")
+
+
+def test_run_service_balances_over_endpoints(deepseek_run):
+    client = providers.get_ai_client()
+    assert isinstance(client, ClientPool)
+    assert len(client.endpoints) == 2
+
+
+def test_cross_service_route_keeps_its_own_base_url(deepseek_run):
+    client = providers.get_service_client("openai")
+    assert not isinstance(client, ClientPool)
+    assert str(client.base_url).rstrip("/") == "https://openai.example.com/v1"
+    assert client.api_key == "sk-openai"
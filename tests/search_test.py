@@ -0,0 +1,43 @@
+import asyncio
+
+from aiohttp import web
+
+from deep_research_py.search import SEARCH_HEADERS, SearchEngineProvider
+
+
+def test_engine_reuses_one_session_per_event_loop():
+    requests = []
+
+    async def search(request):
+        form = await request.post()
+        requests.append((form["query"], form["se"], request.headers.get("X-Arsenal-Auth")))
+        return web.json_response({"data": [{"url": "http://x/" + form["query"], "title": "t"}]})
+
+    async def main(provider):
+        app = web.Application()
+        app.router.add_post("/search", search)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        provider.url = f"http://127.0.0.1:{runner.addresses[0][1]}/search"
+        try:
+            first = await provider.search("a", 5)
+            session = provider._session
+            second = await provider.search("b", 5)
+            assert provider._session is session
+            return first, second
+        finally:
+            await provider.close()
+            await runner.cleanup()
+
+    provider = SearchEngineProvider("BING")
+    first, second = asyncio.run(main(provider))
+    assert first[0]["url"] == "http://x/a" and second[0]["url"] == "http://x/b"
+    auth = SEARCH_HEADERS["X-Arsenal-Auth"]
+    assert requests == [("a", "BING", auth), ("b", "BING", auth)]
+    assert provider._session is None
+
+    # A new event loop, e.g. the next CLI run, gets a new session
+    asyncio.run(main(provider))
+    assert len(requests) == 4